@@ -0,0 +1,820 @@
+import curses
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import vec2
+from game import Game
+from game_object import LightSource, LightKernelCache, Enemy
+from player import Player
+from level import LevelGenerator, Tile
+from lightmap import create_light_map
+from fov import FovCache
+from enemy_ai import EnemyAI
+from placement import Placer
+from surface import MemorySurface
+from replay import Recorder, Replay
+from bots import AGENTS
+from tournament import run_tournament
+import lightmap
+
+
+def make_game(seed=0, lights=10):
+    random.seed(seed)
+    game = Game()
+    game.surface = MemorySurface(Game.SCR_W, Game.SCR_H)
+    game.save_path = None
+    game._init_color_palette()
+    game._init_renderer()
+    game.current_level = LevelGenerator.generate_labirinth(Game.SCR_W, Game.SCR_H, 0.5)
+    game.current_level.spawn_objects()
+    game.current_level.spawn_enemy(5, 3)
+    game.player.move_to(game.current_level.get_spawn_point())
+    placed = 0
+    for y in range(Game.SCR_H):
+        for x in range(Game.SCR_W):
+            if placed == lights:
+                break
+            if game.current_level.is_free(x, y) and (x * 7 + y * 3) % 11 == 0:
+                game.current_level.place_object(vec2.Vec2(x, y), LightSource(3))
+                placed += 1
+    return game
+
+
+class LegacyVec2:
+    # Vec2 до user-001: свойства с проверкой типа и новый объект на каждую операцию,
+    # с int - два. По нему и по legacy_* ниже bench_vec2_frame считает выделения "до"
+    def __init__(self, x=0, y=0):
+        self._x = 0
+        self._y = 0
+        self.x = x
+        self.y = y
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        if not isinstance(value, int):
+            raise ValueError('X should be integer')
+        self._x = value
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        if not isinstance(value, int):
+            raise ValueError('Y should be integer')
+        self._y = value
+
+    def __add__(self, other):
+        if isinstance(other, int):
+            other = LegacyVec2(other, other)
+        return LegacyVec2(self._x + other.x, self._y + other.y)
+
+    def __sub__(self, other):
+        if isinstance(other, int):
+            other = LegacyVec2(other, other)
+        return LegacyVec2(self._x - other.x, self._y - other.y)
+
+    def __floordiv__(self, other):
+        if isinstance(other, int):
+            other = LegacyVec2(other, other)
+        return LegacyVec2(self._x // other.x, self._y // other.y)
+
+    def __truediv__(self, other):
+        if isinstance(other, int):
+            other = LegacyVec2(other, other)
+        return self // other
+
+    def __hash__(self):
+        return hash((self._x, self._y))
+
+    def __eq__(self, other):
+        return hash(self) == hash(other)
+
+
+def legacy_lighting(radius, symbol_aspect):
+    # LightSource.get_lighting до user-001: ядро строится заново на каждый вызов
+    r0 = radius ** 2
+    x_from = -int(radius / symbol_aspect)
+    x_to = int((radius + 1) / symbol_aspect)
+    result = []
+    tmp = set()
+    for y in range(-radius, radius + 1):
+        for x in range(x_from, x_to):
+            xy = (x * symbol_aspect) ** 2 + y ** 2
+            value = 4 if xy < r0 * 0.4 else 3 if xy < r0 * 0.6 else 2 if xy < r0 * 0.8 else 1 if xy < r0 else 0
+            x = int(x * 0.95)
+            if (x, y) not in tmp:
+                tmp.add((x, y))
+                result.append((LegacyVec2(x, y), value))
+    return result
+
+
+def legacy_calc_light(game, sources):
+    # Game.calc_light до user-001: карта освещения экрана, точка на каждую клетку ядра
+    light_map = [[0] * Game.SCR_W for _ in range(Game.SCR_H)]
+    for source_coords in sources:
+        for offset, strength in legacy_lighting(game.player.light_radius, Game.SYMBOL_ASPECT):
+            coords = offset + source_coords
+            if 0 <= coords.x < Game.SCR_W and 0 <= coords.y < Game.SCR_H:
+                light_map[coords.y][coords.x] = min(light_map[coords.y][coords.x] + strength, 4)
+    return light_map
+
+
+def legacy_draw(game, sources):
+    # Game._draw до user-001: точка на каждую освещенную клетку экрана
+    lighting = legacy_calc_light(game, sources)
+    level = game.current_level
+    for y in range(Game.SCR_H):
+        for x in range(Game.SCR_W):
+            if lighting[y][x] > 0:
+                coords = LegacyVec2(x, y)
+                level.get_tile_id(coords.x, coords.y)
+
+
+def legacy_generate_labirinth(width, height, chance_destroy_wall):
+    # поиск в глубину LevelGenerator.generate_labirinth до user-001 на списках строк
+    wall, unvisited, visited = 1, 0, 2
+    raw_lvl = [[unvisited if x % 2 == 0 and y % 2 == 0 else wall for x in range(width - 2)]
+               for y in range(height - 2)]
+
+    def pick_neighbor(current, neighbor_type):
+        neighbors = []
+        for offset in [LegacyVec2(0, 2), LegacyVec2(0, -2), LegacyVec2(2, 0), LegacyVec2(-2, 0)]:
+            coords = current + offset
+            if 0 <= coords.y < len(raw_lvl) and 0 <= coords.x < len(raw_lvl[0]):
+                if raw_lvl[coords.y][coords.x] in (unvisited, visited):
+                    neighbors.append((coords, raw_lvl[coords.y][coords.x]))
+        neighbors = [n for n in neighbors if n[1] == neighbor_type]
+        return random.choice(neighbors)[0] if neighbors else None
+
+    spawn_y = random.randrange(0, len(raw_lvl), 2)
+    raw_lvl[spawn_y][0] = visited
+    current = LegacyVec2(0, spawn_y)
+    stack = []
+    while True:
+        neighbor = pick_neighbor(current, visited)
+        if neighbor is not None and random.randint(0, 100) / 100 < chance_destroy_wall:
+            wall_to_remove = (neighbor - current) / 2 + current
+            raw_lvl[wall_to_remove.y][wall_to_remove.x] = visited
+        neighbor = pick_neighbor(current, unvisited)
+        if neighbor is not None:
+            stack.append(current)
+            wall_to_remove = (neighbor - current) / 2 + current
+            raw_lvl[wall_to_remove.y][wall_to_remove.x] = visited
+            raw_lvl[neighbor.y][neighbor.x] = visited
+            current = neighbor
+        elif not stack:
+            break
+        else:
+            current = stack.pop()
+        if not stack:
+            break
+    return raw_lvl
+
+
+def count_vec2_allocations(func, *args):
+    # считает созданные Vec2: вызовы конструктора из vec2.py, LegacyVec2 и tuple.__new__
+    count = 0
+    vec2_file = vec2.__file__
+    legacy_init = LegacyVec2.__init__.__code__
+    tuple_new = tuple.__new__
+
+    def profiler(frame, event, arg):
+        nonlocal count
+        if event == 'call':
+            code = frame.f_code
+            if code.co_name == '__init__' and code.co_filename == vec2_file or code is legacy_init:
+                count += 1
+        elif event == 'c_call' and arg is tuple_new:
+            count += 1
+
+    sys.setprofile(profiler)
+    try:
+        func(*args)
+    finally:
+        sys.setprofile(None)
+    return count
+
+
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_vec2_frame(repeat=20):
+    # "до" - те же кадр и лабиринт со старым Vec2 и старым порядком выделений
+    game = make_game()
+    sources = [LegacyVec2(*light.get_coords()) for light in game.current_level.get_light_sources()]
+    sources.append(LegacyVec2(*game.player.get_coords()))
+    generate = LevelGenerator.generate_labirinth
+    cases = (
+        ('calc_light', lambda: legacy_calc_light(game, sources), game.calc_light),
+        ('_draw', lambda: legacy_draw(game, sources), game._draw),
+        ('generate_labirinth', lambda: legacy_generate_labirinth(Game.SCR_W, Game.SCR_H, 0.5),
+         lambda: generate(Game.SCR_W, Game.SCR_H, 0.5)),
+    )
+    print('Vec2 allocations per frame (before -> after):')
+    for name, before, after in cases:
+        random.seed(0)
+        allocations = count_vec2_allocations(before)
+        random.seed(0)
+        print(f'  {name + ":":20} {allocations} -> {count_vec2_allocations(after)}')
+    print('Time per call (before -> after):')
+    for name, before, after in cases:
+        print(f'  {name + ":":20} {timeit(before, repeat) * 1000:.2f} ms -> {timeit(after, repeat) * 1000:.2f} ms')
+
+
+def bench_maze(sizes=((100, 30), (500, 500), (2000, 2000)), chances=(0, 0.3)):
+    print('generate_labirinth:')
+    for width, height in sizes:
+        for chance in chances:
+            random.seed(0)
+            elapsed = timeit(lambda: LevelGenerator.generate_labirinth(width, height, chance), 1)
+            print(f'  {width}x{height} chance={chance}: {elapsed * 1000:.1f} ms')
+
+
+def bench_viewport(sizes=((100, 30), (1000, 1000), (10000, 10000)), repeat=20):
+    print('Frame time by level size (viewport 100x30):')
+    for width, height in sizes:
+        game = make_game()
+        game.current_level = Game.build_level(5, 'bench', width, height)
+        game.player.move_to(game.current_level.get_spawn_point())
+        game._center_camera()
+        game._draw()
+        elapsed = timeit(game._draw, repeat)
+        print(f'  {width}x{height}: {elapsed * 1000:.2f} ms')
+
+
+def bench_navigation(sizes=((100, 30), (500, 500), (1000, 1000), (3000, 3000)), repeat=10000):
+    # поле к выходу растет лениво: время до первого шага, шаг по градиенту и проверка,
+    # что шаги приводят к выходу ровно за distance ходов
+    print('Distance fields:')
+    for width, height in sizes:
+        game = make_game()
+        level = Game.build_level(5, 'bench', width, height)
+        game.current_level = level
+        start = level.get_spawn_point()
+        navigator = game.get_navigator()
+        t = time.perf_counter()
+        field = navigator.get_exit_field(avoid_enemies=False)
+        field.next_step(start)
+        build = time.perf_counter() - t
+        t = time.perf_counter()
+        navigator.get_exit_field(avoid_enemies=False)
+        cached = time.perf_counter() - t
+        step = timeit(lambda: field.next_step(start), repeat)
+        distance = field.distance(start)
+        blocks = len(field.get_progress()[0])
+        if distance < 0:
+            print(f'  {width}x{height}: no path to the exit (capped {field.capped}, {blocks} blocks), '
+                  f'{build * 1000:.1f} ms')
+            continue
+        coords = start
+        moves = 0
+        while True:
+            next_coords = field.next_step(coords)
+            if next_coords is None:
+                break
+            if (abs(next_coords.x - coords.x) + abs(next_coords.y - coords.y) != 1
+                    or level.get_tile_id(*next_coords) == Tile.id_Wall):
+                raise Exception(f"Distance field made an invalid step at {coords}")
+            coords = next_coords
+            moves += 1
+        if level.get_tile_id(*coords) != Tile.id_Exit or moves != distance:
+            raise Exception("Distance field did not lead to the exit")
+        print(f'  {width}x{height}: first step {build * 1000:.1f} ms ({blocks} blocks labeled), '
+              f'cached {cached * 1e6:.1f} us, step {step * 1e6:.2f} us, path {moves} moves')
+    # автоисследование уровня 100x30 командой E
+    game = Game(seed=0)
+    game.save_path = None
+    game.start(MemorySurface(Game.SCR_W, Game.SCR_H))
+    game.is_first_game = False
+    game.restart_game()
+    game.step(ord('e'), Game.FPS_60)
+    steps = 0
+    t = time.perf_counter()
+    while game.travel is not None:
+        game.step(-1, Game.FPS_60)
+        steps += 1
+    elapsed = time.perf_counter() - t
+    game.level_prefetcher.shutdown()
+    print(f'  auto-explore 100x30: {steps} steps, {game.navigator.field_builds} fields, '
+          f'{elapsed / steps * 1e6:.1f} us per step')
+
+
+def bench_enemy_ai(counts=(10, 100, 300, 1000), ticks=40, size=200):
+    # враги вокруг игрока в пределах ACTIVE_RADIUS, игрок бродит; время обновления
+    # ИИ за тик и за шаг игры относительно бюджета кадра
+    print(f'Enemy AI ({size}x{size} level, tick {EnemyAI.TICK}s, steps of 1/60 s):')
+    for count in counts:
+        game = make_game()
+        level = Game.build_level(5, 'bench', size, size)
+        for enemy in level.get_enemies():
+            level.remove_enemy(enemy)
+        rng = random.Random(count)
+        placer = Placer(level, 0, 0, size, size, rng)
+        coords = placer.pick()
+        radius = EnemyAI.ACTIVE_RADIUS
+        placer = Placer(level, coords.x - radius, coords.y - radius, coords.x + radius + 1, coords.y + radius + 1, rng)
+        for _ in range(count):
+            placer.place_enemy(Enemy(3))
+        game.current_level = level
+        navigator = game.get_navigator()
+        ai = EnemyAI(level, random.Random(0))
+        steps = int(ticks * EnemyAI.TICK / Game.FPS_60)
+        worst = 0.
+        attacks = 0
+        start = time.perf_counter()
+        for step in range(steps):
+            if step % 8 == 0:
+                # игрок делает шаг в случайную свободную клетку
+                options = [coords + d for d in (vec2.Vec2.UP, vec2.Vec2.DOWN, vec2.Vec2.LEFT, vec2.Vec2.RIGHT)
+                           if level.is_free(*(coords + d))]
+                if options:
+                    coords = rng.choice(options)
+            t = time.perf_counter()
+            attacker = ai.update(Game.FPS_60, coords, navigator)
+            while attacker is not None:
+                attacks += 1
+                attacker = ai.update(0., coords, navigator)
+            worst = max(worst, time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+        per_step = elapsed / steps
+        print(f'  {count:>5} enemies: {elapsed / ai.ticks * 1000:7.2f} ms per tick, '
+              f'{per_step * 1000:.3f} ms per step ({per_step / Game.FPS_60:.1%} of frame), worst step '
+              f'{worst * 1000:.2f} ms, {ai.updates // ai.ticks} updates and {ai.moves // ai.ticks} moves per tick, '
+              f'{attacks} attacks')
+
+
+def light_map_backends():
+    backends = [('python', False)]
+    if lightmap.np is not None:
+        backends.append(('numpy', True))
+    return backends
+
+
+def random_sources(rng, width, height, count, margin=10):
+    # источники в том числе за краями карты, чтобы проверить обрезку
+    return [(rng.randrange(-margin, width + margin), rng.randrange(-margin, height + margin)) for _ in range(count)]
+
+
+def bench_light_map(sizes=((100, 30), (400, 120), (1000, 300)), counts=(1, 10, 100, 500), radius=3, repeat=10):
+    kernel = LightSource.kernel_cache.get(radius, Game.SYMBOL_ASPECT)
+    print(f'Light map accumulation (radius {radius}):')
+    for name, use_numpy in light_map_backends():
+        for width, height in sizes:
+            light_map = create_light_map(width, height, use_numpy)
+            for count in counts:
+                sources = random_sources(random.Random(count), width, height, count, 0)
+
+                def frame():
+                    light_map.clear()
+                    for sx, sy in sources:
+                        light_map.add_kernel(kernel, sx, sy)
+
+                print(f'  {name} {width}x{height} lights={count}: {timeit(frame, repeat) * 1000:.2f} ms')
+
+
+def bench_light_updates(repeat=200):
+    game = make_game()
+    game.calc_light()
+    spawn = game.player.get_coords()
+    step = next(spawn + d for d in (vec2.Vec2.RIGHT, vec2.Vec2.DOWN, vec2.Vec2.LEFT, vec2.Vec2.UP)
+                if game.current_level.is_free(*(spawn + d)))
+
+    def rebuild():
+        game._light_map_key = None
+        game.calc_light()
+
+    def player_step():
+        game.player.move_to(step if game.player.get_coords() == spawn else spawn)
+        game.calc_light()
+
+    print('Light map update:')
+    print(f'  full rebuild:      {timeit(rebuild, repeat) * 1000:.3f} ms')
+    print(f'  player step:       {timeit(player_step, repeat) * 1000:.3f} ms')
+    print(f'  unchanged frame:   {timeit(game.calc_light, repeat) * 1000:.3f} ms')
+
+
+def bench_lantern_count(counts=(0, 10, 100, 1000), repeat=50):
+    # с запеченным слоем время кадра не должно расти с числом фонарей
+    print('Light map by dropped lanterns (level 300x100):')
+    for count in counts:
+        game = make_game(lights=0)
+        game.current_level = Game.build_level(1, 'bench', 300, 100)
+        game.player.move_to(game.current_level.get_spawn_point())
+        place_lanterns(game.current_level, count, count)
+        game._center_camera()
+        game.calc_light()
+
+        def rebuild():
+            game._light_map_key = None
+            game.calc_light()
+
+        print(f'  {count} lanterns: rebuild {timeit(rebuild, repeat) * 1000:.3f} ms')
+
+
+def bench_render(frames=200):
+    # случайная прогулка: сколько клеток и вызовов addstr уходит в терминал за кадр
+    game = make_game()
+    game.current_state = Game.STATE_WALK
+    rng = random.Random(0)
+    moves = (vec2.Vec2.UP, vec2.Vec2.DOWN, vec2.Vec2.LEFT, vec2.Vec2.RIGHT)
+    game._draw_frame()
+    game.renderer.present()
+    print(f'Render, first frame: {game.renderer.cells_emitted} cells in {game.renderer.calls_emitted} calls')
+    cells = 0
+    calls = 0
+    start = time.perf_counter()
+    for _ in range(frames):
+        coords = game.player.get_coords() + rng.choice(moves)
+        if game.current_level.is_free(*coords):
+            game.player.move_to(coords)
+        game._draw_frame()
+        game.renderer.present()
+        cells += game.renderer.cells_emitted
+        calls += game.renderer.calls_emitted
+    elapsed = (time.perf_counter() - start) / frames
+    print(f'Render, walking: {cells / frames:.1f} cells in {calls / frames:.1f} calls per frame, '
+          f'{elapsed * 1000:.2f} ms per frame')
+
+
+def bench_battle_render(frames=200):
+    game = make_game()
+    game.current_state = Game.STATE_WALK
+    game._draw_frame()
+    game.renderer.present()
+    game.start_battle(game.current_level.get_enemies()[0])
+    game._draw_frame()
+    game.renderer.present()
+    print(f'Battle, first frame: {game.renderer.cells_emitted} cells in {game.renderer.calls_emitted} calls')
+    start = time.perf_counter()
+    renders = game.battle.widgets.renders
+    for _ in range(frames):
+        game._draw_frame()
+        game.renderer.present()
+    elapsed = (time.perf_counter() - start) / frames
+    print(f'Battle, idle: {elapsed * 1000:.3f} ms per frame, {game.battle.widgets.renders - renders} re-renders '
+          f'in {frames} frames')
+
+
+def bench_fov(radii=(4, 7, 10), repeat=50):
+    game = make_game()
+    level = game.current_level
+    x, y = game.player.get_coords()
+    print('Shadowcasting FOV per uncached source:')
+    for radius in radii:
+        kernel = LightSource.kernel_cache.get(radius, Game.SYMBOL_ASPECT)
+        print(f'  radius {radius}: {timeit(lambda: FovCache(level).get(kernel, x, y), repeat) * 1000:.3f} ms')
+
+
+def run_headless(keys, steps, seed=0, level_size=None):
+    # полный цикл Game.run на поверхности в памяти
+    random.seed(seed)
+    game = Game(level_size=level_size)
+    game.save_path = None
+    surface = MemorySurface(Game.SCR_W, Game.SCR_H, keys)
+    game.run(surface, max_steps=steps)
+    return game, surface
+
+
+def bench_headless(steps=600):
+    # Enter в меню, затем прогулка по кругу; два одинаковых прогона обязаны дать один кадр
+    keys = [10] + [curses.KEY_RIGHT, curses.KEY_DOWN, curses.KEY_LEFT, curses.KEY_UP] * 50
+    start = time.perf_counter()
+    game, surface = run_headless(keys, steps)
+    elapsed = (time.perf_counter() - start) / steps
+    _, again = run_headless(keys, steps)
+    diff = again.compare(surface.snapshot())
+    if diff:
+        raise Exception(f"Headless runs differ in {len(diff)} cells")
+    print(f'Headless Game.run: {elapsed * 1000:.3f} ms per step, {game.frames_drawn} of {steps} steps drawn, '
+          f'{surface.frames} flushed, {surface.writes} writes')
+
+
+def bench_replay(steps=5000, path='bench_replay.bin'):
+    # запись прогулки без терминала и ее воспроизведение с проверкой контрольных сумм
+    rng = random.Random(0)
+    moves = [curses.KEY_UP, curses.KEY_DOWN, curses.KEY_LEFT, curses.KEY_RIGHT, ord('q'), -1]
+    keys = [10] + [rng.choice(moves) for _ in range(steps)]
+    game = Game(seed=0)
+    game.save_path = None
+    game.recorder = Recorder(path, keyframe_interval=1000)
+    game.run(MemorySurface(Game.SCR_W, Game.SCR_H, keys), max_steps=steps)
+    try:
+        replay = Replay(path)
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        replay.run(Game())
+        elapsed = time.perf_counter() - start
+        seek_start = time.perf_counter()
+        replay.run(Game(), start=len(replay) - 10)
+        seek = time.perf_counter() - seek_start
+    finally:
+        os.remove(path)
+    print(f'Replay: {len(replay)} steps in {elapsed * 1000:.0f} ms ({len(replay) / elapsed:.0f} steps/s), '
+          f'{size} bytes, seek to the last keyframe {seek * 1000:.0f} ms')
+
+
+def bench_tournament(runs=4, max_levels=5, workers=None):
+    # турнир в одном процессе и в workers процессах (по умолчанию - по числу ядер,
+    # но не меньше двух): результаты обязаны совпасть; пропускная способность
+    # на процесс показывает, насколько пул масштабируется на этой машине
+    agents = [agent() for agent in AGENTS.values()]
+    cpus = os.cpu_count() or 1
+    workers = max(2, cpus) if workers is None else workers
+    total = runs * len(agents)
+    results = {}
+    times = {}
+    for count in sorted({1, workers}):
+        collected = []
+        _, times[count] = run_tournament(agents, runs, max_levels=max_levels, workers=count,
+                                         on_result=collected.append)
+        results[count] = sorted(tuple((k, repr(v)) for k, v in result.items() if k != 'seconds')
+                                for result in collected)
+    if results[1] != results[workers]:
+        raise Exception("Tournament results depend on the number of workers")
+    print(f'Bot tournament: {total} runs to level {max_levels}, {cpus} CPUs:')
+    for count, elapsed in times.items():
+        throughput = total / elapsed
+        print(f'  {count} workers: {elapsed:.2f}s, {throughput:.2f} runs/s, {throughput / count:.2f} runs/s per worker, '
+              f'speedup {times[1] / elapsed:.2f}x, efficiency {times[1] / elapsed / count:.0%}')
+
+
+def bench_phases(steps=600, sizes=((100, 30), (1000, 1000))):
+    # время фаз кадра по профилировщику игры при прогулке с фонарями
+    keys = [10] + [curses.KEY_RIGHT, curses.KEY_DOWN, ord('q'), curses.KEY_LEFT, curses.KEY_UP] * 100
+    for w, h in sizes:
+        game, _ = run_headless(keys, steps, level_size=vec2.Vec2(w, h))
+        print(f'Frame phases, {w}x{h} level, ms:')
+        for line in game.profiler.report():
+            print('  ' + line)
+
+
+# Набор замеров с фиксированными seed. Каждый замер - функция prepare(), которая
+# без учета времени готовит состояние и возвращает измеряемый вызов.
+# Результаты сравниваются с BASELINE_PATH, рост больше REGRESSION_THRESHOLD - регрессия.
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+REGRESSION_THRESHOLD = 0.5
+# сколько раз подряд замер должен превысить порог, чтобы считаться регрессией
+REGRESSION_ATTEMPTS = 3
+
+
+def reference_load():
+    # эталонная нагрузка на чистом Python: замеры сравниваются с базой
+    # в долях от нее, чтобы частота процессора и соседние процессы меньше влияли на вывод
+    data = list(range(20000, 0, -1))
+    return lambda: sum(x * 2 for x in sorted(data) if x % 3)
+
+
+def measure(prepare, repeat=21, number=1):
+    # лучшее время одного вызова и лучшее время эталона в мс: эталон замеряется
+    # перед каждым вызовом, поэтому оба попадают в одни и те же состояния машины,
+    # а лучший замер меньше всего зависит от фоновой нагрузки.
+    # Сборщик мусора на время замера отключен, как в timeit
+    reference = reference_load()
+    times = []
+    calibrations = []
+    for _ in range(repeat):
+        func = prepare()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            reference()
+            calibration = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            elapsed = (time.perf_counter() - start) / number
+        finally:
+            gc.enable()
+        times.append(elapsed)
+        calibrations.append(calibration)
+    return min(times) * 1000, min(calibrations) * 1000
+
+
+def place_lanterns(level, count, seed):
+    rng = random.Random(seed)
+    placed = 0
+    while placed < count:
+        x = rng.randrange(level.get_width())
+        y = rng.randrange(level.get_height())
+        if level.is_free(x, y):
+            level.place_object(vec2.Vec2(x, y), LightSource(3))
+            placed += 1
+
+
+def suite_generate(width, height):
+    def prepare():
+        random.seed(0)
+        return lambda: LevelGenerator.generate_labirinth(width, height, 0.5)
+    return prepare
+
+
+def suite_spawn(width, height, number):
+    # каждый из number вызовов замера заселяет свой новый уровень
+    def prepare():
+        random.seed(0)
+        levels = [LevelGenerator.generate_labirinth(width, height, 0.5) for _ in range(number)]
+        rng = random.Random(0)
+
+        def run():
+            level = levels.pop()
+            level.spawn_objects(rng=rng)
+            level.spawn_enemy(10, 5, rng=rng)
+        return run
+    return prepare
+
+
+def suite_get_lighting(radius, cold):
+    source = LightSource(radius)
+
+    def run():
+        if cold:
+            LightSource.kernel_cache = LightKernelCache()
+        return source.get_lighting(Game.SYMBOL_ASPECT)
+    return lambda: run
+
+
+def suite_calc_light(lights, bake):
+    # bake - запекание слоя фонарей с нуля, иначе сборка карты из готового слоя
+    game = make_game(lights=0)
+    game.current_level = Game.build_level(1, 'bench', 300, 100)
+    game.player.move_to(game.current_level.get_spawn_point())
+    place_lanterns(game.current_level, lights, lights)
+    game._center_camera()
+    game.calc_light()
+
+    def run():
+        game._light_map_key = None
+        if bake:
+            game._light_layer_key = None
+            game.fov_cache = None
+        game.calc_light()
+    return lambda: run
+
+
+def suite_draw(width, height):
+    # полный кадр на поверхности в памяти: карта, интерфейс, сборка слоев и вывод
+    game = make_game()
+    game.current_level = Game.build_level(1, 'bench', width, height)
+    game.player.move_to(game.current_level.get_spawn_point())
+    game.current_state = Game.STATE_WALK
+
+    def prepare():
+        game._map_key = None
+        game._light_map_key = None
+        game.compositor.invalidate()
+        game.renderer.invalidate()
+
+        def run():
+            game._draw_frame()
+            game.renderer.present()
+        return run
+    return prepare
+
+
+def suite_battle_input(difficulty, number):
+    # набор всего кода врага без ошибок, каждый из number вызовов - в своем бою;
+    # возвращает prepare и число клавиш
+    game = make_game()
+    game.current_state = Game.STATE_WALK
+    enemy = Enemy(difficulty, code_seed=difficulty)
+
+    def prepare():
+        battles = []
+        for _ in range(number):
+            game.player = Player()
+            game.start_battle(enemy)
+            battles.append(game.battle)
+        keys = [10 if ch == '\n' else ord(ch) for line in battles[0].code_list for ch in line]
+
+        def run():
+            battle = battles.pop()
+            for key in keys:
+                battle.input_key(key)
+            if not battle.is_done():
+                raise Exception("Battle was not finished by typing its code")
+        run.keys = len(keys)
+        return run
+
+    return prepare, prepare().keys
+
+
+def suite_cases():
+    # (имя, prepare, вызовов за замер, операций за вызов); вызовов столько,
+    # чтобы замер длился не меньше ~1 мс, иначе он меряет шум таймера
+    cases = []
+    for width, height, number in ((100, 30, 10), (500, 500, 1)):
+        cases.append((f'generate_labirinth/{width}x{height}', suite_generate(width, height), number, 1))
+        cases.append((f'spawn/{width}x{height}', suite_spawn(width, height, number), number, 1))
+    for radius, number in ((3, 20), (10, 5)):
+        cases.append((f'get_lighting/r{radius}/cold', suite_get_lighting(radius, True), number, 1))
+        cases.append((f'get_lighting/r{radius}/cached', suite_get_lighting(radius, False), 3000, 1))
+    for lights, number in ((1, 5), (10, 1), (100, 1), (500, 1)):
+        cases.append((f'calc_light/{lights}/bake', suite_calc_light(lights, True), number, 1))
+        cases.append((f'calc_light/{lights}/rebuild', suite_calc_light(lights, False), 100, 1))
+    for width, height in ((100, 30), (1000, 1000)):
+        cases.append((f'draw/{width}x{height}', suite_draw(width, height), 1, 1))
+    for difficulty in (5, 10):
+        number = 20
+        prepare, keys = suite_battle_input(difficulty, number)
+        cases.append((f'battle_input/{difficulty}/key', prepare, number, keys))
+    return cases
+
+
+def run_suite(save=False, threshold=REGRESSION_THRESHOLD):
+    # время в мс на операцию; для battle_input - на одну клавишу
+    LightSource.kernel_cache = LightKernelCache()
+    baseline = {}
+    baseline_calibrations = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            data = json.load(f)
+        baseline = data['results']
+        baseline_calibrations = data['calibrations']
+    results = {}
+    calibrations = {}
+    regressions = []
+    print(f'Benchmark suite (regression threshold {threshold:.0%}):')
+    for name, prepare, number, ops in suite_cases():
+        change = None
+        for _ in range(REGRESSION_ATTEMPTS):
+            # эталон замеряется рядом с каждым замером: скорость машины меняется и во время прогона
+            elapsed, calibration = measure(prepare, number=number)
+            elapsed /= ops
+            if name not in baseline or baseline[name] <= 0:
+                break
+            # во сколько раз машина сейчас медленнее, чем при записи базы
+            slowdown = calibration / baseline_calibrations[name] if name in baseline_calibrations else 1
+            change = elapsed / (baseline[name] * slowdown) - 1
+            if change <= threshold:
+                break
+            # регрессия засчитывается, только если ее подтвердили все повторные
+            # замеры: фоновая нагрузка замедляет отдельные замеры, но не все подряд
+        calibrations[name] = round(calibration, 5)
+        results[name] = round(elapsed, 5)
+        line = f'  {name:<28}{elapsed:10.4f} ms'
+        if change is not None:
+            line += f'  {change:+7.1%}'
+            if change > threshold:
+                line += '  REGRESSION'
+                regressions.append(name)
+        print(line)
+    if save:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'numpy': lightmap.np is not None,
+                       'results': results, 'calibrations': calibrations}, f, indent=2)
+            f.write('\n')
+        print(f'Baseline saved to {BASELINE_PATH}')
+    return regressions
+
+
+def main():
+    # python benchmark.py [--suite [--save-baseline] [--threshold 0.5]] [--workers N]
+    if '--suite' in sys.argv:
+        threshold = REGRESSION_THRESHOLD
+        if '--threshold' in sys.argv:
+            threshold = float(sys.argv[sys.argv.index('--threshold') + 1])
+        regressions = run_suite(save='--save-baseline' in sys.argv, threshold=threshold)
+        if regressions:
+            print(f'Regressions: {", ".join(regressions)}')
+            sys.exit(1)
+        return
+    bench_vec2_frame()
+    bench_light_map()
+    bench_light_updates()
+    bench_lantern_count()
+    bench_fov()
+    bench_render()
+    bench_battle_render()
+    bench_headless()
+    bench_replay()
+    bench_phases()
+    workers = None
+    if '--workers' in sys.argv:
+        workers = int(sys.argv[sys.argv.index('--workers') + 1])
+    bench_tournament(workers=workers)
+    bench_maze()
+    bench_viewport()
+    bench_navigation()
+    bench_enemy_ai()
+    if run_suite():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
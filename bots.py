@@ -0,0 +1,132 @@
+import curses
+
+from game_object import LightSource, Chest, Heal
+
+DIRECTION_KEYS = {
+    (0, -1): curses.KEY_UP,
+    (0, 1): curses.KEY_DOWN,
+    (-1, 0): curses.KEY_LEFT,
+    (1, 0): curses.KEY_RIGHT,
+}
+# клавиша, которую бот нажимает вместо нужной при ошибке
+WRONG_KEY = ord('#')
+WRONG_KEY_ALT = ord('$')
+
+
+class Agent:
+    # Скриптовый игрок для прогонов без терминала: по состоянию игры выбирает
+    # клавишу на каждый шаг. Ходит по полю расстояний кратчайшим путем к выходу и печатает код
+    # врага со скоростью chars_per_second, ошибаясь с вероятностью error_rate.
+    # reaction - пауза перед первым символом каждой строки кода,
+    # jitter - разброс интервала между клавишами в долях от среднего.
+    name = 'agent'
+    chars_per_second = 8.
+    error_rate = 0.
+    reaction = 0.5
+    jitter = 0.
+
+    def __init__(self, chars_per_second=None, error_rate=None, reaction=None, jitter=None):
+        if chars_per_second is not None:
+            self.chars_per_second = chars_per_second
+        if error_rate is not None:
+            self.error_rate = error_rate
+        if reaction is not None:
+            self.reaction = reaction
+        if jitter is not None:
+            self.jitter = jitter
+        if self.chars_per_second <= 0:
+            raise Exception("Typing speed must be positive")
+        self.rng = None
+        self._battle = None
+        self._line = None
+        self._next_key_time = 0.
+
+    def reset(self, rng):
+        # перед каждым забегом: все случайные решения бота берутся из rng
+        self.rng = rng
+        self._battle = None
+        self._line = None
+        self._next_key_time = 0.
+
+    def next_key(self, game):
+        if game.current_state == game.STATE_WALK:
+            return self.walk(game)
+        if game.current_state == game.STATE_BATTLE:
+            return self.type_key(game)
+        return -1
+
+    def get_field(self, game):
+        # поле расстояний к следующей цели бота; врагов бот не обходит, а взламывает
+        return game.get_navigator().get_exit_field(avoid_enemies=False)
+
+    def walk(self, game):
+        coords = game.player.get_coords()
+        step = self.get_field(game).next_step(coords)
+        if step is None:
+            return -1
+        return DIRECTION_KEYS[(step[0] - coords[0], step[1] - coords[1])]
+
+    def type_key(self, game):
+        battle = game.battle
+        clock = game.clock
+        if battle is not self._battle or battle.cur_line != self._line:
+            # новый бой или новая строка: сначала бот читает строку
+            self._battle = battle
+            self._line = battle.cur_line
+            self._next_key_time = clock + self.reaction
+        if clock < self._next_key_time:
+            return -1
+        interval = 1 / self.chars_per_second
+        if self.jitter > 0:
+            interval *= max(0.1, self.rng.gauss(1, self.jitter))
+        self._next_key_time = clock + interval
+        ch = battle.code_list[battle.cur_line][battle.cur_symbol]
+        if self.error_rate > 0 and self.rng.random() < self.error_rate:
+            return WRONG_KEY if ch != chr(WRONG_KEY) else WRONG_KEY_ALT
+        return 10 if ch == '\n' else ord(ch)
+
+
+class ExplorerAgent(Agent):
+    # Собирает все достижимые предметы уровня и только потом идет к выходу;
+    # аптечки - если здоровье не полное, фонари - если есть место
+    name = 'explorer'
+
+    def get_field(self, game):
+        level = game.current_level
+        player = game.player
+        need_heal = player.get_hp() < player.max_hp
+        need_light = player.get_lights_count() < player.get_max_lights_count()
+
+        def items():
+            result = []
+            for obj in level.get_objects():
+                if (isinstance(obj, Chest) or isinstance(obj, Heal) and need_heal
+                        or isinstance(obj, LightSource) and need_light):
+                    result.append(obj.get_coords())
+            return result
+
+        field = game.get_navigator().get_field('items', (level.get_objects_version(), need_heal, need_light),
+                                               items, avoid_enemies=False)
+        if field.distance(player.get_coords()) <= 0:
+            # предметов не осталось - к выходу
+            return super().get_field(game)
+        return field
+
+
+class TypistAgent(Agent):
+    # Идет прямо к выходу и печатает код с заданной долей ошибок
+    name = 'typist'
+    error_rate = 0.05
+
+
+class SpeedAgent(Agent):
+    # Быстрый игрок с неровным темпом: короткая пауза перед строкой,
+    # интервалы между клавишами разбросаны на jitter
+    name = 'speed'
+    chars_per_second = 14.
+    reaction = 0.2
+    jitter = 0.35
+    error_rate = 0.02
+
+
+AGENTS = {agent.name: agent for agent in (ExplorerAgent, TypistAgent, SpeedAgent)}
@@ -0,0 +1,230 @@
+from collections import OrderedDict
+
+from game_object import LightSource, Enemy, Chest, Heal
+from level import Level, LevelGenerator, Tile
+from placement import Placer
+from vec2 import Vec2
+import seeds
+
+
+class ChunkedLevel(Level):
+    # Уровень, разбитый на квадратные чанки CHUNK_SIZE x CHUNK_SIZE.
+    # Тайлы чанка создаются chunk_source(cx, cy) при первом обращении и
+    # выгружаются, когда в памяти больше max_resident чанков; populate(level, cx, cy)
+    # вызывается один раз для каждого чанка и расставляет объекты.
+    # Слой занятости хранится только для чанков, где есть объекты или враги.
+    CHUNK_SIZE = 64
+
+    def __init__(self, width, height, chunk_source, spawn_point: Vec2, populate=None, max_resident=64, exits=()):
+        self._width = width
+        self._height = height
+        self._chunk_source = chunk_source
+        self._populate = populate
+        self._max_resident = max_resident
+        self._chunks = OrderedDict()
+        self._populated = set()
+        self._occupancy_chunks = {}
+        self._objects = {}
+        self._enemies = {}
+        self._enemy_buckets = {}
+        self._light_sources = {}
+        self._lights_version = 0
+        self._entities_version = 0
+        self._enemies_version = 0
+        self._objects_version = 0
+        self._light_layer = None
+        self._tiles_version = 0
+        self._placer: Placer = None
+        self._spawn_point = spawn_point
+        # клетки выхода знает источник чанков, искать их по уровню не нужно
+        self._exits = list(exits)
+
+        self.chunk_loads = 0
+
+    def get_resident_chunks(self):
+        return list(self._chunks)
+
+    def _chunk(self, cx, cy):
+        key = (cx, cy)
+        chunk = self._chunks.get(key)
+        if chunk is not None:
+            self._chunks.move_to_end(key)
+            return chunk
+        chunk = self._chunk_source(cx, cy)
+        self.chunk_loads += 1
+        self._chunks[key] = chunk
+        if len(self._chunks) > self._max_resident:
+            self._chunks.popitem(last=False)
+        if key not in self._populated:
+            self._populated.add(key)
+            if self._populate is not None:
+                self._populate(self, cx, cy)
+        return chunk
+
+    def get_tile_id(self, x, y):
+        if 0 <= x < self._width and 0 <= y < self._height:
+            size = self.CHUNK_SIZE
+            return self._chunk(x // size, y // size)[(y % size) * size + x % size]
+        else:
+            raise Exception("Attempt of getting tile id outside the map")
+
+    def get_exits(self):
+        return self._exits
+
+    def get_tiles_view(self):
+        raise Exception("Chunked level has no contiguous tile buffer")
+
+    def set_tile_id(self, x, y, tile_id):
+        # выгруженный чанк строится заново из источника, изменения бы потерялись
+        raise Exception("Chunked level tiles can not be changed")
+
+    def get_row(self, y, x_from=0, x_to=None):
+        if x_to is None:
+            x_to = self._width
+        if not 0 <= y < self._height:
+            raise Exception("Attempt of getting row outside the map")
+        x_from = max(x_from, 0)
+        x_to = min(x_to, self._width)
+        size = self.CHUNK_SIZE
+        cy, row_start = divmod(y, size)
+        row_start *= size
+        parts = []
+        x = x_from
+        while x < x_to:
+            cx, local_x = divmod(x, size)
+            end = min(size, local_x + x_to - x)
+            parts.append(self._chunk(cx, cy)[row_start + local_x:row_start + end])
+            x += end - local_x
+        return b''.join(parts)
+
+    def get_region(self, x, y, width, height):
+        return [self.get_row(row_y, x, x + width) for row_y in range(max(y, 0), min(y + height, self._height))]
+
+    def _get_occupancy_at(self, index):
+        y, x = divmod(index, self._width)
+        size = self.CHUNK_SIZE
+        chunk = self._occupancy_chunks.get((x // size, y // size))
+        if chunk is None:
+            return 0
+        return chunk[(y % size) * size + x % size]
+
+    def _set_occupancy_at(self, index, value):
+        y, x = divmod(index, self._width)
+        size = self.CHUNK_SIZE
+        key = (x // size, y // size)
+        chunk = self._occupancy_chunks.get(key)
+        if chunk is None:
+            chunk = self._occupancy_chunks[key] = bytearray(size * size)
+        chunk[(y % size) * size + x % size] = value
+
+    def get_occupancy(self, x, y):
+        return self._get_occupancy_at(y * self._width + x)
+
+    def get_occupancy_row(self, y, x_from=0, x_to=None):
+        if x_to is None:
+            x_to = self._width
+        size = self.CHUNK_SIZE
+        cy, row_start = divmod(y, size)
+        row_start *= size
+        parts = []
+        x = x_from
+        while x < x_to:
+            cx, local_x = divmod(x, size)
+            end = min(size, local_x + x_to - x)
+            chunk = self._occupancy_chunks.get((cx, cy))
+            if chunk is None:
+                parts.append(bytes(end - local_x))
+            else:
+                parts.append(chunk[row_start + local_x:row_start + end])
+            x += end - local_x
+        return b''.join(parts)
+
+    def is_free(self, x, y):
+        return self.get_tile_id(x, y) == Tile.id_Floor and self._get_occupancy_at(y * self._width + x) == 0
+
+
+class MazeChunkSource:
+    # Каждый чанк - отдельный лабиринт, построенный по зерну (seed, cx, cy).
+    # Чанк владеет своей левой и верхней стенками: в каждой пробит хотя бы
+    # один проход к соседу, поэтому весь мир связен, а любой чанк можно
+    # построить заново независимо от остальных.
+    def __init__(self, chunks_x, chunks_y, chance_destroy_wall, seed):
+        self.chunks_x = chunks_x
+        self.chunks_y = chunks_y
+        self.chance_destroy_wall = chance_destroy_wall
+        self.seed = seed
+        size = ChunkedLevel.CHUNK_SIZE
+        rng = seeds.stream(seed, 'layout')
+        self.spawn_point = Vec2(1, rng.randrange(0, chunks_y) * size + 1 + 2 * rng.randrange(size // 2))
+        self.exit_coords = Vec2(chunks_x * size - 1, rng.randrange(0, chunks_y) * size + 1 + 2 * rng.randrange(size // 2))
+        self._wall_chunk = bytes((Tile.id_Wall,)) * (size * size)
+
+    def world_size(self):
+        size = ChunkedLevel.CHUNK_SIZE
+        return self.chunks_x * size + 1, self.chunks_y * size + 1
+
+    def __call__(self, cx, cy):
+        size = ChunkedLevel.CHUNK_SIZE
+        if cx >= self.chunks_x or cy >= self.chunks_y:
+            # правая и нижняя границы мира
+            return self._wall_chunk
+        rng = seeds.stream(self.seed, cx, cy)
+        carved = LevelGenerator.carve_maze(size + 1, size + 1, Vec2(1, 1), self.chance_destroy_wall, rng)
+        LevelGenerator.destroy_random_walls(carved, size + 1, size + 1, self.chance_destroy_wall, rng)
+        tiles = bytearray(size * size)
+        for y in range(size):
+            tiles[y * size:(y + 1) * size] = carved[y * (size + 1):y * (size + 1) + size]
+
+        destroy_p = LevelGenerator._chance_to_probability(self.chance_destroy_wall)
+        if cx > 0:
+            tiles[(1 + 2 * rng.randrange(size // 2)) * size] = Tile.id_Floor
+            for y in range(1, size, 2):
+                if rng.random() < destroy_p:
+                    tiles[y * size] = Tile.id_Floor
+        if cy > 0:
+            tiles[1 + 2 * rng.randrange(size // 2)] = Tile.id_Floor
+            for x in range(1, size, 2):
+                if rng.random() < destroy_p:
+                    tiles[x] = Tile.id_Floor
+
+        for coords, tile_id in ((self.spawn_point, Tile.id_Floor), (self.exit_coords, Tile.id_Exit)):
+            if coords.x // size == cx and coords.y // size == cy:
+                tiles[(coords.y % size) * size + coords.x % size] = tile_id
+        return tiles
+
+
+class ChunkPopulator:
+    # Объекты и враги расставляются в каждом чанке по тем же правилам,
+    # что и на обычном уровне, со своим зерном для каждого чанка
+    def __init__(self, seed, enemy_amount, enemy_difficulty, spawn_point: Vec2, spawn_distance=10):
+        self.seed = seed
+        self.enemy_amount = enemy_amount
+        self.enemy_difficulty = enemy_difficulty
+        self.spawn_point = spawn_point
+        self.spawn_distance = spawn_distance
+
+    def __call__(self, level: ChunkedLevel, cx, cy):
+        size = level.CHUNK_SIZE
+        x_from = cx * size
+        y_from = cy * size
+        if x_from >= level.get_width() - 1 or y_from >= level.get_height() - 1:
+            return
+        rng = seeds.stream(self.seed, 'population', cx, cy)
+        loot_rng = seeds.stream(self.seed, 'population', cx, cy, seeds.LOOT)
+        code_rng = seeds.stream(self.seed, 'population', cx, cy, seeds.ENEMY_CODE)
+        placer = Placer(level, x_from, y_from, x_from + size, y_from + size, rng)
+        placer.exclude_radius(self.spawn_point, self.spawn_distance)
+        for obj in [Chest(Chest.roll_upgrade(loot_rng)), LightSource(3), Heal(), Heal()]:
+            placer.place_object(obj)
+        for i in range(self.enemy_amount):
+            placer.place_enemy(Enemy(self.enemy_difficulty + rng.randint(-1, 1), code_rng.getrandbits(64)))
+
+
+def generate_chunked_labirinth(width, height, chance_destroy_wall, seed, enemy_amount=0, enemy_difficulty=0,
+                               max_resident=64):
+    size = ChunkedLevel.CHUNK_SIZE
+    source = MazeChunkSource(max(1, (width - 1) // size), max(1, (height - 1) // size), chance_destroy_wall, seed)
+    populate = ChunkPopulator(seed, enemy_amount, enemy_difficulty, source.spawn_point)
+    world_width, world_height = source.world_size()
+    return ChunkedLevel(world_width, world_height, source, source.spawn_point, populate, max_resident,
+                        (source.exit_coords,))
@@ -0,0 +1,116 @@
+class Layer:
+    # Слой кадра: символ и цвет на каждую клетку, None - прозрачная клетка.
+    # Содержимое слоя сохраняется между кадрами, изменившиеся строки
+    # отмечаются при записи и сверяются с прошлым кадром при сборке.
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.visible = True
+        self._glyphs = [[None] * width for _ in range(height)]
+        self._colors = [[0] * width for _ in range(height)]
+        # строки, в которых есть непрозрачные клетки
+        self._used = [False] * height
+        self._dirty = set()
+        # то, что попало в последнюю сборку кадра
+        self._shown_glyphs = [None] * height
+        self._shown_colors = [None] * height
+
+    def set_visible(self, visible):
+        if visible != self.visible:
+            self.visible = visible
+            self._dirty.update(y for y in range(self.height) if self._used[y])
+
+    def clear(self):
+        for y in range(self.height):
+            if self._used[y]:
+                self._glyphs[y] = [None] * self.width
+                self._used[y] = False
+                self._dirty.add(y)
+
+    def fill(self, glyph=' ', color=0):
+        for y in range(self.height):
+            self.set_row(y, [glyph] * self.width, [color] * self.width)
+
+    def put(self, x, y, string, color):
+        if not 0 <= y < self.height:
+            return
+        if x < 0:
+            string = string[-x:]
+            x = 0
+        string = string[:self.width - x]
+        if not string:
+            return
+        self._glyphs[y][x:x + len(string)] = string
+        self._colors[y][x:x + len(string)] = [color] * len(string)
+        self._used[y] = True
+        self._dirty.add(y)
+
+    def set_row(self, y, glyphs, colors):
+        self._glyphs[y] = glyphs
+        self._colors[y] = colors
+        self._used[y] = True
+        self._dirty.add(y)
+
+    def is_empty(self):
+        return not any(self._used)
+
+    def take_dirty_rows(self):
+        # строки, которые выглядят иначе, чем в прошлой сборке
+        changed = []
+        for y in self._dirty:
+            if self.visible and self._used[y]:
+                glyphs = self._glyphs[y]
+                colors = self._colors[y]
+            else:
+                glyphs = colors = None
+            if glyphs != self._shown_glyphs[y] or colors != self._shown_colors[y]:
+                self._shown_glyphs[y] = glyphs if glyphs is None else glyphs[:]
+                self._shown_colors[y] = colors if colors is None else colors[:]
+                changed.append(y)
+        self._dirty = set()
+        return changed
+
+    def overlay_row(self, y, glyphs, colors):
+        if not (self.visible and self._used[y]):
+            return
+        layer_colors = self._colors[y]
+        for x, glyph in enumerate(self._glyphs[y]):
+            if glyph is not None:
+                glyphs[x] = glyph
+                colors[x] = layer_colors[x]
+
+
+class Compositor:
+    # Собирает кадр из слоев снизу вверх и передает в renderer
+    # только строки, изменившиеся хотя бы в одном слое
+    def __init__(self, renderer, width, height):
+        self.renderer = renderer
+        self.width = width
+        self.height = height
+        self.layers = []
+        self._invalid = True
+
+        self.rows_composed = 0
+
+    def add_layer(self):
+        layer = Layer(self.width, self.height)
+        self.layers.append(layer)
+        return layer
+
+    def invalidate(self):
+        self._invalid = True
+
+    def compose(self):
+        changed = set()
+        for layer in self.layers:
+            changed.update(layer.take_dirty_rows())
+        if self._invalid:
+            self._invalid = False
+            changed = range(self.height)
+        for y in changed:
+            glyphs = [' '] * self.width
+            colors = [0] * self.width
+            for layer in self.layers:
+                layer.overlay_row(y, glyphs, colors)
+            self.renderer.put_row(y, glyphs, colors)
+        self.rows_composed = len(changed)
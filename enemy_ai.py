@@ -0,0 +1,116 @@
+from level import Tile
+from vec2 import Vec2
+
+DIRECTIONS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+
+class EnemyAI:
+    # Движение врагов одного уровня по фиксированным тикам длиной TICK.
+    # За тик каждый враг рядом с игроком делает не больше одного шага, а сами
+    # обновления размазаны по тику: к моменту t от начала тика обновлена доля
+    # t / TICK врагов, поэтому кадр получает лишь свою часть работы.
+    # Враги дальше ACTIVE_RADIUS от игрока спят, их не перебирают: список
+    # активных берется из пространственного хеша уровня.
+    # Преследующие идут по общему полю расстояний до игрока, шаг - O(1).
+    TICK = 0.25
+    ACTIVE_RADIUS = 48
+    # враг замечает игрока на расстоянии пути CHASE_RADIUS и теряет на LOSE_RADIUS
+    CHASE_RADIUS = 8
+    LOSE_RADIUS = 12
+    # вероятность свернуть при патрулировании, даже если можно идти прямо
+    TURN_CHANCE = 0.2
+    # после долгой паузы догоняется не больше тиков, остальные пропускаются
+    MAX_CATCH_UP = 4
+
+    def __init__(self, level, rng):
+        self.level = level
+        self.rng = rng
+        self._time = 0.
+        # враги текущего тика и число уже обновленных
+        self._batch = []
+        self._cursor = 0
+        # позиция игрока, от которой построено поле преследования этого тика
+        self._target = None
+        self.ticks = 0
+        self.updates = 0
+        self.moves = 0
+
+    def update(self, delta_time, player_coords: Vec2, navigator):
+        # navigator - поля расстояний этого уровня; возвращает врага,
+        # дошедшего до игрока, или None
+        self._time += delta_time
+        ticks = 0
+        while True:
+            count = len(self._batch)
+            due = count if self._time >= self.TICK else int(count * self._time / self.TICK)
+            if due > self._cursor:
+                attacker = self._update_enemies(due, player_coords, navigator)
+                if attacker is not None:
+                    return attacker
+            if self._time < self.TICK:
+                return None
+            self._time -= self.TICK
+            ticks += 1
+            if ticks > self.MAX_CATCH_UP:
+                self._time = 0.
+            self._start_tick(player_coords)
+
+    def next_update_timeout(self):
+        # секунды до обновления следующего врага или начала тика
+        count = len(self._batch)
+        if self._cursor < count:
+            return (self._cursor + 1) * self.TICK / count - self._time
+        return self.TICK - self._time
+
+    def _start_tick(self, player_coords):
+        px, py = player_coords
+        self._batch = self.level.get_enemies_near(px, py, self.ACTIVE_RADIUS)
+        self._cursor = 0
+        self._target = player_coords
+        self.ticks += 1
+
+    def _update_enemies(self, stop, player_coords, navigator):
+        level = self.level
+        field = navigator.get_chase_field(self._target, self.LOSE_RADIUS)
+        px, py = player_coords
+        batch = self._batch
+        while self._cursor < stop:
+            enemy = batch[self._cursor]
+            self._cursor += 1
+            coords = enemy.get_coords()
+            if level.get_enemy(coords) is not enemy:
+                # враг побежден в этом тике
+                continue
+            self.updates += 1
+            x, y = coords
+            distance = field.distance(coords)
+            # поле ограничено LOSE_RADIUS, дальше расстояние -1
+            enemy.chasing = distance > 0 and (enemy.chasing or distance <= self.CHASE_RADIUS)
+            if enemy.chasing:
+                if abs(x - px) + abs(y - py) == 1:
+                    return enemy
+                step = field.next_step(coords)
+            else:
+                step = self._patrol_step(enemy, x, y, player_coords)
+            if step is not None and self._can_enter(step[0], step[1], player_coords):
+                level.move_enemy(enemy, step)
+                self.moves += 1
+        return None
+
+    def _can_enter(self, x, y, player_coords):
+        level = self.level
+        return (level.in_bounds(x, y) and level.get_tile_id(x, y) == Tile.id_Floor
+                and level.get_enemy_at(Vec2.pack_xy(x, y, level.get_width())) is None and (x, y) != player_coords)
+
+    def _patrol_step(self, enemy, x, y, player_coords):
+        # идет прямо, пока может, и изредка сворачивает; назад - только из тупика
+        dx, dy = enemy.direction
+        if (dx or dy) and self.rng.random() >= self.TURN_CHANCE and self._can_enter(x + dx, y + dy, player_coords):
+            return Vec2(x + dx, y + dy)
+        options = [d for d in DIRECTIONS if self._can_enter(x + d[0], y + d[1], player_coords)]
+        if len(options) > 1 and (-dx, -dy) in options:
+            options.remove((-dx, -dy))
+        if not options:
+            return None
+        enemy.direction = self.rng.choice(options)
+        return Vec2(x + enemy.direction[0], y + enemy.direction[1])
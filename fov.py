@@ -0,0 +1,103 @@
+from collections import OrderedDict
+
+from level import Tile
+
+# (xx, xy, yx, yy) для восьми октантов
+OCTANTS = (
+    (1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+    (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1),
+)
+
+
+def compute_fov(level, x, y, reach_x, reach_y):
+    # Рекурсивный shadowcasting в прямоугольнике reach_x x reach_y вокруг (x, y).
+    # Возвращает множество видимых смещений (dx, dy); стены видимы, но закрывают
+    # то, что за ними. Растяжение осей на SYMBOL_ASPECT переводит прямые в прямые,
+    # поэтому видимость клетки от него не зависит, а вытянутость освещения по x
+    # учитывается через reach_x.
+    x_from = x - reach_x
+    y_from = y - reach_y
+    width = 2 * reach_x + 1
+    height = 2 * reach_y + 1
+    wall = Tile.id_Wall
+    # снимок тайлов области, клетки за краем карты - стены
+    outside = bytes((wall,)) * width
+    rows = [outside] * min(max(0, -y_from), height)
+    pad_left = bytes((wall,)) * max(0, -x_from)
+    for row in level.get_region(x_from, y_from, width, height):
+        row = pad_left + bytes(row)
+        rows.append(row + bytes((wall,)) * (width - len(row)))
+    rows += [outside] * (height - len(rows))
+
+    visible = {(0, 0)}
+
+    def cast(depth_limit, depth, start, end, xx, xy, yx, yy):
+        if start < end:
+            return
+        new_start = start
+        for j in range(depth, depth_limit + 1):
+            blocked = False
+            dy = -j
+            for dx in range(-j, 1):
+                right_slope = (dx + 0.5) / (dy - 0.5)
+                left_slope = (dx - 0.5) / (dy + 0.5)
+                if start < right_slope:
+                    continue
+                if end > left_slope:
+                    break
+                ox = dx * xx + dy * xy
+                oy = dx * yx + dy * yy
+                if -reach_x <= ox <= reach_x and -reach_y <= oy <= reach_y:
+                    visible.add((ox, oy))
+                    opaque = rows[oy + reach_y][ox + reach_x] == wall
+                else:
+                    opaque = True
+                if blocked:
+                    if opaque:
+                        new_start = right_slope
+                    else:
+                        blocked = False
+                        start = new_start
+                elif opaque and j < depth_limit:
+                    blocked = True
+                    cast(depth_limit, j + 1, start, left_slope, xx, xy, yx, yy)
+                    new_start = right_slope
+            if blocked:
+                break
+
+    for xx, xy, yx, yy in OCTANTS:
+        # глубина октанта идет вдоль x, если xy != 0, иначе вдоль y
+        cast(reach_x if xy else reach_y, 1, 1.0, 0.0, xx, xy, yx, yy)
+    return visible
+
+
+class FovCache:
+    # Ядра освещения, обрезанные по видимости, для одного уровня.
+    # Ключ - позиция источника и параметры ядра; кэш сбрасывается,
+    # только когда меняются тайлы уровня.
+    def __init__(self, level, max_size=4096):
+        self.level = level
+        self.max_size = max_size
+        self._tiles_version = level.get_tiles_version()
+        self._kernels = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kernel, x, y):
+        if self.level.get_tiles_version() != self._tiles_version:
+            self._tiles_version = self.level.get_tiles_version()
+            self._kernels.clear()
+        key = (x, y, kernel.radius, kernel.symbol_aspect)
+        visible_kernel = self._kernels.get(key)
+        if visible_kernel is not None:
+            self.hits += 1
+            self._kernels.move_to_end(key)
+            return visible_kernel
+        self.misses += 1
+        reach_x = max((abs(dx) for dx, _, _ in kernel.offsets), default=0)
+        reach_y = max((abs(dy) for _, dy, _ in kernel.offsets), default=0)
+        visible_kernel = kernel.masked(compute_fov(self.level, x, y, reach_x, reach_y))
+        self._kernels[key] = visible_kernel
+        if len(self._kernels) > self.max_size:
+            self._kernels.popitem(last=False)
+        return visible_kernel
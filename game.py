@@ -1,5 +1,8 @@
 import os
+import pickle
+import random
 import time
+import zlib
 
 import curses
 
@@ -9,12 +12,33 @@ from player import Player
 from game_object import LightSource, Enemy, Chest, Heal
 from vec2 import Vec2
 from ui_utils import Message, LOGO_1, LOGO_2
+from prefetch import LevelPrefetcher
+from level_format import LevelPack
+from chunks import generate_chunked_labirinth
+from lightmap import create_light_map, StaticLightLayer
+from fov import FovCache
+from navigation import Navigator
+from enemy_ai import EnemyAI
+from renderer import Renderer
+from compositor import Compositor, Layer
+from widgets import Widget, Label, Frame, WidgetGroup
+from surface import Surface, CursesSurface
+from profiler import Profiler
+import seeds
 
 
 class Game:
     FPS_60 = 1/60
+    # события по времени, до которых осталось меньше, считаются наступившими
+    EVENT_TOLERANCE = 0.001
+    # период обновления оверлея профилировщика, с
+    PROFILER_REFRESH = 0.5
     SCR_W = 100
     SCR_H = 30
+    LEVEL_W = 100
+    LEVEL_H = 30
+    # уровни большей площади строятся по чанкам
+    CHUNKED_LEVEL_AREA = 1000 * 1000
     SYMBOL_ASPECT = 9 / 19
     LIGHT = '░▒▓█'
 
@@ -23,15 +47,53 @@ class Game:
     STATE_LOSE = 3
     STATE_MENU = 4
 
-    def __init__(self, debug=False):
-        os.system(f'mode {self.SCR_W},{self.SCR_H+1}')
+    # команды перемещения: X - к выходу, E - к ближайшей неисследованной клетке,
+    # L - к ближайшему фонарю
+    TRAVEL_EXIT = 1
+    TRAVEL_UNEXPLORED = 2
+    TRAVEL_LANTERN = 3
+    TRAVEL_KEYS = {88: TRAVEL_EXIT, 120: TRAVEL_EXIT, 69: TRAVEL_UNEXPLORED, 101: TRAVEL_UNEXPLORED,
+                   76: TRAVEL_LANTERN, 108: TRAVEL_LANTERN}
+    # команда перемещения останавливается, когда враг ближе, клеток
+    TRAVEL_ALERT_RADIUS = 3
+    # сколько клеток поля перемещения достраивается за шаг игры, чтобы дальняя цель не останавливала кадр
+    TRAVEL_FIELD_BUDGET = 4096
+
+    def __init__(self, debug=False, seed=None, level_pack: LevelPack = None, level_size: Vec2 = None):
+        if os.name == 'nt':
+            os.system(f'mode {self.SCR_W},{self.SCR_H+1}')
 
         self.debug = debug
         self.debug_ui = False
         self.debug_no_fog = False
-
-        self.scr: curses.window = None
+        # время фаз кадра; оверлей - F5, сохранение в profile_path - F6 и при выходе
+        self.profiler = Profiler(budget=self.FPS_60)
+        self.show_profiler = False
+        self.profile_path = None
+        # запись ввода для воспроизведения, см. replay.py
+        self.recorder = None
+        self._profiler_lines = ()
+        self._profiler_time = 0.
+
+        self.surface: Surface = None
+        # None - рекорд не сохраняется
+        self.save_path = 'save.txt'
+        self.renderer: Renderer = None
+        self.compositor: Compositor = None
+        self.hud: WidgetGroup = None
+        # экран, которому сейчас принадлежит screen_layer
+        self._screen = None
+        # кэш слоя карты: тайлы и сущности видимой области
+        self._map_key = None
+        self._map_tiles = []
+        self._map_entities = []
+        self._map_entities_version = None
         self.delta_time = 0.
+        # игровое время: сумма delta_time всех шагов цикла
+        self.clock = 0.
+        self.frames_drawn = 0
+        # что-то на экране изменилось без нажатия клавиши
+        self._redraw = False
         self.is_running = False
 
         self.game_record = 0
@@ -39,6 +101,30 @@ class Game:
 
         self.current_level: Level = None
         self.current_level_number = 0
+        self.level_size = level_size if level_size is not None else Vec2(self.LEVEL_W, self.LEVEL_H)
+        self.camera = Vec2(0, 0)
+        self.light_map = create_light_map(self.SCR_W, self.SCR_H)
+        # light_map пересобирается целиком, только когда меняется _light_map_key,
+        # а при шаге игрока заменяется лишь его вклад _player_light
+        self._light_map_key = None
+        self._player_light = None
+        self.fov_cache: FovCache = None
+        # поля расстояний текущего уровня и активная команда перемещения
+        self.navigator: Navigator = None
+        self.travel = None
+        # движение врагов текущего уровня
+        self.enemy_ai: EnemyAI = None
+        self._light_layer_key = None
+        self.light_rebuilds = 0
+        self.light_updates = 0
+        self.light_stats = (0, 0)
+        self._light_stats_time = 0.
+        self.run_seed = None
+        self._next_run_seed = seed if seed is not None else random.randrange(2**32)
+        self.level_pack = level_pack
+        self.level_prefetcher = LevelPrefetcher(self._make_level)
+        self.level_transition_time = 0.
+        self.level_transition_prefetched = False
         self.player: Player = Player()
         self.current_state = self.STATE_MENU
         self.current_enemy: Enemy = None
@@ -52,34 +138,7 @@ class Game:
         self.menuscr: Menu = None
 
     def _init_color_palette(self):
-        curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLACK)
-        curses.init_pair(2, curses.COLOR_RED, curses.COLOR_BLACK)
-        curses.init_pair(3, curses.COLOR_GREEN, curses.COLOR_BLACK)
-        curses.init_pair(4, curses.COLOR_BLUE, curses.COLOR_BLACK)
-        curses.init_pair(5, curses.COLOR_YELLOW, curses.COLOR_BLACK)
-        curses.init_pair(6, curses.COLOR_CYAN, curses.COLOR_BLACK)
-        curses.init_pair(7, curses.COLOR_MAGENTA, curses.COLOR_BLACK)
-        curses.init_pair(8, curses.COLOR_BLACK, curses.COLOR_BLACK)
-        curses.init_pair(9, curses.COLOR_BLACK, curses.COLOR_WHITE)
-        curses.init_pair(10, curses.COLOR_GREEN, curses.COLOR_WHITE)
-        curses.init_pair(11, curses.COLOR_BLACK, curses.COLOR_GREEN)
-        curses.init_pair(12, curses.COLOR_WHITE, curses.COLOR_WHITE)
-        curses.init_pair(13, curses.COLOR_RED, curses.COLOR_WHITE)
-        self._colors = {
-            Color.White: curses.color_pair(1),
-            Color.Red: curses.color_pair(2),
-            Color.Green: curses.color_pair(3),
-            Color.Blue: curses.color_pair(4),
-            Color.Yellow: curses.color_pair(5),
-            Color.Cyan: curses.color_pair(6),
-            Color.Magenta: curses.color_pair(7),
-            Color.Black: curses.color_pair(8),
-            Color.BlackOnWhite: curses.color_pair(9),
-            Color.GreenOnWhite: curses.color_pair(10),
-            Color.BlackOnGreen: curses.color_pair(11),
-            Color.WhiteOnWhite: curses.color_pair(12),
-            Color.RedOnWhite: curses.color_pair(13),
-        }
+        self._colors = self.surface.init_colors()
 
     def clr(self, color_id):
         return self._colors[color_id]
@@ -87,7 +146,9 @@ class Game:
     def _load(self):
         create_new = False
         try:
-            with open('save.txt', 'r') as f:
+            if self.save_path is None:
+                raise Exception("No save file")
+            with open(self.save_path, 'r') as f:
                 ints = list(map(lambda x: int(x.strip()), f.readlines()))
             if len(ints) != 2:
                 create_new = True
@@ -103,7 +164,9 @@ class Game:
             self._save()
 
     def _save(self):
-        with open('save.txt', 'w') as f:
+        if self.save_path is None:
+            return
+        with open(self.save_path, 'w') as f:
             f.write(f'{self.game_record}\n')
             f.write(f'{int(self.is_first_game)}\n')
 
@@ -113,46 +176,273 @@ class Game:
             self.game_record = score
             self._save()
 
-    def run(self, stdscr: curses.window):
+    def start(self, surface: Surface):
+        self.surface = surface
         self._init_color_palette()
-        self.scr = stdscr
-        self.menuscr = Menu(self, self.scr)
+        self._init_renderer()
+        self.menuscr = Menu(self, self.surface)
         self.is_running = True
-        self.scr.nodelay(True)
 
         self._load()
+        self.level_prefetcher.prefetch(1, self.level_seed(self._next_run_seed, 1))
+
+    def run(self, stdscr, max_steps=None):
+        # stdscr - окно curses или готовая поверхность Surface;
+        # max_steps ограничивает число шагов цикла при запуске без терминала
+        self.start(stdscr if isinstance(stdscr, Surface) else CursesSurface(stdscr))
+        if self.recorder is not None:
+            self.recorder.start(self)
 
-        self.delta_time = 0.001
-        while self.is_running:
-            dt = time.time()
-            key = self.scr.getch()
-            if key != -1:
+        # Цикл ждет ввода до ближайшего события по времени и рисует кадр,
+        # только если была нажата клавиша или наступило событие
+        self.delta_time = 0.
+        last_time = time.monotonic()
+        phases = self.profiler.phases
+        dirty = True
+        steps = 0
+        # начало шага без времени ожидания ввода
+        step_start = time.perf_counter()
+        try:
+            while self.is_running:
+                if dirty:
+                    self._draw_frame()
+                    with phases['refresh']:
+                        self.renderer.present()
+                    self.frames_drawn += 1
+                    phases['frame'].add(time.perf_counter() - step_start)
+                steps += 1
+                if max_steps is not None and steps >= max_steps:
+                    break
+                timeout = self._next_event_timeout()
+                deadline = None if timeout is None else self.clock + timeout
+                key = self.surface.wait_key(timeout)
+                step_start = time.perf_counter()
+                if self.surface.realtime:
+                    now = time.monotonic()
+                    delta_time = now - last_time
+                    last_time = now
+                else:
+                    # без терминала шаги идут без пауз, а игровое время - с шагом 1/60 с
+                    delta_time = self.FPS_60
+                if self.recorder is None:
+                    dirty = self.step(key, delta_time)
+                else:
+                    delta_time = self.recorder.quantize(delta_time)
+                    failed = True
+                    try:
+                        dirty = self.step(key, delta_time)
+                        failed = False
+                    finally:
+                        # шаг, на котором игра упала, тоже записывается: воспроизведение повторит ошибку
+                        self.recorder.record(self, key, delta_time, failed)
+                if deadline is not None and self.clock >= deadline - self.EVENT_TOLERANCE:
+                    dirty = True
+        finally:
+            self.level_prefetcher.shutdown()
+            if self.recorder is not None:
+                self.recorder.close()
+            if self.profile_path is not None:
+                self.profiler.dump(self.profile_path)
+
+    def step(self, key, delta_time):
+        # один шаг игры: клавиша (-1 - без нажатия) и прошедшее время;
+        # True - на экране что-то изменилось
+        phases = self.profiler.phases
+        self.delta_time = delta_time
+        if key != -1:
+            with phases['input']:
                 self._handle_key(key)
+        with phases['update']:
             self._update()
-            if self.current_state == self.STATE_WALK:
+        redraw = key != -1 or self._redraw
+        self._redraw = False
+        return redraw
+
+    def state_checksum(self):
+        # контрольная сумма игрового состояния для сверки записи и воспроизведения
+        player = self.player
+        level = self.current_level
+        battle = None
+        if self.battle is not None:
+            battle = (self.battle.cur_line, self.battle.cur_symbol, self.battle.next_err)
+        state = (self.current_state, self.clock, tuple(player.get_coords()), player.get_hp(), player.get_score(),
+                 player.get_time_left(), player.get_lights_count(), player.get_light_level(),
+                 self.current_level_number, self.run_seed, battle, self.current_message, len(self.messages_queue),
+                 self.travel,
+                 None if level is None else (level.get_entities_version(), level.get_lights_version()))
+        return zlib.crc32(repr(state).encode())
+
+    def get_keyframe(self):
+        # состояние игры без кэшей отрисовки: с него можно продолжить игру или воспроизведение
+        battle = None
+        if self.battle is not None:
+            b = self.battle
+            battle = (b.code_list, b.cur_line, b.cur_symbol, b.next_err, b.input, b._done)
+        lose = None
+        if self.losescr is not None:
+            lose = (self.losescr.score, self.losescr.restart_or_menu)
+        menu = self.menuscr
+        return pickle.dumps({
+            'random': random.getstate(),
+            'clock': self.clock,
+            'player': self.player,
+            'level': self.current_level,
+            'level_number': self.current_level_number,
+            'run_seed': self.run_seed,
+            'next_run_seed': self._next_run_seed,
+            'state': self.current_state,
+            'enemy': self.current_enemy,
+            'battle': battle,
+            'lose': lose,
+            'menu': (menu.start_or_exit, menu.logo_t, menu.logo_underline),
+            'messages': (self.messages_queue, self.current_message, self.msg_time_left),
+            'first_game': self.is_first_game,
+            'record': self.game_record,
+            'travel': self.travel,
+            'navigator': None if self.current_level is None else self.get_navigator().get_state(),
+            'enemy_ai': self.enemy_ai,
+        }, pickle.HIGHEST_PROTOCOL)
+
+    def load_keyframe(self, data):
+        state = pickle.loads(data)
+        self.clock = state['clock']
+        self.player = state['player']
+        self.current_level = state['level']
+        self.current_level_number = state['level_number']
+        self.run_seed = state['run_seed']
+        self._next_run_seed = state['next_run_seed']
+        self.current_state = state['state']
+        self.current_enemy = state['enemy']
+        self.messages_queue, self.current_message, self.msg_time_left = state['messages']
+        self.is_first_game = state['first_game']
+        self.game_record = state['record']
+        self.travel = state['travel']
+        self.enemy_ai = state['enemy_ai']
+        self.navigator = None
+        if state['navigator'] is not None:
+            self.get_navigator().set_state(state['navigator'])
+        self.menuscr.start_or_exit, self.menuscr.logo_t, self.menuscr.logo_underline = state['menu']
+        self.battle = None
+        if state['battle'] is not None:
+            self.battle = self._create_battle()
+            (self.battle.code_list, self.battle.cur_line, self.battle.cur_symbol, self.battle.next_err,
+             self.battle.input, self.battle._done) = state['battle']
+        self.losescr = None
+        if state['lose'] is not None:
+            score, restart_or_menu = state['lose']
+            self._create_lose_screen(score)
+            self.losescr.restart_or_menu = restart_or_menu
+        # создание боя расходует случайные числа, поэтому состояние генератора - последним
+        random.setstate(state['random'])
+        # кэши отрисовки и освещения относятся к прежнему уровню
+        self._map_key = None
+        self._light_map_key = None
+        self._light_layer_key = None
+        self._player_light = None
+        self.fov_cache = None
+        self._screen = None
+        self.screen_layer.clear()
+        self.compositor.invalidate()
+        self._redraw = True
+
+    def _next_event_timeout(self):
+        # секунды до ближайшего события по времени, None - ждать только ввода
+        if self.debug_ui:
+            # отладочная строка показывает время кадра, ее рисуем с частотой 60 FPS
+            return self.FPS_60
+        timeouts = []
+        if self.show_profiler:
+            timeouts.append(self._profiler_time + self.PROFILER_REFRESH - self.clock)
+        if self.current_message is not None:
+            timeouts.append(self.msg_time_left)
+        elif len(self.messages_queue) > 0:
+            return 0
+        if self.current_state == self.STATE_MENU:
+            timeouts.append(self.menuscr.next_blink_timeout())
+        elif self.current_state == self.STATE_BATTLE:
+            timeouts.append(self._battle_timeout())
+        elif self.current_state == self.STATE_WALK:
+            if self.travel is not None:
+                timeouts.append(self.player.next_move - self.clock)
+            if self._enemies_move():
+                # при сотнях врагов их обновления идут чаще кадров, будим цикл не чаще FPS
+                timeouts.append(max(self.FPS_60, self.get_enemy_ai().next_update_timeout()))
+        if not timeouts:
+            return None
+        return max(0., min(timeouts))
+
+    def _battle_timeout(self):
+        # таймер, а после него здоровье убывают и выводятся округленными:
+        # ждем, пока изменится выведенное значение или убывающее дойдет до нуля
+        value = self.player.get_time_left()
+        if value <= 0:
+            value = self.player.get_hp()
+        return min(value, (value - 0.5) % 1 or 1.)
+
+    def _init_renderer(self):
+        self.renderer = Renderer(self.surface, self.SCR_W, self.SCR_H, self._colors)
+        # слои снизу вверх
+        self.compositor = Compositor(self.renderer, self.SCR_W, self.SCR_H)
+        self.map_layer: Layer = self.compositor.add_layer()
+        self.player_layer: Layer = self.compositor.add_layer()
+        self.screen_layer: Layer = self.compositor.add_layer()
+        self.tutorial_layer: Layer = self.compositor.add_layer()
+        self.tutorial_battle_layer: Layer = self.compositor.add_layer()
+        self.hud_layer: Layer = self.compositor.add_layer()
+        self.profiler_layer: Layer = self.compositor.add_layer()
+        self.hud = WidgetGroup(self.hud_layer, [
+            Widget(self._get_status, self._render_status),
+            Widget(lambda: self.current_message,
+                   lambda msg: [] if msg is None else [(0, 1, msg, Color.BlackOnGreen)]),
+            Widget(self._get_debug_info,
+                   lambda lines: [(0, self.SCR_H - 1 - i, line, Color.GreenOnWhite) for i, line in enumerate(lines)]),
+        ])
+        self.profiler_ui = WidgetGroup(self.profiler_layer, [
+            Widget(self._get_profiler_info,
+                   lambda lines: [(self.SCR_W - len(line), 2 + i, line, Color.GreenOnWhite)
+                                  for i, line in enumerate(lines)]),
+        ])
+
+    def _draw_frame(self):
+        # слои карты и игрока обновляются только в режиме ходьбы, окна и интерфейс
+        # перерисовываются при изменении своих значений, подсказки обучения - один раз
+        screen = {self.STATE_BATTLE: self.battle, self.STATE_LOSE: self.losescr,
+                  self.STATE_MENU: self.menuscr}.get(self.current_state)
+        if screen is not self._screen:
+            self._screen = screen
+            self.screen_layer.clear()
+            if screen is not None:
+                screen.invalidate()
+        self.hud_layer.set_visible(self.current_state != self.STATE_MENU)
+        phases = self.profiler.phases
+        if self.current_state == self.STATE_WALK:
+            with phases['draw']:
                 self._draw()
-            elif self.current_state == self.STATE_BATTLE:
+
+        with phases['ui']:
+            if self.current_state == self.STATE_BATTLE:
                 self._draw_battle_screen()
             elif self.current_state == self.STATE_LOSE:
                 self._draw_lose_screen()
-
             if self.current_state == self.STATE_MENU:
                 self._draw_menu_screen()
             else:
-                if self.is_first_game:
-                    if self.current_state == self.STATE_WALK:
-                        self._draw_tutorial_ui()
-                    elif self.current_state == self.STATE_BATTLE:
-                        self._draw_tutorial_battle_ui()
                 self._draw_ui()
-            self.delta_time = time.time() - dt
-            t = time.time()
-            if self.delta_time < self.FPS_60:
-                time.sleep(self.FPS_60 - self.delta_time)
-            self.delta_time += time.time() - t
+            self.tutorial_layer.set_visible(self.is_first_game and self.current_state == self.STATE_WALK)
+            if self.tutorial_layer.visible and self.tutorial_layer.is_empty():
+                self._draw_tutorial_ui()
+            self.tutorial_battle_layer.set_visible(self.is_first_game and self.current_state == self.STATE_BATTLE)
+            if self.tutorial_battle_layer.visible and self.tutorial_battle_layer.is_empty():
+                self._draw_tutorial_battle_ui()
+            self.profiler_ui.draw()
+        with phases['compose']:
+            self.compositor.compose()
 
     def restart_game(self):
         self.player: Player = Player()
+        self.run_seed = self._next_run_seed
+        # следующий забег выводится из текущего, вся цепочка задается первым сидом
+        self._next_run_seed = seeds.stream(self.run_seed, seeds.NEXT_RUN).getrandbits(32)
 
         self.current_level: Level = None
         self.current_level_number = 0
@@ -161,6 +451,7 @@ class Game:
         self.current_state = self.STATE_WALK
         self.current_enemy: Enemy = None
         self.battle: Battle = None
+        self.travel = None
         self.messages_queue = []
         self.current_message = None
         self.msg_time_left = 0
@@ -182,19 +473,24 @@ class Game:
             if key_code == curses.KEY_F4:
                 self.player.take_dmg(10**4)
                 return
+            if key_code == curses.KEY_F5:
+                self.show_profiler = not self.show_profiler
+                self._profiler_time = -self.PROFILER_REFRESH
+                return
+            if key_code == curses.KEY_F6:
+                self.profiler.dump(self.profile_path or 'profile.json')
+                return
         if self.current_state == self.STATE_WALK:
+            # любая клавиша прерывает команду перемещения
+            self.travel = self.TRAVEL_KEYS.get(key_code)
             if key_code == curses.KEY_UP:
-                move_vec = Vec2(0, -1)
-                self.move_player(self.player.get_coords() + move_vec)
+                self.move_player(self.player.get_coords() + Vec2.UP)
             elif key_code == curses.KEY_DOWN:
-                move_vec = Vec2(0, 1)
-                self.move_player(self.player.get_coords() + move_vec)
+                self.move_player(self.player.get_coords() + Vec2.DOWN)
             elif key_code == curses.KEY_RIGHT:
-                move_vec = Vec2(1, 0)
-                self.move_player(self.player.get_coords() + move_vec)
+                self.move_player(self.player.get_coords() + Vec2.RIGHT)
             elif key_code == curses.KEY_LEFT:
-                move_vec = Vec2(-1, 0)
-                self.move_player(self.player.get_coords() + move_vec)
+                self.move_player(self.player.get_coords() + Vec2.LEFT)
             elif key_code in (81, 113):
                 coords = self.player.get_coords()
                 if self.player.remove_light():
@@ -207,13 +503,14 @@ class Game:
             self.menuscr.input_key(key_code)
 
     def move_player(self, new_coords: Vec2):
-        t = time.time()
+        t = self.clock
         if t > self.player.next_move:
             self.player.next_move = t + self.player.move_delay
             (tile_id, _, _), obj, enemy = self.current_level.get_all(new_coords)
             if obj is None and enemy is None:
                 if tile_id == Tile.id_Floor:
                     self.player.move_to(new_coords)
+                    self._visit()
                 elif tile_id == Tile.id_Exit:
                     if self.is_first_game:
                         self.is_first_game = False
@@ -223,13 +520,14 @@ class Game:
                         self.next_level()
             else:
                 self.player.move_to(new_coords)
+                self._visit()
                 if obj is not None:
                     if isinstance(obj, LightSource) and self.player.get_max_lights_count() > self.player.get_lights_count():
                         self.player.add_light()
                         self.current_level.remove_object(obj)
                         self._show_msg(Message.text(Message.PickLight))
                     elif isinstance(obj, Chest):
-                        upgrade = Chest.get_upgrade()
+                        upgrade = obj.get_upgrade()
                         self.current_level.remove_object(obj)
                         self.apply_player_upgrade(upgrade)
                     elif isinstance(obj, Heal):
@@ -239,6 +537,73 @@ class Game:
                 if enemy is not None:
                     self.start_battle(enemy)
 
+    def _visit(self):
+        self.get_navigator().visit(self.player.get_coords(), self.player.light_radius)
+
+    def get_navigator(self):
+        # поля расстояний текущего уровня, ими пользуются команды перемещения и боты
+        if self.navigator is None or self.navigator.level is not self.current_level:
+            self.navigator = Navigator(self.current_level, self._get_visible_lighting)
+        return self.navigator
+
+    def _get_travel_field(self):
+        # враги ходят, поэтому поля их не обходят: перемещение прерывается, когда враг рядом
+        navigator = self.get_navigator()
+        if self.travel == self.TRAVEL_EXIT:
+            return navigator.get_exit_field(avoid_enemies=False)
+        if self.travel == self.TRAVEL_LANTERN:
+            return navigator.get_lantern_field(avoid_enemies=False)
+        return navigator.get_unexplored_field(self.player.get_coords(), avoid_enemies=False,
+                                              budget=self.TRAVEL_FIELD_BUDGET)
+
+    def _update_travel(self):
+        # шаг команды перемещения, как только игрок может сделать следующий ход
+        if self.travel is None or self.current_state != self.STATE_WALK or self.clock <= self.player.next_move:
+            return
+        coords = self.player.get_coords()
+        if self.current_level.get_enemies_near(coords.x, coords.y, self.TRAVEL_ALERT_RADIUS):
+            self._show_msg(Message.text(Message.EnemyNear))
+            self.travel = None
+            return
+        field = self._get_travel_field()
+        if field is Navigator.SEARCHING or field is not None and not field.reach(coords, self.TRAVEL_FIELD_BUDGET):
+            return
+        step = None if field is None else field.next_step(coords)
+        if step is None:
+            if field is None:
+                self._show_msg(Message.text(Message.LevelExplored))
+            elif field.capped:
+                self._show_msg(Message.text(Message.TooFar))
+            elif field.distance(coords) != 0:
+                self._show_msg(Message.text(Message.NoPath))
+            self.travel = None
+            return
+        self.move_player(step)
+        self._redraw = True
+
+    def _enemies_move(self):
+        # в обучении враги стоят на местах, к которым привязаны подсказки
+        return not self.is_first_game and self.current_level is not None
+
+    def get_enemy_ai(self):
+        if self.enemy_ai is None or self.enemy_ai.level is not self.current_level:
+            rng = seeds.stream(self.run_seed, self.current_level_number, seeds.ENEMY_AI)
+            self.enemy_ai = EnemyAI(self.current_level, rng)
+        return self.enemy_ai
+
+    def _update_enemies(self):
+        if self.current_state != self.STATE_WALK or not self._enemies_move():
+            return
+        enemy_ai = self.get_enemy_ai()
+        moves = enemy_ai.moves
+        with self.profiler.phases['ai']:
+            attacker = enemy_ai.update(self.delta_time, self.player.get_coords(), self.get_navigator())
+        if enemy_ai.moves != moves:
+            self._redraw = True
+        if attacker is not None:
+            self.start_battle(attacker)
+            self._redraw = True
+
     def apply_player_upgrade(self, upgrade):
         res = self.player.apply_upgrade(upgrade)
         if upgrade == Chest.LightsAmountUpgrade:
@@ -254,10 +619,14 @@ class Game:
         self._show_msg(msg[res])
 
     def start_battle(self, enemy):
+        self.travel = None
         self.player.reset_time_left()
         self.current_enemy = enemy
         self.current_state = self.STATE_BATTLE
-        self.battle = Battle(self, self.scr, Vec2(2, 2), Vec2(self.SCR_W - 3, self.SCR_H - 3))
+        self.battle = self._create_battle()
+
+    def _create_battle(self):
+        return Battle(self, self.surface, Vec2(2, 2), Vec2(self.SCR_W - 3, self.SCR_H - 3))
 
     def finish_battle(self):
         if self.current_state != self.STATE_BATTLE:
@@ -270,7 +639,37 @@ class Game:
         self.current_state = self.STATE_WALK
         self.battle = None
 
+    @staticmethod
+    def level_seed(run_seed, level_number):
+        return seeds.derive(run_seed, level_number)
+
+    @classmethod
+    def build_level(cls, level_number, seed, width=LEVEL_W, height=LEVEL_H):
+        if level_number >= 25:
+            walls_destroy_chance = 0
+        else:
+            walls_destroy_chance = -level_number/25 + 1
+        if width * height > cls.CHUNKED_LEVEL_AREA:
+            return generate_chunked_labirinth(width, height, walls_destroy_chance, seed,
+                                              1+level_number//4, level_number//2)
+        # уровень зависит только от своего сида: его можно построить заново
+        # без предыдущих уровней, в любом потоке или процессе
+        level = LevelGenerator.generate_labirinth(width, height, walls_destroy_chance,
+                                                  seeds.stream(seed, seeds.MAZE))
+        placement = seeds.stream(seed, seeds.PLACEMENT)
+        level.spawn_objects(rng=placement, loot_rng=seeds.stream(seed, seeds.LOOT))
+        level.spawn_enemy(1+level_number//4, level_number//2, rng=placement,
+                          code_rng=seeds.stream(seed, seeds.ENEMY_CODE))
+        return level
+
+    def _make_level(self, level_number, seed):
+        if self.level_pack is not None and len(self.level_pack) > 0:
+            level, _ = self.level_pack[(level_number - 1) % len(self.level_pack)]
+            return level
+        return self.build_level(level_number, seed, self.level_size.x, self.level_size.y)
+
     def next_level(self):
+        t = time.perf_counter()
         if self.current_level is not None:
             self.player.add_score(1000)
             self._show_msg('Следующий уровень. Украдено 1000¥')
@@ -280,51 +679,124 @@ class Game:
                 self.player.upgrade_time_limit()
             self.current_level = LevelGenerator.generate_tutorial_room(self.SCR_W, self.SCR_H)
             # self.current_level = LevelGenerator.generate_test_room(self.SCR_W, self.SCR_H)
+            self.level_transition_prefetched = False
+            # после обучения начнется новая игра
+            self.level_prefetcher.prefetch(1, self.level_seed(self._next_run_seed, 1))
         else:
             self.current_level_number += 1
-            if self.current_level_number >= 25:
-                walls_destroy_chance = 0
-            else:
-                walls_destroy_chance = -self.current_level_number/25 + 1
-            self.current_level = LevelGenerator.generate_labirinth(self.SCR_W, self.SCR_H, walls_destroy_chance)
-            self.current_level.spawn_objects()
-            self.current_level.spawn_enemy(1+self.current_level_number//4, self.current_level_number//2)
+            seed = self.level_seed(self.run_seed, self.current_level_number)
+            self.current_level, self.level_transition_prefetched = self.level_prefetcher.take(
+                self.current_level_number, seed)
+            next_number = self.current_level_number + 1
+            self.level_prefetcher.prefetch(next_number, self.level_seed(self.run_seed, next_number))
         self.player.move_to(self.current_level.get_spawn_point())
+        self.travel = None
+        self._visit()
         self.player.restore_all_lights()
+        self._center_camera()
+        self.level_transition_time = time.perf_counter() - t
+
+    def _clamp_camera(self, x, y):
+        x = max(0, min(x, self.current_level.get_width() - self.SCR_W))
+        y = max(0, min(y, self.current_level.get_height() - self.SCR_H))
+        return Vec2(x, y)
+
+    def _center_camera(self):
+        px, py = self.player.get_coords()
+        self.camera = self._clamp_camera(px - self.SCR_W // 2, py - self.SCR_H // 2)
+
+    def _update_camera(self):
+        # камера сдвигается, только когда игрок подходит к краю экрана
+        px, py = self.player.get_coords()
+        x, y = self.camera
+        margin_x = self.SCR_W // 4
+        margin_y = self.SCR_H // 4
+        if px < x + margin_x:
+            x = px - margin_x
+        elif px >= x + self.SCR_W - margin_x:
+            x = px - self.SCR_W + margin_x + 1
+        if py < y + margin_y:
+            y = py - margin_y
+        elif py >= y + self.SCR_H - margin_y:
+            y = py - self.SCR_H + margin_y + 1
+        self.camera = self._clamp_camera(x, y)
 
     def calc_light(self):
-        light_map = []
-        for y in range(self.SCR_H):
-            light_map.append([])
-            for x in range(self.SCR_W):
-                if self.debug_no_fog:
-                    light_map[y].append(4)
-                else:
-                    light_map[y].append(0)
-        if not self.debug_no_fog:
-            for light_source in self.current_level.get_light_sources() + [self.player.light_source]:
-                source_coords = light_source.get_coords()
-                light_source.set_radius(self.player.light_radius)
-                lighting = light_source.get_lighting(self.SYMBOL_ASPECT)
-                for offset, strength in lighting:
-                    coords: Vec2 = offset + source_coords
-                    if 0 <= coords.x < self.SCR_W and 0 <= coords.y < self.SCR_H:
-                        light_at_point = light_map[coords.y][coords.x]
-                        light_at_point += strength
-                        if light_at_point > 4:
-                            light_at_point = 4
-                        light_map[coords.y][coords.x] = light_at_point
-        return light_map
+        level = self.current_level
+        radius = self.player.light_radius
+        key = (level, level.get_lights_version(), level.get_tiles_version(), self.camera, radius, self.debug_no_fog)
+        if key != self._light_map_key:
+            self._light_map_key = key
+            self._rebuild_light_map(radius)
+            self.light_rebuilds += 1
+        elif self._player_light is not None:
+            (x, y), kernel = self._player_light
+            cam_x, cam_y = self.camera
+            px, py = self.player.get_coords()
+            if px - cam_x != x or py - cam_y != y:
+                new_kernel = self._get_visible_lighting(px, py, radius)
+                self.light_map.remove_kernel(kernel, x, y)
+                self.light_map.add_kernel(new_kernel, px - cam_x, py - cam_y)
+                self._player_light = ((px - cam_x, py - cam_y), new_kernel)
+                self.light_updates += 1
+        return self.light_map
+
+    def _get_visible_lighting(self, x, y, radius):
+        # освещение источника без клеток, закрытых от него стенами
+        if self.fov_cache is None or self.fov_cache.level is not self.current_level:
+            self.fov_cache = FovCache(self.current_level)
+        return self.fov_cache.get(LightSource.kernel_cache.get(radius, self.SYMBOL_ASPECT), x, y)
+
+    def _get_light_layer(self, radius):
+        # все фонари светят с радиусом игрока, поэтому при его изменении слой запекается заново
+        level = self.current_level
+        key = (level, radius, level.get_tiles_version())
+        if key != self._light_layer_key:
+            self._light_layer_key = key
+            level.set_light_layer(StaticLightLayer(
+                lambda light_source: self._get_visible_lighting(*light_source.get_coords(), radius),
+                type(self.light_map)))
+        return level.get_light_layer()
+
+    def _rebuild_light_map(self, radius):
+        # карта освещенности покрывает только видимую часть уровня:
+        # запеченный свет фонарей и свет игрока
+        cam_x, cam_y = self.camera
+        light_map = self.light_map
+        self._player_light = None
+        if self.debug_no_fog:
+            light_map.clear(light_map.MAX_LIGHT)
+            return
+        light_map.clear()
+        self._get_light_layer(radius).copy_to(light_map, cam_x, cam_y)
+        px, py = self.player.get_coords()
+        kernel = self._get_visible_lighting(px, py, radius)
+        light_map.add_kernel(kernel, px - cam_x, py - cam_y)
+        self._player_light = ((px - cam_x, py - cam_y), kernel)
 
     def _update(self):
+        self.clock += self.delta_time
+        self._light_stats_time += self.delta_time
+        if self._light_stats_time >= 1:
+            self.light_stats = (self.light_rebuilds / self._light_stats_time,
+                                self.light_updates / self._light_stats_time)
+            self.light_rebuilds = 0
+            self.light_updates = 0
+            self._light_stats_time = 0.
+
         if self.current_message is not None:
             self.msg_time_left -= self.delta_time
             if self.msg_time_left <= 0:
                 self.current_message = None
                 self.msg_time_left = 0
+                self._redraw = True
         if self.current_message is None and len(self.messages_queue) > 0:
             self.current_message, show_time = self.messages_queue.pop(0)
             self.msg_time_left = show_time
+            self._redraw = True
+
+        self._update_travel()
+        self._update_enemies()
 
         if self.current_state == self.STATE_BATTLE:
             if self.battle.is_done():
@@ -339,89 +811,155 @@ class Game:
                 and self.player.get_hp() <= 0
                 and self.current_state != self.STATE_LOSE):
             self.current_state = self.STATE_LOSE
-            score = self.player.get_score()
+            self._redraw = True
             self._update_record()
-            width = max(len(Message.text(Message.LoseTitle)), len(f'Заработано: {score}¥'))
-            upleft = Vec2(self.SCR_W//2 - width//2 - 1, self.SCR_H//2 - 5)
-            downright = Vec2(self.SCR_W//2 + width//2 + 2, self.SCR_H//2 + 5)
-            self.losescr = Lose(self, self.scr, upleft, downright, score)
+            self._create_lose_screen(self.player.get_score())
+
+    def _create_lose_screen(self, score):
+        width = max(len(Message.text(Message.LoseTitle)), len(f'Заработано: {score}¥'))
+        upleft = Vec2(self.SCR_W//2 - width//2 - 1, self.SCR_H//2 - 5)
+        downright = Vec2(self.SCR_W//2 + width//2 + 2, self.SCR_H//2 + 5)
+        self.losescr = Lose(self, self.surface, upleft, downright, score)
 
     def _show_msg(self, msg, show_time=1.5):
         self.messages_queue.append((msg, show_time))
 
-    def _draw_at(self, coords: Vec2, string, clr=Color.White):
+    def _draw_at(self, coords: Vec2, string, clr=Color.White, layer: Layer = None):
         if 0 <= coords.x < self.SCR_W and 0 <= coords.y < self.SCR_H:
-            self.scr.addstr(coords.y, coords.x, string, self.clr(clr))
+            if layer is None:
+                layer = self.hud_layer
+            layer.put(coords.x, coords.y, string, clr)
 
     def _draw(self):
-        lighting = self.calc_light()
-        self.scr.clear()
-        for y in range(self.SCR_H):
-            for x in range(self.SCR_W):
-                l = lighting[y][x]
+        self._update_camera()
+        with self.profiler.phases['light']:
+            lighting = self.calc_light()
+        level = self.current_level
+        cam_x, cam_y = self.camera
+        dirty = lighting.take_dirty_rows()
+        key = (level, self.camera, level.get_tiles_version(), self.debug_ui)
+        if key != self._map_key:
+            # тайлы не меняются, пока не сдвинется камера или не сменится уровень
+            self._map_key = key
+            self._map_tiles = [bytes(row) for row in level.get_region(cam_x, cam_y, self.SCR_W, self.SCR_H)]
+            self._map_entities = [None] * len(self._map_tiles)
+            self._map_entities_version = None
+            dirty = set(range(self.SCR_H))
+        if level.get_entities_version() != self._map_entities_version:
+            self._map_entities_version = level.get_entities_version()
+            for sy in range(len(self._map_tiles)):
+                entities = self._get_entities_row(cam_y + sy)
+                if entities != self._map_entities[sy]:
+                    self._map_entities[sy] = entities
+                    dirty.add(sy)
+        for sy in dirty:
+            self._draw_map_row(sy, lighting.row(sy))
+
+        # отрисовка игрока
+        self.player_layer.clear()
+        ch, clr = self.player.get_char()
+        self._draw_at(self.player.get_coords() - self.camera, ch, clr, self.player_layer)
+
+    def _get_entities_row(self, y):
+        # символы объектов и врагов строки y видимой области по x на экране
+        level = self.current_level
+        cam_x = self.camera.x
+        occupancy_row = level.get_occupancy_row(y, cam_x, min(cam_x + self.SCR_W, level.get_width()))
+        if not any(occupancy_row):
+            return None
+        row_index = y * level.get_width() + cam_x
+        entities = {}
+        for sx, occupancy in enumerate(occupancy_row):
+            if occupancy:
+                enemy = level.get_enemy_at(row_index + sx)
+                if enemy is None:
+                    entities[sx] = level.get_object_at(row_index + sx).get_char()
+                else:
+                    entities[sx] = enemy.get_char()
+        return entities
+
+    def _draw_map_row(self, sy, light_row):
+        glyphs = [None] * self.SCR_W
+        colors = [0] * self.SCR_W
+        if sy < len(self._map_tiles):
+            tiles_row = self._map_tiles[sy]
+            entities = self._map_entities[sy]
+            for sx in range(len(tiles_row)):
+                l = light_row[sx]
                 if l > 0:
-                    coords = Vec2(x, y)
-                    (tile_id, tile_ch, tile_clr), obj, enemy = self.current_level.get_all(coords)
-                    if obj is None and enemy is None:
+                    if entities is None or sx not in entities:
                         # отрисовка карты
+                        tile_id = tiles_row[sx]
+                        tile_ch, tile_clr = Tile.get_tile(tile_id)
                         if tile_id == Tile.id_Wall:
                             tile_ch = self.LIGHT[l-1]
                         elif tile_id == Tile.id_Floor and self.debug_ui:
                             tile_ch = str(l)
                             tile_clr = Color.Green
-                        self._draw_at(coords, tile_ch, tile_clr)
-                    elif enemy is None:
-                        # отрисовка объектов
-                        obj_ch, obj_clr = obj.get_char()
-                        self._draw_at(coords, obj_ch, obj_clr)
+                        glyphs[sx] = tile_ch
+                        colors[sx] = tile_clr
                     else:
-                        # отрисовка врагов
-                        enemy_ch, enemy_clr = enemy.get_char()
-                        self._draw_at(coords, enemy_ch, enemy_clr)
-
-        # отрисовка игрока
-        ch, clr = self.player.get_char()
-        self._draw_at(self.player.get_coords(), ch, clr)
+                        # отрисовка объектов и врагов
+                        glyphs[sx], colors[sx] = entities[sx]
+        self.map_layer.set_row(sy, glyphs, colors)
 
     def _draw_ui(self):
-        self._draw_at(Vec2(0, 0), ' '*self.SCR_W, Color.BlackOnWhite)
+        self.hud.draw()
+
+    def _get_status(self):
+        player = self.player
+        hp = player.get_hp()
+        max_hp = player.get_max_hp()
+        return (player.get_light_level(), player.get_lights_count(), player.get_max_lights_count(),
+                f'{hp:.0f}', max_hp, hp/max_hp <= 0.1, player.get_time_limit(), player.get_score())
+
+    def _render_status(self, status):
+        l_level, l_count, l_max_count, hp, max_hp, low_hp, time_lim, score = status
+        spans = [(0, 0, ' '*self.SCR_W, Color.BlackOnWhite)]
 
-        l_count = self.player.get_lights_count()
-        l_max_count = self.player.get_max_lights_count()
-        l_level = self.player.get_light_level()
         ui_str = f'Фонари ({l_level} ур): {l_count}/{l_max_count}'
-        self._draw_at(Vec2(0, 0), ui_str, Color.BlackOnWhite)
+        spans.append((0, 0, ui_str, Color.BlackOnWhite))
         ui_str_len = len(ui_str)
 
-        hp = self.player.get_hp()
-        max_hp = self.player.get_max_hp()
-        ui_str = f'HP: {hp:.0f}/{max_hp}'
-        if hp/max_hp <= 0.1:
-            clr = Color.RedOnWhite
-        else:
-            clr = Color.BlackOnWhite
-        self._draw_at(Vec2(ui_str_len+2, 0), ui_str, clr)
+        ui_str = f'HP: {hp}/{max_hp}'
+        spans.append((ui_str_len+2, 0, ui_str, Color.RedOnWhite if low_hp else Color.BlackOnWhite))
         ui_str_len += len(ui_str) + 2
 
-        time_lim = self.player.get_time_limit()
-        ui_str = f'DT: {time_lim}с'
-        self._draw_at(Vec2(ui_str_len+2, 0), ui_str, Color.BlackOnWhite)
+        spans.append((ui_str_len+2, 0, f'DT: {time_lim}с', Color.BlackOnWhite))
 
-        score = self.player.get_score()
         ui_str = f'{score}¥'
-        score_len = len(ui_str)
-        self._draw_at(Vec2(self.SCR_W-score_len-1, 0), ui_str, Color.BlackOnWhite)
-
-        if self.current_message is not None:
-            self._draw_at(Vec2(0, 1), self.current_message, Color.BlackOnGreen)
-
-        if self.debug_ui:
-            _str = f'Frame: {self.delta_time:.4f}s'
-            if self.delta_time > 0.00001:
-                _str += f' FPS: {1 / self.delta_time:.0f}'
-            else:
-                _str += 'FPS: inf'
-            self._draw_at(Vec2(0, self.SCR_H-1), _str, Color.GreenOnWhite)
+        spans.append((self.SCR_W-len(ui_str)-1, 0, ui_str, Color.BlackOnWhite))
+        return spans
+
+    def _get_debug_info(self):
+        if not self.debug_ui:
+            return ()
+        _str = f'Frame: {self.delta_time:.4f}s'
+        if self.delta_time > 0.00001:
+            _str += f' FPS: {1 / self.delta_time:.0f}'
+        else:
+            _str += 'FPS: inf'
+        _str += f' Level: {self.level_transition_time * 1000:.1f}ms'
+        if self.level_transition_prefetched:
+            _str += ' (prefetched)'
+        _str += f' Kernels: {LightSource.kernel_cache.hits}/{LightSource.kernel_cache.misses}'
+        _str += f' Light/s: {self.light_stats[0]:.0f} full {self.light_stats[1]:.0f} incr'
+        if self.navigator is not None:
+            _str += f' Fields: {self.navigator.field_builds}'
+        if self.enemy_ai is not None:
+            _str += f' AI: {self.enemy_ai.ticks} ticks {self.enemy_ai.moves} moves'
+        render_str = (f'Render: {self.compositor.rows_composed} rows {self.renderer.cells_emitted} cells '
+                      f'{self.renderer.calls_emitted} calls')
+        return _str, render_str
+
+    def _get_profiler_info(self):
+        # таблица пересчитывается не чаще PROFILER_REFRESH, чтобы не сортировать замеры каждый кадр
+        if not self.show_profiler:
+            return ()
+        if self.clock - self._profiler_time >= self.PROFILER_REFRESH - self.EVENT_TOLERANCE:
+            self._profiler_time = self.clock
+            self._profiler_lines = tuple(self.profiler.report())
+        return self._profiler_lines
 
     def _draw_battle_screen(self):
         self.battle.draw()
@@ -430,95 +968,94 @@ class Game:
         self.losescr.draw()
 
     def _draw_menu_screen(self):
-        self.scr.clear()
         self.menuscr.draw()
 
     def _draw_tutorial_ui(self):
-        self._draw_at(Vec2(16, 1), '↑', Color.Cyan)
-        self._draw_at(Vec2(1, 2), 'Количество фонарей', Color.Cyan)
-        self._draw_at(Vec2(1, 3), 'и их уровень', Color.Cyan)
-        self._draw_at(Vec2(1, 4), 'Чем больше уровень', Color.Cyan)
-        self._draw_at(Vec2(1, 5), 'тем дальше видно', Color.Cyan)
-
-        self._draw_at(Vec2(26, 1), '↑', Color.Cyan)
-        self._draw_at(Vec2(20, 2), 'Ваше здоровье', Color.Cyan)
-        self._draw_at(Vec2(20, 3), 'Если оно', Color.Cyan)
-        self._draw_at(Vec2(20, 4), 'опустится до 0', Color.Cyan)
-        self._draw_at(Vec2(20, 5), 'вы проиграете', Color.Cyan)
-
-        self._draw_at(Vec2(36, 1), '↑', Color.Cyan)
-        self._draw_at(Vec2(36, 2), 'Время обнаружения', Color.Cyan)
-        self._draw_at(Vec2(36, 3), 'Это время, за которое', Color.Cyan)
-        self._draw_at(Vec2(36, 4), 'можно безопасно взломать', Color.Cyan)
-        self._draw_at(Vec2(36, 5), 'систему защиты', Color.Cyan)
-
-        self._draw_at(Vec2(self.SCR_W - 3, 1), '↑', Color.Cyan)
-        self._draw_at(Vec2(self.SCR_W - 23, 2), 'Количество украденных', Color.Cyan)
-        self._draw_at(Vec2(self.SCR_W - 23, 3), 'средств', Color.Cyan)
-
-        self._draw_at(Vec2(2, 12), '↑', Color.Cyan)
-        self._draw_at(Vec2(1, 13), '@ - это вы.', Color.Cyan)
-        self._draw_at(Vec2(1, 14), 'Вы - компьютерный вирус', Color.Cyan)
-        self._draw_at(Vec2(1, 15), 'в банковской системе.', Color.Cyan)
-        self._draw_at(Vec2(1, 16), 'Ваша цель - украсть', Color.Cyan)
-        self._draw_at(Vec2(1, 17), 'как можно больше средств.', Color.Cyan)
-
-        self._draw_at(Vec2(1, 19), 'Используйте стрелки,', Color.Cyan)
-        self._draw_at(Vec2(1, 20), 'чтобы передвигаться.', Color.Cyan)
-        self._draw_at(Vec2(1, 22), 'Используйте Q,', Color.Cyan)
-        self._draw_at(Vec2(1, 23), 'чтобы оставить фонарь.', Color.Cyan)
-        self._draw_at(Vec2(1, 24), 'Тут темновато, это', Color.Cyan)
-        self._draw_at(Vec2(1, 25), 'поможет ориентироваться.', Color.Cyan)
-        self._draw_at(Vec2(1, 26), 'Они восстанавливаются при', Color.Cyan)
-        self._draw_at(Vec2(1, 27), 'переходе на новый уровень.', Color.Cyan)
-
-        self._draw_at(Vec2(29, 12), '↑', Color.Cyan)
-        self._draw_at(Vec2(28, 13), '§ - это процессы', Color.Cyan)
-        self._draw_at(Vec2(28, 14), 'защитной системы.', Color.Cyan)
-        self._draw_at(Vec2(28, 15), 'Взламывайте их,', Color.Cyan)
-        self._draw_at(Vec2(28, 16), 'чтобы украсть', Color.Cyan)
-        self._draw_at(Vec2(28, 17), 'средства.', Color.Cyan)
-        self._draw_at(Vec2(28, 19), 'Если получили урон,', Color.Cyan)
-        self._draw_at(Vec2(28, 20), 'подбирайте +, чтобы', Color.Cyan)
-        self._draw_at(Vec2(28, 21), 'восстановить HP.', Color.Cyan)
-
-        self._draw_at(Vec2(49, 12), '↑', Color.Cyan)
-        self._draw_at(Vec2(49, 13), '■ - это контейнеры', Color.Cyan)
-        self._draw_at(Vec2(49, 14), 'с улучшениями.', Color.Cyan)
-        self._draw_at(Vec2(49, 15), 'Могут содержать:', Color.Cyan)
-        self._draw_at(Vec2(49, 16), '-улучшение фонарей', Color.Cyan)
-        self._draw_at(Vec2(49, 17), '-увеличение кол-ва', Color.Cyan)
-        self._draw_at(Vec2(49, 18), 'фонарей', Color.Cyan)
-        self._draw_at(Vec2(49, 19), '-увеличение HP', Color.Cyan)
-        self._draw_at(Vec2(49, 20), '-увеличение DT', Color.Cyan)
-
-        self._draw_at(Vec2(69, 13), 'Пройдите до конца коридора.', Color.Cyan)
-        self._draw_at(Vec2(69, 14), 'Здесь вы увидите дверь,', Color.Cyan)
-        self._draw_at(Vec2(69, 15), 'ведущую на следующий уровень.', Color.Cyan)
-        self._draw_at(Vec2(69, 16), 'Проходите через них, чтобы', Color.Cyan)
-        self._draw_at(Vec2(69, 17), 'продвигаться дальше.', Color.Cyan)
-        self._draw_at(Vec2(69, 18), 'С каждым уровнем', Color.Cyan)
-        self._draw_at(Vec2(69, 19), 'через систему будет сложнее', Color.Cyan)
-        self._draw_at(Vec2(69, 20), 'пробираться и защитные', Color.Cyan)
-        self._draw_at(Vec2(69, 21), 'системы будут становиться', Color.Cyan)
-        self._draw_at(Vec2(69, 22), 'устойчивее ко взлому.', Color.Cyan)
+        self._draw_at(Vec2(16, 1), '↑', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 2), 'Количество фонарей', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 3), 'и их уровень', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 4), 'Чем больше уровень', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 5), 'тем дальше видно', Color.Cyan, self.tutorial_layer)
+
+        self._draw_at(Vec2(26, 1), '↑', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(20, 2), 'Ваше здоровье', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(20, 3), 'Если оно', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(20, 4), 'опустится до 0', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(20, 5), 'вы проиграете', Color.Cyan, self.tutorial_layer)
+
+        self._draw_at(Vec2(36, 1), '↑', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(36, 2), 'Время обнаружения', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(36, 3), 'Это время, за которое', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(36, 4), 'можно безопасно взломать', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(36, 5), 'систему защиты', Color.Cyan, self.tutorial_layer)
+
+        self._draw_at(Vec2(self.SCR_W - 3, 1), '↑', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(self.SCR_W - 23, 2), 'Количество украденных', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(self.SCR_W - 23, 3), 'средств', Color.Cyan, self.tutorial_layer)
+
+        self._draw_at(Vec2(2, 12), '↑', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 13), '@ - это вы.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 14), 'Вы - компьютерный вирус', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 15), 'в банковской системе.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 16), 'Ваша цель - украсть', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 17), 'как можно больше средств.', Color.Cyan, self.tutorial_layer)
+
+        self._draw_at(Vec2(1, 19), 'Используйте стрелки,', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 20), 'чтобы передвигаться.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 22), 'Используйте Q,', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 23), 'чтобы оставить фонарь.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 24), 'Тут темновато, это', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 25), 'поможет ориентироваться.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 26), 'Они восстанавливаются при', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(1, 27), 'переходе на новый уровень.', Color.Cyan, self.tutorial_layer)
+
+        self._draw_at(Vec2(29, 12), '↑', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(28, 13), '§ - это процессы', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(28, 14), 'защитной системы.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(28, 15), 'Взламывайте их,', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(28, 16), 'чтобы украсть', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(28, 17), 'средства.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(28, 19), 'Если получили урон,', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(28, 20), 'подбирайте +, чтобы', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(28, 21), 'восстановить HP.', Color.Cyan, self.tutorial_layer)
+
+        self._draw_at(Vec2(49, 12), '↑', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(49, 13), '■ - это контейнеры', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(49, 14), 'с улучшениями.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(49, 15), 'Могут содержать:', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(49, 16), '-улучшение фонарей', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(49, 17), '-увеличение кол-ва', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(49, 18), 'фонарей', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(49, 19), '-увеличение HP', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(49, 20), '-увеличение DT', Color.Cyan, self.tutorial_layer)
+
+        self._draw_at(Vec2(69, 13), 'Пройдите до конца коридора.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(69, 14), 'Здесь вы увидите дверь,', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(69, 15), 'ведущую на следующий уровень.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(69, 16), 'Проходите через них, чтобы', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(69, 17), 'продвигаться дальше.', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(69, 18), 'С каждым уровнем', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(69, 19), 'через систему будет сложнее', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(69, 20), 'пробираться и защитные', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(69, 21), 'системы будут становиться', Color.Cyan, self.tutorial_layer)
+        self._draw_at(Vec2(69, 22), 'устойчивее ко взлому.', Color.Cyan, self.tutorial_layer)
 
     def _draw_tutorial_battle_ui(self):
-        self._draw_at(Vec2(36, 5), 'Уровень защитной системы определяет сложность взлома,', Color.Cyan)
-        self._draw_at(Vec2(36, 6), 'цену ошибки при взломе (вы получаете урон при ошибках)', Color.Cyan)
-        self._draw_at(Vec2(36, 7), 'и размер награды.', Color.Cyan)
-        self._draw_at(Vec2(36, 9), 'Время до обнаружения: по истечение этого времени вы начнете', Color.Cyan)
-        self._draw_at(Vec2(36, 10), 'получать постоянный урон.', Color.Cyan)
-        self._draw_at(Vec2(36, 12), 'Чтобы взломать систему, вводите код слева.', Color.Cyan)
-        self._draw_at(Vec2(36, 13), 'Каждую строчку нужно отправлять на исполнение,', Color.Cyan)
-        self._draw_at(Vec2(36, 14), 'нажимая Enter.', Color.Cyan)
-        self._draw_at(Vec2(36, 16), 'Попробуйте!', Color.Cyan)
+        self._draw_at(Vec2(36, 5), 'Уровень защитной системы определяет сложность взлома,', Color.Cyan, self.tutorial_battle_layer)
+        self._draw_at(Vec2(36, 6), 'цену ошибки при взломе (вы получаете урон при ошибках)', Color.Cyan, self.tutorial_battle_layer)
+        self._draw_at(Vec2(36, 7), 'и размер награды.', Color.Cyan, self.tutorial_battle_layer)
+        self._draw_at(Vec2(36, 9), 'Время до обнаружения: по истечение этого времени вы начнете', Color.Cyan, self.tutorial_battle_layer)
+        self._draw_at(Vec2(36, 10), 'получать постоянный урон.', Color.Cyan, self.tutorial_battle_layer)
+        self._draw_at(Vec2(36, 12), 'Чтобы взломать систему, вводите код слева.', Color.Cyan, self.tutorial_battle_layer)
+        self._draw_at(Vec2(36, 13), 'Каждую строчку нужно отправлять на исполнение,', Color.Cyan, self.tutorial_battle_layer)
+        self._draw_at(Vec2(36, 14), 'нажимая Enter.', Color.Cyan, self.tutorial_battle_layer)
+        self._draw_at(Vec2(36, 16), 'Попробуйте!', Color.Cyan, self.tutorial_battle_layer)
 
 
 class Menu:
-    def __init__(self, game: Game, stdscr: curses.window):
+    def __init__(self, game: Game, surface: Surface):
         self.game = game
-        self.scr = stdscr
+        self.surface = surface
         self.width = self.game.SCR_W
         self.height = self.game.SCR_H
 
@@ -527,44 +1064,47 @@ class Menu:
 
         self.start_or_exit = True
 
+        self.widgets = WidgetGroup(game.screen_layer, [
+            # фон меню закрывает собой все нижние слои
+            Widget(lambda: None, lambda _: [(0, y, ' ' * self.width, 0) for y in range(self.height)]),
+            Widget(lambda: self.logo_underline, self._render_logo),
+            Widget(lambda: self.start_or_exit, self._render_items),
+            Widget(lambda: self.game.game_record, self._render_record),
+        ])
+
+    def invalidate(self):
+        self.widgets.invalidate()
+
+    def next_blink_timeout(self):
+        return self.logo_t + 1 - self.game.clock
+
     def draw(self):
-        self._draw_logo()
+        t = self.game.clock
+        if t - self.logo_t >= 1:
+            self.logo_underline = not self.logo_underline
+            self.logo_t = t
+        self.widgets.draw()
 
-        str_start = 'Начать'
-        str_exit = 'Выход'
+    def _items_x(self):
+        return self.width//2 - max(len('Начать'), len('Выход'))
 
-        if self.start_or_exit:
+    def _render_items(self, start_or_exit):
+        if start_or_exit:
             clr1, clr2 = Color.BlackOnWhite, Color.White
         else:
             clr1, clr2 = Color.White, Color.BlackOnWhite
-        offset = max(len(str_start), len(str_exit))
-        x = self.width//2 - offset
-        y = self.height//2
-        self.draw_at(Vec2(x, y), str_start, clr1)
-        x = self.width//2 - offset
-        y = self.height//2 + 2
-        self.draw_at(Vec2(x, y), str_exit, clr2)
-
-        if self.game.game_record > 0:
-            x = self.width//2 - offset
-            y = self.height//2 - 2
-            str_record = f'Рекорд: {self.game.game_record}¥'
-            self.draw_at(Vec2(x, y), str_record, Color.White)
-
-    def _draw_logo(self):
-        t = time.time()
-        if t - self.logo_t > 1:
-            self.logo_underline = not self.logo_underline
-            self.logo_t = t
+        x = self._items_x()
+        return [(x, self.height//2, 'Начать', clr1), (x, self.height//2 + 2, 'Выход', clr2)]
 
-        logo = LOGO_1 if self.logo_underline else LOGO_2
-        logo_len = len(logo[0])
-        padding = (self.width - logo_len)//2
-        for i, logo_str in enumerate(logo):
-            self.draw_at(Vec2(padding, 1+i), logo_str, Color.Green)
+    def _render_record(self, game_record):
+        if game_record <= 0:
+            return []
+        return [(self._items_x(), self.height//2 - 2, f'Рекорд: {game_record}¥', Color.White)]
 
-    def draw_at(self, coords: Vec2, string, color):
-        self.scr.addstr(coords.y, coords.x, string, self.game.clr(color))
+    def _render_logo(self, logo_underline):
+        logo = LOGO_1 if logo_underline else LOGO_2
+        padding = (self.width - len(logo[0]))//2
+        return [(padding, 1+i, logo_str, Color.Green) for i, logo_str in enumerate(logo)]
 
     def input_key(self, key_code):
         if key_code in (curses.KEY_UP, curses.KEY_DOWN):
@@ -577,9 +1117,9 @@ class Menu:
 
 
 class Lose:
-    def __init__(self, game: Game, stdscr: curses.window, upleft: Vec2, botright: Vec2, score):
+    def __init__(self, game: Game, surface: Surface, upleft: Vec2, botright: Vec2, score):
         self.game = game
-        self.scr = stdscr
+        self.surface = surface
         self.score = score
         self.offset = upleft
         size = botright - upleft + 1
@@ -588,41 +1128,25 @@ class Lose:
 
         self.restart_or_menu = True
 
+        self.widgets = WidgetGroup(game.screen_layer, [
+            Frame(0, 0, self.width, self.height),
+            Label(2, 2, lambda: Message.text(Message.LoseTitle)),
+            Label(2, 4, lambda: self.score, lambda score: f'Заработано: {score}¥'),
+            Widget(lambda: self.restart_or_menu, self._render_items),
+        ], upleft.x, upleft.y)
+
+    def invalidate(self):
+        self.widgets.invalidate()
+
     def draw(self):
-        self.draw_window()
-        self.draw_ui()
-
-    def draw_at(self, coords: Vec2, string, color):
-        coords += self.offset
-        self.scr.addstr(coords.y, coords.x, string, self.game.clr(color))
-
-    def draw_window(self, color=Color.White):
-        for y in range(self.height):
-            for x in range(self.width):
-                if y == 0 and x == 0:
-                    self.draw_at(Vec2(x, y), '╔', color)
-                elif y == 0 and x == self.width-1:
-                    self.draw_at(Vec2(x, y), '╗', color)
-                elif y == self.height-1 and x == 0:
-                    self.draw_at(Vec2(x, y), '╚', color)
-                elif y == self.height-1 and x == self.width-1:
-                    self.draw_at(Vec2(x, y), '╝', color)
-                elif y == 0 or y == self.height-1:
-                    self.draw_at(Vec2(x, y), '═', color)
-                elif x == 0 or x == self.width-1:
-                    self.draw_at(Vec2(x, y), '║', color)
-                else:
-                    self.draw_at(Vec2(x, y), ' ', color)
-
-    def draw_ui(self):
-        self.draw_at(Vec2(2, 2), Message.text(Message.LoseTitle), Color.White)
-        self.draw_at(Vec2(2, 4), f'Заработано: {self.score}¥', Color.White)
-        if self.restart_or_menu:
-            self.draw_at(Vec2(2, 6), f'Начать заново', Color.BlackOnWhite)
-            self.draw_at(Vec2(2, 8), f'Меню', Color.White)
+        self.widgets.draw()
+
+    def _render_items(self, restart_or_menu):
+        if restart_or_menu:
+            clr1, clr2 = Color.BlackOnWhite, Color.White
         else:
-            self.draw_at(Vec2(2, 6), f'Начать заново', Color.White)
-            self.draw_at(Vec2(2, 8), f'Меню', Color.BlackOnWhite)
+            clr1, clr2 = Color.White, Color.BlackOnWhite
+        return [(2, 6, 'Начать заново', clr1), (2, 8, 'Меню', clr2)]
 
     def input_key(self, key_code):
         if key_code in (curses.KEY_UP, curses.KEY_DOWN):
@@ -635,11 +1159,11 @@ class Lose:
 
 
 class Battle:
-    def __init__(self, game: Game, stdscr: curses.window, upleft: Vec2, botright: Vec2):
+    def __init__(self, game: Game, surface: Surface, upleft: Vec2, botright: Vec2):
         self.game = game
         self.enemy = self.game.current_enemy
         self.player = self.game.player
-        self.scr = stdscr
+        self.surface = surface
         self.offset = upleft
         size = botright - upleft + 1
         self.width = size.x
@@ -655,75 +1179,56 @@ class Battle:
         self.next_err = False
         self.input = ''
 
+        self.widgets = WidgetGroup(game.screen_layer, [
+            Frame(0, 0, self.width, self.height, separators=(self.height-3,)),
+            Label(self.input_coords.x, self.input_coords.y, lambda: self.input,
+                  lambda value: value.ljust(self.width-2)),
+            Label(1, 1, self.enemy.get_difficulty,
+                  lambda difficulty: f'Взлом процесса защитной системы (ур. {difficulty})'),
+            Label(1, 2, lambda: f'{self.player.get_time_left():.0f}',
+                  lambda time_left: f'Времени до обнаружения: {time_left} сек'.ljust(self.width-2)),
+            Widget(lambda: (self.cur_line, self.cur_symbol, self.next_err, self.game.debug_ui), self._render_code),
+        ], upleft.x, upleft.y)
+
     def is_done(self):
         return self._done
 
+    def invalidate(self):
+        self.widgets.invalidate()
+
     def draw(self):
-        self.draw_window()
-        self.draw_input()
-        self.draw_ui()
-
-    def draw_at(self, coords: Vec2, string, color):
-        coords += self.offset
-        self.scr.addstr(coords.y, coords.x, string, self.game.clr(color))
-
-    def draw_window(self, color=Color.White):
-        for y in range(self.height):
-            for x in range(self.width):
-                if y == 0 and x == 0:
-                    self.draw_at(Vec2(x, y), '╔', color)
-                elif y == 0 and x == self.width-1:
-                    self.draw_at(Vec2(x, y), '╗', color)
-                elif y == self.height-1 and x == 0:
-                    self.draw_at(Vec2(x, y), '╚', color)
-                elif y == self.height-1 and x == self.width-1:
-                    self.draw_at(Vec2(x, y), '╝', color)
-                elif y == self.height-3 and x == 0:
-                    self.draw_at(Vec2(x, y), '╠', color)
-                elif y == self.height-3 and x == self.width-1:
-                    self.draw_at(Vec2(x, y), '╣', color)
-                elif y == 0 or y == self.height-3 or y == self.height-1:
-                    self.draw_at(Vec2(x, y), '═', color)
-                elif x == 0 or x == self.width-1:
-                    self.draw_at(Vec2(x, y), '║', color)
-                else:
-                    self.draw_at(Vec2(x, y), ' ', color)
+        self.widgets.draw()
 
-    def draw_ui(self):
-        self.draw_at(Vec2(1, 1), f'Взлом процесса защитной системы (ур. {self.enemy.get_difficulty()})', Color.White)
-        self.draw_at(Vec2(1, 2), f'Времени до обнаружения: {self.player.get_time_left():.0f} сек'.ljust(self.width-2),
-                     Color.White)
+    def _render_code(self, state):
+        cur_line, cur_symbol, next_err, debug_ui = state
+        spans = []
         for i, line in enumerate(self.code_list):
-            coords = Vec2(3, 4 + i)
-            if i < self.cur_line:
-                self.draw_at(coords, line[:-1], Color.Green)
-            elif i == self.cur_line:
-                line_part = line[:self.cur_symbol]
-                self.draw_at(coords, line_part, Color.Green)
-                coords.x += len(line_part)
-                self.draw_at(coords, line[self.cur_symbol:-1], Color.White)
-                if self.next_err:
-                    if self.cur_symbol < len(line)-1:
-                        self.draw_at(coords, line[self.cur_symbol], Color.Red)
+            x, y = 3, 4 + i
+            if i < cur_line:
+                spans.append((x, y, line[:-1], Color.Green))
+            elif i == cur_line:
+                line_part = line[:cur_symbol]
+                spans.append((x, y, line_part, Color.Green))
+                x += len(line_part)
+                spans.append((x, y, line[cur_symbol:-1], Color.White))
+                if next_err:
+                    if cur_symbol < len(line)-1:
+                        spans.append((x, y, line[cur_symbol], Color.Red))
                     else:
-                        coords = Vec2(self.input_coords.x, self.input_coords.y)
                         msg = 'PRESS ENTER TO SEND'
-                        coords.x = self.width - 2 - len(msg)
-                        self.draw_at(coords, msg, Color.Red)
+                        spans.append((self.width - 2 - len(msg), self.input_coords.y, msg, Color.Red))
             else:
-                if self.game.debug_ui:
-                    self.draw_at(coords, line[:-1], Color.White)
+                if debug_ui:
+                    spans.append((x, y, line[:-1], Color.White))
                 else:
-                    self.draw_at(coords, '?'*len(line), Color.White)
-
-    def draw_input(self):
-        self.draw_at(self.input_coords, self.input.ljust(self.width-2), Color.White)
+                    spans.append((x, y, '?'*len(line), Color.White))
+        return spans
 
     def input_key(self, key_code):
         if key_code == 10:
             key = '\n'
         else:
-            key = curses.keyname(key_code).decode('UTF-8')
+            key = self.surface.keyname(key_code)
         if key in ('KEY_DOWN', 'KEY_UP', 'KEY_RIGHT', 'KEY_LEFT'):
             return
 
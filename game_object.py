@@ -1,4 +1,5 @@
 import random
+from collections import OrderedDict
 
 from color import Color
 from vec2 import Vec2
@@ -27,26 +28,41 @@ class Heal(GameObject):
         self._color = Color.Yellow
 
 
-class LightSource(GameObject):
-    def __init__(self, radius):
-        super().__init__()
-        self._char = 'Ï'
-        self._color = Color.Yellow
-        self._radius = radius
+class LightKernel:
+    # Неизменяемая таблица освещенности вокруг источника: offsets - тройки
+    # (dx, dy, сила), rows - для каждой строки dy непрерывный отрезок
+    # (dy, dx начала, байты силы). Клетки с нулевой силой не хранятся.
+    __slots__ = ('radius', 'symbol_aspect', 'offsets', 'rows', '_deltas')
+
+    def __init__(self, radius, symbol_aspect, offsets=None):
+        self.radius = radius
+        self.symbol_aspect = symbol_aspect
+        if offsets is None:
+            offsets = self._compute(radius, symbol_aspect)
+        self.offsets = offsets
+        rows = {}
+        for dx, dy, strength in self.offsets:
+            rows.setdefault(dy, {})[dx] = strength
+        self.rows = tuple((dy, min(row), bytes(row.get(dx, 0) for dx in range(min(row), max(row) + 1)))
+                          for dy, row in sorted(rows.items()))
+        self._deltas = {}
+
+    def masked(self, visible):
+        # ядро, в котором оставлены только клетки (dx, dy) из visible
+        return LightKernel(self.radius, self.symbol_aspect,
+                           tuple(offset for offset in self.offsets if (offset[0], offset[1]) in visible))
 
-    def set_radius(self, value):
-        self._radius = value
-
-    def get_lighting(self, symbol_aspect):
-        r0 = self._radius ** 2
-        x_from = -int(self._radius / symbol_aspect)
-        x_to = int((self._radius + 1) / symbol_aspect)
+    @staticmethod
+    def _compute(radius, symbol_aspect):
+        r0 = radius ** 2
+        x_from = -int(radius / symbol_aspect)
+        x_to = int((radius + 1) / symbol_aspect)
         r1 = r0 * 0.8
         r2 = r0 * 0.6
         r3 = r0 * 0.4
         result = []
         tmp = set()
-        for y in range(-self._radius, self._radius + 1):
+        for y in range(-radius, radius + 1):
             for x in range(x_from, x_to):
                 xi = x * symbol_aspect
                 xy = xi**2 + y**2
@@ -63,8 +79,56 @@ class LightSource(GameObject):
                 x = int(x * 0.95)
                 if (x, y) not in tmp:
                     tmp.add((x, y))
-                    result.append((Vec2(x, y), value))
-        return result
+                    if value > 0:
+                        result.append((x, y, value))
+        return tuple(result)
+
+    def deltas(self, width):
+        # смещения в плоском построчном буфере ширины width
+        deltas = self._deltas.get(width)
+        if deltas is None:
+            deltas = self._deltas[width] = tuple((dy * width + dx, strength) for dx, dy, strength in self.offsets)
+        return deltas
+
+
+class LightKernelCache:
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self._kernels = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, radius, symbol_aspect):
+        key = (radius, symbol_aspect)
+        kernel = self._kernels.get(key)
+        if kernel is not None:
+            self.hits += 1
+            self._kernels.move_to_end(key)
+            return kernel
+        self.misses += 1
+        kernel = self._kernels[key] = LightKernel(radius, symbol_aspect)
+        if len(self._kernels) > self.max_size:
+            self._kernels.popitem(last=False)
+        return kernel
+
+
+class LightSource(GameObject):
+    kernel_cache = LightKernelCache()
+
+    def __init__(self, radius):
+        super().__init__()
+        self._char = 'Ï'
+        self._color = Color.Yellow
+        self._radius = radius
+
+    def set_radius(self, value):
+        self._radius = value
+
+    def get_radius(self):
+        return self._radius
+
+    def get_lighting(self, symbol_aspect):
+        return self.kernel_cache.get(self._radius, symbol_aspect)
 
 
 class Chest(GameObject):
@@ -73,18 +137,25 @@ class Chest(GameObject):
     MaxHPUpgrage = 3
     BattleTimeUpgrade = 4
 
-    def __init__(self):
+    def __init__(self, upgrade=None):
         super().__init__()
         self._char = '■'
         self._color = Color.Yellow
+        # None - улучшение выбирается при открытии
+        self.upgrade = upgrade
 
     @classmethod
-    def get_upgrade(cls):
-        return random.choice([cls.LightLevelUpgrade, cls.LightsAmountUpgrade, cls.BattleTimeUpgrade, cls.MaxHPUpgrage])
+    def roll_upgrade(cls, rng=random):
+        return rng.choice([cls.LightLevelUpgrade, cls.LightsAmountUpgrade, cls.BattleTimeUpgrade, cls.MaxHPUpgrage])
+
+    def get_upgrade(self):
+        if self.upgrade is None:
+            return self.roll_upgrade()
+        return self.upgrade
 
 
 class Enemy(GameObject):
-    def __init__(self, difficulty):
+    def __init__(self, difficulty, code_seed=None):
         super().__init__()
         self._char = '§'
         self._color = Color.Red
@@ -93,9 +164,15 @@ class Enemy(GameObject):
             difficulty = 0
         self.dmg = difficulty
         self.difficulty = difficulty
+        # с сидом код врага одинаков при каждом бое, без него берется из глобального random
+        self.code_seed = code_seed
+        # направление патрулирования; chasing - враг идет к игроку, см. enemy_ai.py
+        self.direction = (0, 0)
+        self.chasing = False
 
     def get_code_list(self):
-        return self._generate_code(self.difficulty)
+        rng = random if self.code_seed is None else random.Random(self.code_seed)
+        return self._generate_code(self.difficulty, rng)
 
     def get_difficulty(self):
         return self.difficulty
@@ -104,49 +181,49 @@ class Enemy(GameObject):
         return self.dmg
 
     @classmethod
-    def _generate_code(cls, difficulty):
+    def _generate_code(cls, difficulty, rng=random):
         result = []
-        result.append(cls._gen_code_block_hack())
+        result.append(cls._gen_code_block_hack(rng))
         if difficulty >= 10:
-            result.append(cls._gen_code_block_10())
+            result.append(cls._gen_code_block_10(rng))
         if difficulty >= 9:
-            result.append(cls._gen_code_block_9())
+            result.append(cls._gen_code_block_9(rng))
         if difficulty >= 8:
-            result.append(cls._gen_code_block_8())
+            result.append(cls._gen_code_block_8(rng))
         if difficulty >= 7:
-            result.append(cls._gen_code_block_7())
+            result.append(cls._gen_code_block_7(rng))
         if difficulty >= 6:
-            result.append(cls._gen_code_block_6())
+            result.append(cls._gen_code_block_6(rng))
         if difficulty >= 5:
-            result.append(cls._gen_code_block_5())
+            result.append(cls._gen_code_block_5(rng))
         if difficulty >= 4:
-            result.append(cls._gen_code_block_4())
+            result.append(cls._gen_code_block_4(rng))
         if difficulty >= 3:
-            result.append(cls._gen_code_block_3())
+            result.append(cls._gen_code_block_3(rng))
         if difficulty >= 2:
-            result.append(cls._gen_code_block_2())
+            result.append(cls._gen_code_block_2(rng))
         if difficulty >= 1:
-            result.append(cls._gen_code_block_1(difficulty))
-        result.append(cls._gen_code_block_kill())
+            result.append(cls._gen_code_block_1(difficulty, rng))
+        result.append(cls._gen_code_block_kill(rng))
         for i in range(len(result)):
             result[i] += '\n'
         return result
 
     @staticmethod
-    def _gen_code_block_hack():
-        func_name = random.choice(['hack', 'init_hack', 'startHack'])
-        arg = random.choice(['enemy', 'script', 'process', 'defence', ''])
+    def _gen_code_block_hack(rng):
+        func_name = rng.choice(['hack', 'init_hack', 'startHack'])
+        arg = rng.choice(['enemy', 'script', 'process', 'defence', ''])
         return f'{func_name}({arg})'
 
     @staticmethod
-    def _gen_code_block_kill():
-        func_name = random.choice(['kill', 'finish', 'exit'])
-        arg = random.choice(['enemy', 'script', 'process', '', '', ''])
+    def _gen_code_block_kill(rng):
+        func_name = rng.choice(['kill', 'finish', 'exit'])
+        arg = rng.choice(['enemy', 'script', 'process', '', '', ''])
         return f'{func_name}({arg})'
 
     @staticmethod
-    def _gen_code_block_1(diff):
-        func_name = random.choice(['password', 'pass', 'enter_pass', 'enter_password', 'EnterPass'])
+    def _gen_code_block_1(diff, rng):
+        func_name = rng.choice(['password', 'pass', 'enter_pass', 'enter_password', 'EnterPass'])
         a = 'abcdefghijklmnopqrstuvwxyz'
         d = '0123456789'
         s = '!?.#@$%_-&'
@@ -160,57 +237,57 @@ class Enemy(GameObject):
             alphabets = [a, a.upper(), d, s]
         pwd = ''
         for i in range(diff+2):
-            alph = random.choice(alphabets)
-            pwd += random.choice(alph)
+            alph = rng.choice(alphabets)
+            pwd += rng.choice(alph)
         return f'{func_name}({pwd})'
 
     @staticmethod
-    def _gen_code_block_2():
-        func_name = random.choice(['brute_force', 'BruteForceHack', 'start_brute_force'])
+    def _gen_code_block_2(rng):
+        func_name = rng.choice(['brute_force', 'BruteForceHack', 'start_brute_force'])
         return f'{func_name}()'
 
     @staticmethod
-    def _gen_code_block_3():
-        func_name = random.choice(['CodeInjection', 'InjectCode', 'inject_aob'])
-        arg = random.choice(['', 'func', 'aob'])
+    def _gen_code_block_3(rng):
+        func_name = rng.choice(['CodeInjection', 'InjectCode', 'inject_aob'])
+        arg = rng.choice(['', 'func', 'aob'])
         return f'{func_name}({arg})'
 
     @staticmethod
-    def _gen_code_block_4():
-        func_name = random.choice(['MemScan', 'MemoryScan', 'mem_scan', 'memory_scan'])
-        arg = hex(int.from_bytes(random.randbytes(4), 'big'))
-        if random.randint(0, 1):
+    def _gen_code_block_4(rng):
+        func_name = rng.choice(['MemScan', 'MemoryScan', 'mem_scan', 'memory_scan'])
+        arg = hex(int.from_bytes(rng.randbytes(4), 'big'))
+        if rng.randint(0, 1):
             arg = arg.upper()
         return f'{func_name}({arg})'
 
     @staticmethod
-    def _gen_code_block_5():
-        func_name = random.choice(['ForkBomb', 'startForkBomb', 'fork_bomb'])
-        arg = str(random.randint(10**4, 10**6))
+    def _gen_code_block_5(rng):
+        func_name = rng.choice(['ForkBomb', 'startForkBomb', 'fork_bomb'])
+        arg = str(rng.randint(10**4, 10**6))
         return f'{func_name}({arg})'
 
     @staticmethod
-    def _gen_code_block_6():
-        func_name = random.choice(['buffer_overflow', 'BufferOverflow', 'InitBufferOF'])
+    def _gen_code_block_6(rng):
+        func_name = rng.choice(['buffer_overflow', 'BufferOverflow', 'InitBufferOF'])
         return f'{func_name}()'
 
     @staticmethod
-    def _gen_code_block_7():
-        func_name = random.choice(['InjectSQL', 'SQLInjection', 'StartSQLI'])
-        arg = random.choice(['', 'query', 'sql_query'])
+    def _gen_code_block_7(rng):
+        func_name = rng.choice(['InjectSQL', 'SQLInjection', 'StartSQLI'])
+        arg = rng.choice(['', 'query', 'sql_query'])
         return f'{func_name}({arg})'
 
     @staticmethod
-    def _gen_code_block_8():
-        func_name = random.choice(['startMITM', 'ManInTheMiddle', 'MITM', 'HackMITM'])
+    def _gen_code_block_8(rng):
+        func_name = rng.choice(['startMITM', 'ManInTheMiddle', 'MITM', 'HackMITM'])
         return f'{func_name}()'
 
     @staticmethod
-    def _gen_code_block_9():
-        func_name = random.choice(['shatter_attack', 'startShatterAttack', 'shatterAtt'])
+    def _gen_code_block_9(rng):
+        func_name = rng.choice(['shatter_attack', 'startShatterAttack', 'shatterAtt'])
         return f'{func_name}()'
 
     @staticmethod
-    def _gen_code_block_10():
-        func_name = random.choice(['openPorts', 'lookForPort', 'find_open_port'])
+    def _gen_code_block_10(rng):
+        func_name = rng.choice(['openPorts', 'lookForPort', 'find_open_port'])
         return f'{func_name}()'
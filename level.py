@@ -1,9 +1,15 @@
 import random
 
 from game_object import GameObject, LightSource, Enemy, Chest, Heal
+from placement import Placer
 from color import Color
 from vec2 import Vec2
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class Tile:
     id_Floor = 0
@@ -31,33 +37,170 @@ class Tile:
 
 
 class Level:
+    # флаги слоя занятости клеток
+    OCC_OBJECT = 1
+    OCC_ENEMY = 2
+    OCC_LIGHT = 4
+    # сторона корзины пространственного хеша врагов, клеток
+    ENEMY_BUCKET = 16
+
     def __init__(self, lvl_map):
-        self._map = lvl_map
+        height = len(lvl_map)
+        width = len(lvl_map[0])
+        tiles = bytearray(width * height)
+        for y, row in enumerate(lvl_map):
+            tiles[y * width:(y + 1) * width] = bytes(row)
+        self._init_grid(width, height, tiles)
+
+    @classmethod
+    def from_buffer(cls, width, height, tiles, spawn_point: Vec2 = None, exits=None):
+        # тайлы не копируются: уровень работает прямо с переданным буфером
+        level = cls.__new__(cls)
+        level._init_grid(width, height, tiles, spawn_point, exits)
+        return level
+
+    def _init_grid(self, width, height, tiles, spawn_point: Vec2 = None, exits=None):
+        if len(tiles) != width * height:
+            raise Exception("Tile buffer size does not match level size")
+        self._tiles = tiles
+        # увеличивается при каждом изменении тайлов
+        self._tiles_version = 0
+        # (версия тайлов, клетки выхода); известны с генерации или ищутся по требованию
+        self._exits = None if exits is None else (0, list(exits))
+        self._width = width
+        self._height = height
+        # объекты и враги хранятся по индексу клетки y * width + x,
+        # а _occupancy позволяет проверить клетку без обращения к словарям
+        self._occupancy = bytearray(width * height)
         self._objects = {}
         self._enemies = {}
-        self._light_sources = []
-        self._height = len(self._map)
-        self._width = len(self._map[0])
-        self._spawn_point: Vec2 = None
-        for y in range(self._height):
-            for x in range(self._width):
-                if self._map[y][x] == Tile.id_PlayerSpawn:
-                    self._spawn_point = Vec2(x, y)
-                    self._map[y][x] = Tile.id_Floor
+        # корзина (x // ENEMY_BUCKET, y // ENEMY_BUCKET) -> {индекс клетки: враг}
+        self._enemy_buckets = {}
+        self._light_sources = {}
+        # увеличивается при каждом изменении набора источников света
+        self._lights_version = 0
+        # увеличивается при каждом изменении объектов или врагов
+        self._entities_version = 0
+        # увеличивается при каждом изменении врагов, от них зависят пути в обход врагов
+        self._enemies_version = 0
+        # увеличивается при каждом изменении объектов
+        self._objects_version = 0
+        self._light_layer = None
+        self._placer: Placer = None
+        self._spawn_point: Vec2 = spawn_point
         if self._spawn_point is None:
-            raise Exception("No spawn point on level")
+            index = tiles.find(Tile.id_PlayerSpawn)
+            if index == -1:
+                raise Exception("No spawn point on level")
+            self._spawn_point = Vec2.unpack(index, width)
+            tiles[index] = Tile.id_Floor
+
+    def __getstate__(self):
+        # слой света и индекс свободных клеток строятся заново по требованию
+        state = self.__dict__.copy()
+        state['_light_layer'] = None
+        state['_placer'] = None
+        if isinstance(state.get('_tiles'), memoryview):
+            # уровень из файла смотрит в его отображение в память, в снимок идет копия
+            state['_tiles'] = bytearray(self._tiles)
+        return state
 
     def get_spawn_point(self):
         return self._spawn_point
 
-    def _get_tile_id(self, coords: Vec2):
-        if 0 <= coords.x <= self._width and 0 <= coords.y <= self._height:
-            return self._map[coords.y][coords.x]
+    def get_width(self):
+        return self._width
+
+    def get_height(self):
+        return self._height
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self._width and 0 <= y < self._height
+
+    def get_tile_id(self, x, y):
+        if 0 <= x < self._width and 0 <= y < self._height:
+            return self._tiles[y * self._width + x]
         else:
             raise Exception("Attempt of getting tile id outside the map")
 
+    def set_tile_id(self, x, y, tile_id):
+        if not self.in_bounds(x, y):
+            raise Exception("Attempt of setting tile id outside the map")
+        self._tiles[y * self._width + x] = tile_id
+        self._tiles_version += 1
+
+    def get_tiles_version(self):
+        return self._tiles_version
+
+    def get_exits(self):
+        if self._exits is None or self._exits[0] != self._tiles_version:
+            tiles = self._tiles if isinstance(self._tiles, bytearray) else bytes(self._tiles)
+            exits = []
+            index = tiles.find(Tile.id_Exit)
+            while index != -1:
+                exits.append(Vec2.unpack(index, self._width))
+                index = tiles.find(Tile.id_Exit, index + 1)
+            self._exits = (self._tiles_version, exits)
+        return self._exits[1]
+
+    def _get_tile_id(self, coords: Vec2):
+        return self.get_tile_id(coords[0], coords[1])
+
+    def get_tiles_view(self):
+        return memoryview(self._tiles)
+
+    def get_row(self, y, x_from=0, x_to=None):
+        if x_to is None:
+            x_to = self._width
+        if not 0 <= y < self._height:
+            raise Exception("Attempt of getting row outside the map")
+        x_from = max(x_from, 0)
+        x_to = min(x_to, self._width)
+        start = y * self._width
+        return memoryview(self._tiles)[start + x_from:start + max(x_from, x_to)]
+
+    def get_region(self, x, y, width, height):
+        # строки региона, обрезанного по границам карты
+        view = memoryview(self._tiles)
+        x_from = max(x, 0)
+        x_to = max(min(x + width, self._width), x_from)
+        rows = []
+        for row_y in range(max(y, 0), min(y + height, self._height)):
+            start = row_y * self._width
+            rows.append(view[start + x_from:start + x_to])
+        return rows
+
+    def _index(self, coords: Vec2):
+        x, y = coords
+        if 0 <= x < self._width and 0 <= y < self._height:
+            return Vec2.pack_xy(x, y, self._width)
+        return -1
+
+    def get_occupancy(self, x, y):
+        return self._occupancy[y * self._width + x]
+
+    def get_occupancy_row(self, y, x_from=0, x_to=None):
+        if x_to is None:
+            x_to = self._width
+        start = y * self._width
+        return memoryview(self._occupancy)[start + x_from:start + x_to]
+
+    def is_free(self, x, y):
+        index = y * self._width + x
+        return self._tiles[index] == Tile.id_Floor and self._occupancy[index] == 0
+
+    def _get_occupancy_at(self, index):
+        return self._occupancy[index]
+
+    def _set_occupancy_at(self, index, value):
+        self._occupancy[index] = value
+
     def get_all(self, coords: Vec2):
-        return self.get_tile(coords), self.get_object(coords), self.get_enemy(coords)
+        tile = self.get_tile(coords)
+        index = coords.pack(self._width)
+        if self._get_occupancy_at(index) == 0:
+            return tile, None, None
+        return tile, self._objects.get(index, None), self._enemies.get(index, None)
 
     def get_tile(self, coords: Vec2):
         tile_id = self._get_tile_id(coords)
@@ -65,82 +208,200 @@ class Level:
         return tile_id, tile_ch, tile_clr
 
     def place_object(self, coords: Vec2, obj: GameObject):
+        index = self._index(coords)
+        if index == -1:
+            raise Exception("Attempt of placing object outside the map")
         obj.move_to(coords)
+        occupancy = self._get_occupancy_at(index) | self.OCC_OBJECT
+        replaced_light = self._light_sources.pop(index, None)
+        if replaced_light is not None:
+            self._lights_version += 1
+            occupancy &= ~self.OCC_LIGHT
+            if self._light_layer is not None:
+                self._light_layer.remove_source(replaced_light)
         if isinstance(obj, LightSource):
-            self._light_sources.append(obj)
-        if coords in self._objects:
-            cur_obj = self._objects[coords]
-            if isinstance(cur_obj, LightSource):
-                self._light_sources.remove(cur_obj)
-        self._objects[coords] = obj
+            self._light_sources[index] = obj
+            self._lights_version += 1
+            occupancy |= self.OCC_LIGHT
+            if self._light_layer is not None:
+                self._light_layer.add_source(obj)
+        self._objects[index] = obj
+        self._entities_version += 1
+        self._objects_version += 1
+        self._set_occupancy_at(index, occupancy)
 
     def remove_object(self, obj: GameObject):
-        coords = obj.get_coords()
-        if coords in self._objects and self._objects[coords] == obj:
-            del self._objects[coords]
-            if isinstance(obj, LightSource):
-                self._light_sources.remove(obj)
+        index = self._index(obj.get_coords())
+        if index != -1 and self._objects.get(index, None) is obj:
+            del self._objects[index]
+            self._entities_version += 1
+            self._objects_version += 1
+            if self._light_sources.pop(index, None) is not None:
+                self._lights_version += 1
+                if self._light_layer is not None:
+                    self._light_layer.remove_source(obj)
+            self._set_occupancy_at(index, self._get_occupancy_at(index) & ~(self.OCC_OBJECT | self.OCC_LIGHT))
+
+    def get_light_layer(self):
+        return self._light_layer
+
+    def set_light_layer(self, light_layer):
+        # слой запеченного света неподвижных источников, обновляется
+        # при каждом place_object и remove_object
+        self._light_layer = light_layer
+        if light_layer is not None:
+            # запекание может подгрузить новые источники, они добавятся через place_object
+            for light_source in list(self._light_sources.values()):
+                light_layer.add_source(light_source)
 
     def get_object(self, coords: Vec2):
-        return self._objects.get(coords, None)
+        return self._objects.get(self._index(coords), None)
+
+    def get_object_at(self, index):
+        return self._objects.get(index, None)
+
+    def get_entities_version(self):
+        return self._entities_version
+
+    def get_enemies_version(self):
+        return self._enemies_version
+
+    def get_objects_version(self):
+        return self._objects_version
+
+    def get_lights_version(self):
+        return self._lights_version
 
     def get_light_sources(self):
-        return self._light_sources
+        return list(self._light_sources.values())
+
+    def get_objects(self):
+        return list(self._objects.values())
+
+    def get_enemies(self):
+        return list(self._enemies.values())
 
     def place_enemy(self, coords: Vec2, enemy: Enemy):
+        # враг, который уже стоит на уровне, переносится; враг в клетке coords заменяется
+        index = self._index(coords)
+        if index == -1:
+            raise Exception("Attempt of placing enemy outside the map")
+        self.remove_enemy(enemy)
+        replaced = self._enemies.get(index, None)
+        if replaced is not None:
+            self.remove_enemy(replaced)
         enemy.move_to(coords)
-        self._enemies[coords] = enemy
+        self._enemies[index] = enemy
+        self._enemy_buckets.setdefault(self._enemy_bucket(coords), {})[index] = enemy
+        self._entities_version += 1
+        self._enemies_version += 1
+        self._set_occupancy_at(index, self._get_occupancy_at(index) | self.OCC_ENEMY)
 
     def remove_enemy(self, enemy: Enemy):
         coords = enemy.get_coords()
-        if coords in self._enemies and self._enemies[coords] == enemy:
-            del self._enemies[coords]
+        index = self._index(coords)
+        if index != -1 and self._enemies.get(index, None) is enemy:
+            del self._enemies[index]
+            key = self._enemy_bucket(coords)
+            bucket = self._enemy_buckets[key]
+            del bucket[index]
+            if not bucket:
+                del self._enemy_buckets[key]
+            self._entities_version += 1
+            self._enemies_version += 1
+            self._set_occupancy_at(index, self._get_occupancy_at(index) & ~self.OCC_ENEMY)
+
+    def move_enemy(self, enemy: Enemy, coords: Vec2):
+        # шаг врага в свободную от других врагов клетку
+        index = self._index(coords)
+        if index == -1:
+            raise Exception("Attempt of moving enemy outside the map")
+        if self._enemies.get(self._index(enemy.get_coords()), None) is not enemy:
+            raise Exception("Attempt of moving enemy that is not on the level")
+        if index in self._enemies:
+            raise Exception("Attempt of moving enemy into another enemy")
+        self.place_enemy(coords, enemy)
+
+    def _enemy_bucket(self, coords):
+        size = self.ENEMY_BUCKET
+        return coords[0] // size, coords[1] // size
+
+    def get_enemies_near(self, x, y, radius):
+        # враги не дальше radius по каждой оси, поиск только по соседним корзинам
+        size = self.ENEMY_BUCKET
+        result = []
+        for by in range((y - radius) // size, (y + radius) // size + 1):
+            for bx in range((x - radius) // size, (x + radius) // size + 1):
+                bucket = self._enemy_buckets.get((bx, by))
+                if bucket is None:
+                    continue
+                for enemy in bucket.values():
+                    ex, ey = enemy.get_coords()
+                    if abs(ex - x) <= radius and abs(ey - y) <= radius:
+                        result.append(enemy)
+        return result
 
     def get_enemy(self, coords: Vec2):
-        return self._enemies.get(coords, None)
-
-    def spawn_objects(self):
-        for obj_to_spawn in [Chest(), LightSource(3), Heal(), Heal()]:
-            ys = list(range(2, self._height-3))
-            random.shuffle(ys)
-            to_break = False
-            for y in ys:
-                xs = list(range(int(self._width*0.2), self._width-3))
-                random.shuffle(xs)
-                for x in xs:
-                    (tile_id, _, _), obj, enemy = self.get_all(Vec2(x, y))
-                    if tile_id == Tile.id_Floor and obj is None and enemy is None:
-                        if random.randint(0, 100) < 10:
-                            self.place_object(Vec2(x, y), obj_to_spawn)
-                            to_break = True
-                            break
-                if to_break:
-                    break
-
-    def spawn_enemy(self, amount, diff):
+        return self._enemies.get(self._index(coords), None)
+
+    def get_enemy_at(self, index):
+        return self._enemies.get(index, None)
+
+    def get_placer(self, rng=random):
+        # индекс свободных клеток строится один раз и переиспользуется
+        if self._placer is None:
+            self._placer = Placer(self, int(self._width*0.2), 2, self._width-3, self._height-3, rng)
+        self._placer.rng = rng
+        return self._placer
+
+    def spawn_objects(self, min_spawn_distance=0, rng=random, loot_rng=None):
+        # loot_rng - поток, из которого заранее выбирается содержимое сундуков
+        placer = self.get_placer(rng)
+        if min_spawn_distance > 0:
+            placer.exclude_radius(self._spawn_point, min_spawn_distance)
+        failed = []
+        chest = Chest(None if loot_rng is None else Chest.roll_upgrade(loot_rng))
+        for obj_to_spawn in [chest, LightSource(3), Heal(), Heal()]:
+            if placer.place_object(obj_to_spawn) is None:
+                failed.append(obj_to_spawn)
+        return failed
+
+    def spawn_enemy(self, amount, diff, min_spawn_distance=0, min_spacing=0, rng=random, code_rng=None):
+        # code_rng - поток, из которого врагам выдаются сиды их кода
+        placer = self.get_placer(rng)
+        if min_spawn_distance > 0:
+            placer.exclude_radius(self._spawn_point, min_spawn_distance)
+        failed = []
         for i in range(amount):
-            enemy_to_spawn = Enemy(diff + random.randint(-1, 1))
-            ys = list(range(2, self._height-3))
-            random.shuffle(ys)
-            to_break = False
-            for y in ys:
-                xs = list(range(int(self._width*0.2), self._width-3))
-                random.shuffle(xs)
-                for x in xs:
-                    (tile_id, _, _), obj, enemy = self.get_all(Vec2(x, y))
-                    if tile_id == Tile.id_Floor and obj is None and enemy is None:
-                        if random.randint(0, 100) < 10:
-                            self.place_enemy(Vec2(x, y), enemy_to_spawn)
-                            to_break = True
-                            break
-                if to_break:
-                    break
+            code_seed = None if code_rng is None else code_rng.getrandbits(64)
+            enemy_to_spawn = Enemy(diff + rng.randint(-1, 1), code_seed)
+            if placer.place_enemy(enemy_to_spawn, Enemy, min_spacing) is None:
+                failed.append(enemy_to_spawn)
+        return failed
 
 
 class LevelGenerator:
-    WALL = 1
-    UNVISITED = 0
-    VISITED = 2
+    # лабиринт строится прямо в буфере тайлов уровня
+    WALL = Tile.id_Wall
+    VISITED = Tile.id_Floor
+    UNVISITED = 255
+
+    # Лабиринт строится по областям REGION x REGION клеток, область - это чанк
+    # ChunkedLevel: в каждой области свой поиск в глубину, а области связаны
+    # проходами по дереву, построенному тем же поиском. Области независимы, поэтому
+    # большой лабиринт NumPy строит всеми областями сразу, по шагу за итерацию.
+    REGION = 32
+    # с этого числа областей NumPy быстрее поочередного построения
+    NUMPY_MIN_REGIONS = 128
+    # Направления 0-3: +x, -x, +y, -y. Соседи клетки кодируются числом
+    # sum(state * 3 ** d), state: 0 - не посещен, 1 - посещен, 2 - чужая область.
+    # FORWARD[code * 12 + u] - непосещенный сосед номер u % count среди count
+    # непосещенных, ATTEMPT - так же среди посещенных; 4 - таких соседей нет.
+    FORWARD = bytes(([d for d in range(4) if code // 3 ** d % 3 == 0] or [4] * 12)[u % max(1, sum(
+        1 for d in range(4) if code // 3 ** d % 3 == 0))] for code in range(81) for u in range(12))
+    ATTEMPT = bytes(([d for d in range(4) if code // 3 ** d % 3 == 1] or [4] * 12)[u % max(1, sum(
+        1 for d in range(4) if code // 3 ** d % 3 == 1))] for code in range(81) for u in range(12))
+    _modulo_tables = {}
 
     @staticmethod
     def generate_test_room(width, height):
@@ -184,103 +445,259 @@ class LevelGenerator:
         level.place_object(Vec2(51, 8), LightSource(3))
         return level
 
+    @staticmethod
+    def _chance_to_probability(chance):
+        # вероятность события randint(0, 100)/100 < chance
+        return LevelGenerator._chance_to_count(chance) / 101
+
+    @staticmethod
+    def _chance_to_count(chance):
+        # событие randint(0, 100)/100 < chance - это randint(0, 100) < count
+        return sum(1 for k in range(101) if k / 100 < chance)
+
     @classmethod
-    def destroy_random_walls(cls, raw_lvl, chance):
-        for y in range(len(raw_lvl)-1):
-            for x in range(len(raw_lvl[0])-1):
-                if raw_lvl[y][x] == cls.WALL:
-                    if random.randint(0, 100)/100 < chance:
-                        raw_lvl[y][x] = cls.VISITED
+    def random_bytes(cls, rng, count, modulo):
+        # count случайных байт, равномерных на [0, modulo): байты, из-за которых
+        # остаток от деления был бы неравномерным, отбрасываются
+        tables = cls._modulo_tables.get(modulo)
+        if tables is None:
+            limit = 256 - 256 % modulo
+            tables = cls._modulo_tables[modulo] = (bytes(b % modulo for b in range(256)), bytes(range(limit, 256)))
+        table, rejected = tables
+        result = bytearray()
+        while len(result) < count:
+            need = count - len(result)
+            result += rng.randbytes(need + need // 16 + 16).translate(table, rejected)
+        del result[count:]
+        return result
 
     @classmethod
-    def generate_exit(cls, raw_lvl):
-        x = len(raw_lvl[0]) - 1
-        while True:
-            y = random.randint(1, len(raw_lvl)-1)
-            if raw_lvl[y][x-1] == cls.VISITED:
-                return Vec2(x, y)
+    def destroy_random_walls(cls, grid, width, height, chance, rng=random):
+        # стены внутри [1, width-3] x [1, height-3] разрушаются независимо, каждая
+        # с вероятностью события randint(0, 100)/100 < chance; маска случайных
+        # байт накладывается на строку целиком через битовые операции
+        count = cls._chance_to_count(chance)
+        row_len = width - 3
+        if count == 0 or row_len <= 0 or height <= 3:
+            return
+        to_mask = bytes(cls.WALL if b < count else cls.VISITED for b in range(256))
+        masks = cls.random_bytes(rng, row_len * (height - 3), 101).translate(to_mask)
+        is_wall = bytes(1 if b == cls.WALL else 0 for b in range(256))
+        for y in range(1, height - 2):
+            start = y * width + 1
+            row = grid[start:start + row_len]
+            mask = int.from_bytes(masks[(y - 1) * row_len:y * row_len], 'little')
+            walls = int.from_bytes(row.translate(is_wall), 'little')
+            destroyed = (mask & walls).to_bytes(row_len, 'little')
+            # WALL == 1 и VISITED == 0, поэтому разрушение это вычитание маски
+            grid[start:start + row_len] = (int.from_bytes(row, 'little') - int.from_bytes(destroyed, 'little')).to_bytes(row_len, 'little')
 
     @classmethod
-    def generate_labirinth(cls, width, height, chance_destroy_wall):
-        raw_lvl = []
-        for y in range((height-2)):
-            raw_lvl.append([])
-            for x in range((width-2)):
-                if x % 2 == 0 and y % 2 == 0:
-                    raw_lvl[y].append(cls.UNVISITED)
-                else:
-                    raw_lvl[y].append(cls.WALL)
-        spawn_point_x = 0
-        while True:
-            spawn_point_y = random.randint(0, len(raw_lvl)-1)
-            if spawn_point_y % 2 == 0:
-                break
+    def generate_exit(cls, grid, width, height, rng=random):
+        # выход в предпоследнем столбце напротив прохода
+        x = width - 2
+        candidates = [y for y in range(2, height - 1) if grid[y * width + x - 1] == cls.VISITED]
+        if len(candidates) == 0:
+            y = rng.randrange(1, height - 1, 2)
+            grid[y * width + x - 1] = cls.VISITED
+            return Vec2(x, y)
+        return Vec2(x, rng.choice(candidates))
 
-        raw_lvl[spawn_point_y][spawn_point_x] = cls.VISITED
-        current = Vec2(spawn_point_x, spawn_point_y)
-        stack = []
-        while True:
-            # создаем дополнительные пути
-            neighbor = cls.pick_neighbor(raw_lvl, current, cls.VISITED)
-            if neighbor is not None and random.randint(0, 100)/100 < chance_destroy_wall:
-                wall_to_remove = neighbor - current
-                wall_to_remove /= 2
-                wall_to_remove += current
-                raw_lvl[wall_to_remove.y][wall_to_remove.x] = cls.VISITED
-
-            # построение лабиринта
-            neighbor = cls.pick_neighbor(raw_lvl, current, cls.UNVISITED)
-            if neighbor is not None:
-                stack.append(current)
-                wall_to_remove = neighbor - current
-                wall_to_remove /= 2
-                wall_to_remove += current
-                raw_lvl[wall_to_remove.y][wall_to_remove.x] = cls.VISITED
-                raw_lvl[neighbor.y][neighbor.x] = cls.VISITED
-                current = neighbor
-            else:
-                if len(stack) == 0:
-                    break
-                current = stack.pop()
-            if len(stack) == 0:
-                break
+    @classmethod
+    def generate_labirinth(cls, width, height, chance_destroy_wall, rng=random):
+        spawn_point = Vec2(1, 1 + rng.randrange(0, height - 2, 2))
+        tiles = cls.carve_maze(width, height, spawn_point, chance_destroy_wall, rng)
+        exit_coords = cls.generate_exit(tiles, width, height, rng)
+        cls.destroy_random_walls(tiles, width, height, chance_destroy_wall, rng)
+        tiles[spawn_point.y * width + spawn_point.x] = Tile.id_Floor
+        tiles[exit_coords.y * width + exit_coords.x] = Tile.id_Exit
+        return Level.from_buffer(width, height, tiles, spawn_point, (exit_coords,))
 
-        exit_coords = cls.generate_exit(raw_lvl)
-        cls.destroy_random_walls(raw_lvl, chance_destroy_wall)
+    @classmethod
+    def carve_maze(cls, width, height, start: Vec2, chance_destroy_wall, rng=random, use_numpy=None):
+        # Клетки лабиринта лежат на нечетных координатах, start тоже. Поиск в глубину
+        # в области делает ровно 2 * клеток - 1 итераций: шаг вперед, возврат по стеку
+        # или остановку. На итерации i область берет i-е байты своих потоков случайных
+        # чисел, поэтому порядок построения областей на результат не влияет.
+        # use_numpy=None - NumPy, если он установлен и областей достаточно много.
+        size = cls.REGION
+        cells_x = (width - 1) // 2
+        cells_y = (height - 1) // 2
+        grid = bytearray((cls.WALL,)) * (width * height)
+        for cy in range(cells_y):
+            row = (2 * cy + 1) * width
+            grid[row + 1:row + 2 * cells_x:2] = bytes((cls.VISITED,)) * cells_x
+        if cells_x <= 0 or cells_y <= 0:
+            return grid
+        regions_x = -(-cells_x // size)
+        regions_y = -(-cells_y // size)
+        regions = []
+        start_x = (start.x - 1) // 2
+        start_y = (start.y - 1) // 2
+        for ry in range(regions_y):
+            for rx in range(regions_x):
+                w = min(size, cells_x - rx * size)
+                h = min(size, cells_y - ry * size)
+                if rx == start_x // size and ry == start_y // size:
+                    first = (start_y - ry * size) * w + start_x - rx * size
+                else:
+                    first = rng.randrange(w * h)
+                regions.append((rx * size, ry * size, w, h, first))
+        cls._link_regions(grid, width, regions, regions_x, regions_y, start_y // size * regions_x + start_x // size, rng)
+
+        count = cls._chance_to_count(chance_destroy_wall)
+        iterations = 2 * min(size, cells_x) * min(size, cells_y) - 1
+        total = len(regions) * iterations
+        choices = cls.random_bytes(rng, total, 12)
+        hits = picks = None
+        if count:
+            hits = cls.random_bytes(rng, total, 101).translate(bytes(int(b < count) for b in range(256)))
+            picks = cls.random_bytes(rng, total, 12)
+        if use_numpy is None:
+            use_numpy = np is not None and len(regions) >= cls.NUMPY_MIN_REGIONS
+        if use_numpy:
+            cls._carve_regions_numpy(grid, width, regions, iterations, choices, hits, picks)
+        else:
+            for k, region in enumerate(regions):
+                cls._carve_region(grid, width, region, k * iterations, choices, hits, picks)
+        return grid
 
-        lvl = []
-        for y in range(height):
-            lvl.append([])
-            for x in range(width):
-                lvl[y].append(Tile.id_Wall)
-
-        for y, row in enumerate(raw_lvl):
-            y += 1
-            for x, val in enumerate(row):
-                x += 1
-                if val == cls.WALL:
-                    lvl[y][x] = Tile.id_Wall
-                elif val == cls.VISITED:
-                    lvl[y][x] = Tile.id_Floor
-        lvl[spawn_point_y+1][spawn_point_x+1] = Tile.id_PlayerSpawn
-        lvl[exit_coords.y+1][exit_coords.x+1] = Tile.id_Exit
-        return Level(lvl)
+    @classmethod
+    def _link_regions(cls, grid, width, regions, regions_x, regions_y, first, rng):
+        # дерево областей тем же поиском в глубину; между соседями по дереву
+        # пробивается проход в случайной клетке общей границы
+        visited = {first}
+        stack = [first]
+        while stack:
+            k = stack[-1]
+            rx = k % regions_x
+            ry = k // regions_x
+            options = [n for n, ok in ((k + 1, rx + 1 < regions_x), (k - 1, rx > 0),
+                                       (k + regions_x, ry + 1 < regions_y), (k - regions_x, ry > 0))
+                       if ok and n not in visited]
+            if not options:
+                stack.pop()
+                continue
+            n = rng.choice(options)
+            visited.add(n)
+            stack.append(n)
+            a, b = min(k, n), max(k, n)
+            x0, y0, w, h, _ = regions[b]
+            if a // regions_x == b // regions_x:
+                grid[(2 * (y0 + rng.randrange(h)) + 1) * width + 2 * x0] = cls.VISITED
+            else:
+                grid[2 * y0 * width + 2 * (x0 + rng.randrange(w)) + 1] = cls.VISITED
 
     @classmethod
-    def list_of_neighbors(cls, raw_lvl, current):
-        neighbors = []
-        for offset in [Vec2(0, 2), Vec2(0, -2), Vec2(2, 0), Vec2(-2, 0)]:
-            coords = current + offset
-            if 0 <= coords.y < len(raw_lvl) and 0 <= coords.x < len(raw_lvl[0]):
-                if raw_lvl[coords.y][coords.x] in (cls.UNVISITED, cls.VISITED):
-                    neighbors.append((coords, raw_lvl[coords.y][coords.x]))
-        return neighbors
+    def _carve_region(cls, grid, width, region, offset, choices, hits, picks):
+        # поиск в глубину по клеткам области с рамкой чужих клеток вокруг
+        x0, y0, w, h, first = region
+        pitch = w + 2
+        state = bytearray(b'\2') * (pitch * (h + 2))
+        for y in range(1, h + 1):
+            state[y * pitch + 1:y * pitch + w + 1] = bytes(w)
+        steps = (1, -1, pitch, -pitch)
+        walls = (1, -1, width, -width)
+        forward = cls.FORWARD
+        attempt = cls.ATTEMPT
+        current = (first // w + 1) * pitch + first % w + 1
+        tile = (2 * (y0 + first // w) + 1) * width + 2 * (x0 + first % w) + 1
+        state[current] = 1
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for i in range(offset, offset + 2 * w * h - 1):
+            code = (state[current + 1] + 3 * state[current - 1] + 9 * state[current + pitch]
+                    + 27 * state[current - pitch]) * 12
+            # создаем дополнительные пути
+            if hits is not None and hits[i]:
+                d = attempt[code + picks[i]]
+                if d < 4:
+                    grid[tile + walls[d]] = cls.VISITED
+            d = forward[code + choices[i]]
+            if d < 4:
+                push(current)
+                push(tile)
+                grid[tile + walls[d]] = cls.VISITED
+                current += steps[d]
+                tile += 2 * walls[d]
+                state[current] = 1
+            elif stack:
+                tile = pop()
+                current = pop()
 
     @classmethod
-    def pick_neighbor(cls, raw_lvl, current, neighbor_type):
-        neighbors = cls.list_of_neighbors(raw_lvl, current)
-        neighbors = list(filter(lambda x: x[1] == neighbor_type, neighbors))
-        if len(neighbors) == 0:
-            return None
-        else:
-            return random.choice(neighbors)[0]
+    def _carve_regions_numpy(cls, grid, width, regions, iterations, choices, hits, picks):
+        # тот же поиск, что в _carve_region, во всех областях сразу: итерация цикла -
+        # итерация поиска в каждой области; состояния областей лежат подряд
+        size = cls.REGION
+        count = len(regions)
+        pitch = size + 2
+        area = pitch * pitch
+        state = np.full((count, size + 2, pitch), 2, np.uint8)
+        for k, (x0, y0, w, h, first) in enumerate(regions):
+            state[k, 1:h + 1, 1:w + 1] = 0
+        state = state.ravel()
+        steps = np.array((1, -1, pitch, -pitch, 0))
+        forward = np.frombuffer(cls.FORWARD, np.uint8)
+        attempt = np.frombuffer(cls.ATTEMPT, np.uint8)
+        choices = np.frombuffer(choices, np.uint8).reshape(count, iterations).T.copy()
+        if hits is not None:
+            hits = np.frombuffer(hits, np.uint8).reshape(count, iterations).T.astype(bool)
+            picks = np.frombuffer(picks, np.uint8).reshape(count, iterations).T.copy()
+        w = np.array([region[2] for region in regions])
+        first = np.array([region[4] for region in regions])
+        current = np.arange(count) * area + (first // w + 1) * pitch + first % w + 1
+        state[current] = 1
+        # направление шага, которым пришли в клетку, и пробитые дополнительные проходы
+        parent = np.full(len(state), 4, np.uint8)
+        extra = []
+        stack = np.zeros(count * size * size, np.int64)
+        depth = np.arange(count) * size * size
+        active = np.arange(count)
+        for i in range(iterations):
+            if not len(active):
+                break
+            code = (state[current + 1] + 3 * state[current - 1] + 9 * state[current + pitch]
+                    + 27 * state[current - pitch]).astype(np.intp) * 12
+            if hits is not None:
+                hit = hits[i, active]
+                if hit.any():
+                    d = attempt[code[hit] + picks[i, active[hit]]]
+                    extra.append((current[hit] << 3) + d)
+            d = forward[code + choices[i, active]]
+            moved = d < 4
+            following = current + steps[d]
+            state[following] = 1
+            parent[following[moved]] = d[moved]
+            pushing = depth[active[moved]]
+            stack[pushing] = current[moved]
+            depth[active[moved]] = pushing + 1
+            back = np.nonzero(~moved)[0]
+            if len(back):
+                walkers = active[back]
+                left = depth[walkers] > walkers * size * size
+                depth[walkers[left]] -= 1
+                following[back[left]] = stack[depth[walkers[left]]]
+                if not left.all():
+                    keep = np.ones(len(active), bool)
+                    keep[back[~left]] = False
+                    active = active[keep]
+                    following = following[keep]
+            current = following
+
+        def tiles(cells):
+            k, local = np.divmod(cells, area)
+            ly, lx = np.divmod(local, pitch)
+            x0 = np.array([region[0] for region in regions])[k]
+            y0 = np.array([region[1] for region in regions])[k]
+            return (2 * (y0 + ly - 1) + 1) * width + 2 * (x0 + lx - 1) + 1
+
+        walls = np.array((1, -1, width, -width, 0))
+        view = np.frombuffer(grid, np.uint8)
+        cells = np.nonzero(parent < 4)[0]
+        view[tiles(cells) - walls[parent[cells]]] = cls.VISITED
+        if extra:
+            extra = np.concatenate(extra)
+            extra = extra[(extra & 7) < 4]
+            view[tiles(extra >> 3) + walls[extra & 7]] = cls.VISITED
@@ -0,0 +1,175 @@
+import mmap
+import struct
+import sys
+
+from game_object import LightSource, Enemy, Chest, Heal
+from level import Level
+from vec2 import Vec2
+
+# Формат уровня (little-endian):
+#   заголовок LEVEL_HEADER
+#   тайлы width * height байт построчно
+#   таблица сущностей entity_count записей ENTITY: тип, дополнительный байт,
+#   параметр, x, y и сид кода врага. Дополнительный байт сундука - улучшение
+#   (0 - выбирается при открытии), врага - ENTITY_HAS_SEED, если у него есть сид
+# Формат набора уровней:
+#   заголовок PACK_HEADER
+#   индекс count записей PACK_ENTRY (смещение и размер уровня от начала файла)
+#   уровни подряд
+
+LEVEL_MAGIC = b'CDLV'
+PACK_MAGIC = b'CDLP'
+# версия 1 не хранила улучшения сундуков и сиды кода врагов
+FORMAT_VERSION = 2
+
+LEVEL_HEADER = struct.Struct('<4sHHIIIIiI')
+ENTITY = struct.Struct('<BBhIIQ')
+PACK_HEADER = struct.Struct('<4sHHI')
+PACK_ENTRY = struct.Struct('<QQ')
+
+ENTITY_LIGHT = 1
+ENTITY_ENEMY = 2
+ENTITY_CHEST = 3
+ENTITY_HEAL = 4
+
+ENTITY_HAS_SEED = 1
+
+
+class LevelFormatError(Exception):
+    pass
+
+
+def dump_level(level: Level, level_number=0):
+    entities = []
+    for obj in level.get_objects():
+        if isinstance(obj, LightSource):
+            entities.append((ENTITY_LIGHT, 0, obj.get_radius(), obj.get_coords(), 0))
+        elif isinstance(obj, Chest):
+            entities.append((ENTITY_CHEST, obj.upgrade or 0, 0, obj.get_coords(), 0))
+        elif isinstance(obj, Heal):
+            entities.append((ENTITY_HEAL, 0, 0, obj.get_coords(), 0))
+    for enemy in level.get_enemies():
+        if enemy.code_seed is None:
+            entities.append((ENTITY_ENEMY, 0, enemy.get_difficulty(), enemy.get_coords(), 0))
+        else:
+            entities.append((ENTITY_ENEMY, ENTITY_HAS_SEED, enemy.get_difficulty(), enemy.get_coords(),
+                             enemy.code_seed))
+
+    spawn = level.get_spawn_point()
+    parts = [LEVEL_HEADER.pack(LEVEL_MAGIC, FORMAT_VERSION, LEVEL_HEADER.size,
+                               level.get_width(), level.get_height(), spawn.x, spawn.y,
+                               level_number, len(entities)),
+             bytes(level.get_tiles_view())]
+    for kind, extra, param, coords, seed in entities:
+        parts.append(ENTITY.pack(kind, extra, param, coords.x, coords.y, seed))
+    return b''.join(parts)
+
+
+def read_level_header(buffer):
+    if len(buffer) < LEVEL_HEADER.size:
+        raise LevelFormatError('Level data is too short')
+    magic, version, header_size, width, height, spawn_x, spawn_y, level_number, entity_count = \
+        LEVEL_HEADER.unpack_from(buffer)
+    if magic != LEVEL_MAGIC:
+        raise LevelFormatError('Not a level file')
+    if version != FORMAT_VERSION:
+        raise LevelFormatError(f'Unsupported level format version {version}, rebuild the level')
+    return header_size, width, height, Vec2(spawn_x, spawn_y), level_number, entity_count
+
+
+def load_level_from_buffer(buffer):
+    # тайлы уровня ссылаются на buffer без копирования
+    view = memoryview(buffer)
+    header_size, width, height, spawn_point, level_number, entity_count = read_level_header(view)
+    tiles_end = header_size + width * height
+    if len(view) < tiles_end + entity_count * ENTITY.size:
+        raise LevelFormatError('Level data is truncated')
+
+    level = Level.from_buffer(width, height, view[header_size:tiles_end], spawn_point)
+    for kind, extra, param, x, y, seed in ENTITY.iter_unpack(view[tiles_end:tiles_end + entity_count * ENTITY.size]):
+        coords = Vec2(x, y)
+        if kind == ENTITY_LIGHT:
+            level.place_object(coords, LightSource(param))
+        elif kind == ENTITY_CHEST:
+            level.place_object(coords, Chest(extra or None))
+        elif kind == ENTITY_HEAL:
+            level.place_object(coords, Heal())
+        elif kind == ENTITY_ENEMY:
+            level.place_enemy(coords, Enemy(param, seed if extra & ENTITY_HAS_SEED else None))
+        else:
+            raise LevelFormatError(f'Unknown entity type {kind}')
+    return level, level_number
+
+
+def _map_file(path):
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def save_level(path, level: Level, level_number=0):
+    with open(path, 'wb') as f:
+        f.write(dump_level(level, level_number))
+
+
+def load_level(path):
+    return load_level_from_buffer(_map_file(path))
+
+
+def write_pack(path, levels):
+    # levels: последовательность пар (level, level_number)
+    blobs = [dump_level(level, level_number) for level, level_number in levels]
+    offset = PACK_HEADER.size + PACK_ENTRY.size * len(blobs)
+    with open(path, 'wb') as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, FORMAT_VERSION, 0, len(blobs)))
+        for blob in blobs:
+            f.write(PACK_ENTRY.pack(offset, len(blob)))
+            offset += len(blob)
+        for blob in blobs:
+            f.write(blob)
+
+
+class LevelPack:
+    def __init__(self, path):
+        self._mmap = _map_file(path)
+        self._view = memoryview(self._mmap)
+        if len(self._view) < PACK_HEADER.size:
+            raise LevelFormatError('Level pack is too short')
+        magic, version, _, count = PACK_HEADER.unpack_from(self._view)
+        if magic != PACK_MAGIC:
+            raise LevelFormatError('Not a level pack')
+        if version != FORMAT_VERSION:
+            # наборы старых версий не переносятся: python level_format.py строит их заново из сида
+            raise LevelFormatError(f'Unsupported level pack version {version}, rebuild the pack')
+        index_end = PACK_HEADER.size + PACK_ENTRY.size * count
+        if len(self._view) < index_end:
+            raise LevelFormatError('Level pack index is truncated')
+        self._index = list(PACK_ENTRY.iter_unpack(self._view[PACK_HEADER.size:index_end]))
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        offset, size = self._index[i]
+        return load_level_from_buffer(self._view[offset:offset + size])
+
+
+def main(argv):
+    # python level_format.py <pack file> <levels count> [run seed]
+    from game import Game
+
+    if len(argv) < 2:
+        print('Usage: python level_format.py <pack file> <levels count> [run seed]')
+        return 1
+    path = argv[0]
+    count = int(argv[1])
+    run_seed = argv[2] if len(argv) > 2 else 0
+    levels = []
+    for level_number in range(1, count + 1):
+        levels.append((Game.build_level(level_number, Game.level_seed(run_seed, level_number)), level_number))
+    write_pack(path, levels)
+    print(f'{count} levels written to {path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,228 @@
+from array import array
+from collections import OrderedDict
+from itertools import repeat
+from operator import add, sub
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class LightMap:
+    # Карта освещенности width x height, хранится построчно в буферах,
+    # которые переиспользуются между кадрами. _sums - ненасыщенные суммы вкладов
+    # источников, поэтому вклад можно вычесть; _levels - те же значения,
+    # насыщенные на MAX_LIGHT, их и читает отрисовка.
+    MAX_LIGHT = 4
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._sums = array('H', bytes(2 * width * height))
+        self._levels = bytearray(width * height)
+        self._view = memoryview(self._levels)
+        # строки, изменившиеся с последнего take_dirty_rows
+        self._dirty_rows = set(range(height))
+
+    def take_dirty_rows(self):
+        rows = self._dirty_rows
+        self._dirty_rows = set()
+        return rows
+
+    def clear(self, value=0):
+        self._sums[:] = array('H', [value]) * len(self._sums)
+        self._levels[:] = bytes((min(value, self.MAX_LIGHT),)) * len(self._levels)
+        self._dirty_rows.update(range(self.height))
+
+    def _apply(self, kernel, x, y, op):
+        # наложение ядра источника в точке (x, y) с обрезкой по краям карты
+        width = self.width
+        sums = self._sums
+        levels = self._levels
+        max_light = repeat(self.MAX_LIGHT)
+        for dy, dx_from, strengths in kernel.rows:
+            row_y = y + dy
+            if not 0 <= row_y < self.height:
+                continue
+            x_from = x + dx_from
+            i_from = max(0, -x_from)
+            i_to = min(len(strengths), width - x_from)
+            if i_from >= i_to:
+                continue
+            start = row_y * width + x_from
+            self._dirty_rows.add(row_y)
+            values = array('H', map(op, sums[start + i_from:start + i_to], strengths[i_from:i_to]))
+            sums[start + i_from:start + i_to] = values
+            levels[start + i_from:start + i_to] = bytes(map(min, values, max_light))
+
+    def add_kernel(self, kernel, x, y):
+        self._apply(kernel, x, y, add)
+
+    def remove_kernel(self, kernel, x, y):
+        # ядро должно было быть добавлено в той же точке
+        self._apply(kernel, x, y, sub)
+
+    def copy_region(self, other, src_x, src_y, dst_x, dst_y, width, height):
+        # копия прямоугольника из карты other того же типа, без проверки границ
+        self._dirty_rows.update(range(dst_y, dst_y + height))
+        for i in range(height):
+            src = (src_y + i) * other.width + src_x
+            dst = (dst_y + i) * self.width + dst_x
+            self._sums[dst:dst + width] = other._sums[src:src + width]
+            self._levels[dst:dst + width] = other._levels[src:src + width]
+
+    def row(self, y):
+        return self._view[y * self.width:(y + 1) * self.width]
+
+
+class NumpyLightMap(LightMap):
+    # плотные ядра общие для всех карт
+    DENSE_CACHE_SIZE = 1024
+    _dense_kernels = OrderedDict()
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._sums = np.zeros((height, width), dtype=np.uint16)
+        self._levels = np.zeros((height, width), dtype=np.uint8)
+        self._dirty_rows = set(range(height))
+
+    def clear(self, value=0):
+        self._sums.fill(value)
+        self._levels.fill(min(value, self.MAX_LIGHT))
+        self._dirty_rows.update(range(self.height))
+
+    def _dense(self, kernel):
+        # ядро в виде прямоугольного массива и смещение его левого верхнего угла;
+        # ядра, обрезанные по видимости, у каждой позиции свои, поэтому ключ - сам объект
+        dense = self._dense_kernels.get(kernel)
+        if dense is not None:
+            self._dense_kernels.move_to_end(kernel)
+        else:
+            dx_from, dy_from, dx_to, dy_to = kernel_bounds(kernel)
+            values = np.zeros((dy_to - dy_from, dx_to - dx_from), dtype=np.uint16)
+            for dy, row_dx, strengths in kernel.rows:
+                values[dy - dy_from, row_dx - dx_from:row_dx - dx_from + len(strengths)] = \
+                    np.frombuffer(strengths, dtype=np.uint8)
+            dense = self._dense_kernels[kernel] = (dx_from, dy_from, values)
+            if len(self._dense_kernels) > self.DENSE_CACHE_SIZE:
+                self._dense_kernels.popitem(last=False)
+        return dense
+
+    def _apply(self, kernel, x, y, op):
+        if not kernel.rows:
+            return
+        dx_from, dy_from, values = self._dense(kernel)
+        x_from = x + dx_from
+        y_from = y + dy_from
+        kernel_h, kernel_w = values.shape
+        x0 = max(x_from, 0)
+        y0 = max(y_from, 0)
+        x1 = min(x_from + kernel_w, self.width)
+        y1 = min(y_from + kernel_h, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        self._dirty_rows.update(range(y0, y1))
+        sums = self._sums[y0:y1, x0:x1]
+        op(sums, values[y0 - y_from:y1 - y_from, x0 - x_from:x1 - x_from], out=sums)
+        np.minimum(sums, self.MAX_LIGHT, out=self._levels[y0:y1, x0:x1], casting='unsafe')
+
+    def add_kernel(self, kernel, x, y):
+        self._apply(kernel, x, y, np.add)
+
+    def remove_kernel(self, kernel, x, y):
+        self._apply(kernel, x, y, np.subtract)
+
+    def copy_region(self, other, src_x, src_y, dst_x, dst_y, width, height):
+        self._dirty_rows.update(range(dst_y, dst_y + height))
+        self._sums[dst_y:dst_y + height, dst_x:dst_x + width] = \
+            other._sums[src_y:src_y + height, src_x:src_x + width]
+        self._levels[dst_y:dst_y + height, dst_x:dst_x + width] = \
+            other._levels[src_y:src_y + height, src_x:src_x + width]
+
+    def row(self, y):
+        return memoryview(self._levels[y])
+
+
+def kernel_bounds(kernel):
+    # (dx_from, dy_from, dx_to, dy_to) - прямоугольник ядра, правая и нижняя границы не включаются
+    if not kernel.rows:
+        return 0, 0, 0, 0
+    dx_from = min(dx for _, dx, _ in kernel.rows)
+    dx_to = max(dx + len(strengths) for _, dx, strengths in kernel.rows)
+    return dx_from, kernel.rows[0][0], dx_to, kernel.rows[-1][0] + 1
+
+
+def create_light_map(width, height, use_numpy=None):
+    # use_numpy=None - NumPy, если он установлен
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        if np is None:
+            raise Exception("NumPy is not installed")
+        return NumpyLightMap(width, height)
+    return LightMap(width, height)
+
+
+class StaticLightLayer:
+    # Запеченный свет неподвижных источников уровня в координатах уровня.
+    # Хранится кусками CHUNK_SIZE x CHUNK_SIZE, которые создаются только там,
+    # куда попадает свет, поэтому подходит и для огромных уровней.
+    # get_kernel(light_source) возвращает ядро, с которым источник запекается;
+    # map_type - класс кусков, он должен совпадать с классом карты в copy_to.
+    CHUNK_SIZE = 64
+
+    def __init__(self, get_kernel, map_type=None):
+        self._get_kernel = get_kernel
+        if map_type is None:
+            map_type = NumpyLightMap if np is not None else LightMap
+        self._map_type = map_type
+        self._chunks = {}
+        self._sources = {}
+
+    def __len__(self):
+        return len(self._sources)
+
+    def _stamp(self, kernel, x, y, add):
+        size = self.CHUNK_SIZE
+        dx_from, dy_from, dx_to, dy_to = kernel_bounds(kernel)
+        for cy in range((y + dy_from) // size, (y + dy_to - 1) // size + 1):
+            for cx in range((x + dx_from) // size, (x + dx_to - 1) // size + 1):
+                chunk = self._chunks.get((cx, cy))
+                if chunk is None:
+                    chunk = self._chunks[(cx, cy)] = self._map_type(size, size)
+                if add:
+                    chunk.add_kernel(kernel, x - cx * size, y - cy * size)
+                else:
+                    chunk.remove_kernel(kernel, x - cx * size, y - cy * size)
+
+    def add_source(self, light_source):
+        if light_source in self._sources:
+            return
+        x, y = light_source.get_coords()
+        kernel = self._get_kernel(light_source)
+        self._sources[light_source] = (x, y, kernel)
+        self._stamp(kernel, x, y, True)
+
+    def remove_source(self, light_source):
+        stamped = self._sources.pop(light_source, None)
+        if stamped is not None:
+            x, y, kernel = stamped
+            self._stamp(kernel, x, y, False)
+
+    def copy_to(self, light_map: LightMap, x, y):
+        # переносит в light_map область слоя с левым верхним углом (x, y);
+        # light_map должна быть очищена
+        size = self.CHUNK_SIZE
+        for cy in range(y // size, (y + light_map.height - 1) // size + 1):
+            for cx in range(x // size, (x + light_map.width - 1) // size + 1):
+                chunk = self._chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                x_from = max(x, cx * size)
+                y_from = max(y, cy * size)
+                x_to = min(x + light_map.width, (cx + 1) * size)
+                y_to = min(y + light_map.height, (cy + 1) * size)
+                light_map.copy_region(chunk, x_from - cx * size, y_from - cy * size, x_from - x, y_from - y,
+                                      x_to - x_from, y_to - y_from)
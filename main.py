@@ -1,9 +1,48 @@
 import curses
+import sys
+import time
+
 from game import Game
+from level_format import LevelPack
+from replay import Recorder, Replay
+from vec2 import Vec2
+
+
+def pop_option(args, name):
+    # значение опции name или None; опция и значение удаляются из args
+    if name not in args:
+        return None
+    i = args.index(name)
+    if i + 1 >= len(args):
+        raise Exception(f"{name} needs a value")
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
 
 
 def main():
-    game = Game(debug=True)
+    # python main.py [набор уровней] [--profile файл.json|файл.csv] [--record файл]
+    # python main.py [набор уровней] --replay файл [--from шаг]
+    args = sys.argv[1:]
+    profile_path = pop_option(args, '--profile')
+    record_path = pop_option(args, '--record')
+    replay_path = pop_option(args, '--replay')
+    replay_from = pop_option(args, '--from')
+    level_pack = LevelPack(args[0]) if args else None
+    if replay_path is not None:
+        replay = Replay(replay_path)
+        game = Game(debug=True, level_pack=level_pack, level_size=Vec2(*replay.level_size))
+        start = 0 if replay_from is None else int(replay_from)
+        t = time.perf_counter()
+        replay.run(game, start)
+        elapsed = time.perf_counter() - t
+        print(f'Replayed {len(replay) - replay.keyframe_before(start)} of {len(replay)} steps '
+              f'in {elapsed:.2f}s, state matches the recording')
+        return
+    game = Game(debug=True, level_pack=level_pack)
+    game.profile_path = profile_path
+    if record_path is not None:
+        game.recorder = Recorder(record_path)
     curses.wrapper(game.run)
 
 
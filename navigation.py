@@ -0,0 +1,756 @@
+import heapq
+import re
+import zlib
+from array import array
+from collections import OrderedDict
+
+from level import Tile
+from vec2 import Vec2
+
+# байт тайла -> 1, если по нему можно ходить
+FLOOR_TABLE = bytes(int(tile_id == Tile.id_Floor) for tile_id in range(256))
+
+# Навигация хранит все по блокам BLOCK x BLOCK клеток, как ChunkedLevel - тайлы:
+# блок читает тайлы одного чанка, и в память попадают только блоки, до которых
+# дошел поиск. Клетка блока - индекс (y % BLOCK) * BLOCK + x % BLOCK.
+BLOCK_BITS = 6
+BLOCK = 1 << BLOCK_BITS
+BLOCK_MASK = BLOCK - 1
+BLOCK_AREA = BLOCK * BLOCK
+LAST_ROW = BLOCK_AREA - BLOCK
+EMPTY_BLOCK = bytes(BLOCK_AREA)
+# клетки у левой, правой, верхней и нижней границы блока
+LEFT_EDGE = range(0, BLOCK_AREA, BLOCK)
+RIGHT_EDGE = range(BLOCK_MASK, BLOCK_AREA, BLOCK)
+TOP_EDGE = range(BLOCK)
+BOTTOM_EDGE = range(LAST_ROW, BLOCK_AREA)
+# отрезок пола в строке блока
+FLOOR_RUN = re.compile(b'\x01+')
+
+
+def block_key(x, y):
+    return x >> BLOCK_BITS, y >> BLOCK_BITS
+
+
+def block_index(x, y):
+    return ((y & BLOCK_MASK) << BLOCK_BITS) | (x & BLOCK_MASK)
+
+
+class DistanceField:
+    # Расстояния в шагах от клеток до ближайшего источника, поиск в ширину от всех
+    # источников сразу. Поле растет лениво, по блоку фронта за раз: distance()
+    # достраивает его, пока не дойдет до запрошенной клетки, поэтому строится только
+    # то, что лежит ближе нее. Рост ограничен max_distance слоями и max_cells клетками,
+    # поле, остановленное ими раньше, чем кончились клетки, - capped. masks заменяет
+    # проходимость уровня: ключ блока -> 1 для клеток, по которым можно ходить.
+    # Источник может быть непроходимым (выход), но сквозь него пути нет.
+    # Шаг к цели - сосед с расстоянием на единицу меньше, то есть O(1).
+    UNREACHABLE = -1
+
+    def __init__(self, navigator, sources, max_distance, max_cells, avoid_enemies=False, masks=None):
+        self._navigator = navigator
+        self._avoid_enemies = avoid_enemies
+        self._masks = masks
+        self.max_distance = max_distance
+        self.max_cells = max_cells
+        self.capped = False
+        # ключ блока -> непосещенные проходимые клетки блока; посещенная обнуляется
+        self._free = {}
+        # ключ блока -> расстояния клеток блока
+        self._dist = {}
+        # число готовых слоев: расстояния до layers известны все
+        self.layers = 0
+        # обработанные блоки фронта следующего слоя
+        self.expanded = 0
+        frontier = {}
+        for x, y in sources:
+            key = block_key(x, y)
+            index = block_index(x, y)
+            dist = self._get_dist(key)
+            if dist[index] != 0:
+                dist[index] = 0
+                self._get_free(key)[index] = 0
+                frontier.setdefault(key, []).append(index)
+        self.sources = sum(len(cells) for cells in frontier.values())
+        self.visited = self.sources
+        # фронт - последний готовый слой; блоки фронта, которые еще не обработаны,
+        # и уже найденные клетки следующего слоя
+        self._frontier = frontier
+        self._queue = []
+        self._next = None
+
+    def _get_free(self, key):
+        free = self._free.get(key)
+        if free is None:
+            if self._masks is None:
+                free = bytearray(self._navigator.get_passable(key, self._avoid_enemies))
+            else:
+                free = bytearray(self._masks.get(key, EMPTY_BLOCK))
+            self._free[key] = free
+        return free
+
+    def _get_dist(self, key):
+        dist = self._dist.get(key)
+        if dist is None:
+            dist = self._dist[key] = array('i', [self.UNREACHABLE]) * BLOCK_AREA
+        return dist
+
+    def _cross(self, key, index):
+        # шаг через границу блока
+        free = self._get_free(key)
+        if free[index]:
+            free[index] = 0
+            self._get_dist(key)[index] = self.layers + 1
+            self.visited += 1
+            cells = self._next.get(key)
+            if cells is None:
+                self._next[key] = [index]
+            else:
+                cells.append(index)
+
+    def _expand(self):
+        # обрабатывает один блок фронта; False - поле достроено
+        if not self._queue:
+            if not self._frontier or self.layers >= self.max_distance or self.visited >= self.max_cells:
+                if self._frontier:
+                    self.capped = True
+                self._frontier = {}
+                return False
+            self._queue = list(self._frontier)
+            self._queue.reverse()
+            self._next = {}
+        key = self._queue.pop()
+        bx, by = key
+        free = self._get_free(key)
+        dist = self._get_dist(key)
+        d = self.layers + 1
+        out = self._next.get(key)
+        if out is None:
+            out = self._next[key] = []
+        size = len(out)
+        append = out.append
+        cross = self._cross
+        for index in self._frontier[key]:
+            x = index & BLOCK_MASK
+            if x:
+                n = index - 1
+                if free[n]:
+                    free[n] = 0
+                    append(n)
+            else:
+                cross((bx - 1, by), index + BLOCK_MASK)
+            if x != BLOCK_MASK:
+                n = index + 1
+                if free[n]:
+                    free[n] = 0
+                    append(n)
+            else:
+                cross((bx + 1, by), index - BLOCK_MASK)
+            if index >= BLOCK:
+                n = index - BLOCK
+                if free[n]:
+                    free[n] = 0
+                    append(n)
+            else:
+                cross((bx, by - 1), index + LAST_ROW)
+            if index < LAST_ROW:
+                n = index + BLOCK
+                if free[n]:
+                    free[n] = 0
+                    append(n)
+            else:
+                cross((bx, by + 1), index - LAST_ROW)
+        for i in range(size, len(out)):
+            dist[out[i]] = d
+        self.visited += len(out) - size
+        self.expanded += 1
+        if not self._queue:
+            self._frontier = {key: cells for key, cells in self._next.items() if cells}
+            self._next = None
+            self.layers = d
+            self.expanded = 0
+        return True
+
+    def grow(self, limit=None):
+        # достраивает слой: ключ блока -> клетки нового слоя; None - поле достроено,
+        # False - работа поля дошла до limit раньше, чем слой
+        layers = self.layers
+        while self.layers == layers:
+            if limit is not None and self._work() >= limit:
+                return False
+            if not self._expand():
+                return None
+        return self._frontier
+
+    def grow_to(self, layers, expanded=0):
+        while self.layers < layers and self.grow() is not None:
+            pass
+        while self.expanded < expanded and self._expand():
+            pass
+
+    def get_progress(self):
+        # докуда построено поле, см. Navigator.get_state
+        return self.layers, self.expanded
+
+    def restore(self, progress):
+        self.grow_to(*progress)
+
+    def _known(self, x, y):
+        dist = self._dist.get(block_key(x, y))
+        return self.UNREACHABLE if dist is None else dist[block_index(x, y)]
+
+    def reach(self, coords: Vec2, budget):
+        # достраивает поле до клетки coords, но не больше чем на budget клеток за вызов;
+        # новый блок стоит BLOCK_AREA клеток: на уровне из чанков это чтение, а то и
+        # генерация чанка. True - расстояние до coords известно или поле достроено
+        x, y = coords
+        limit = self._work() + budget
+        while self._known(x, y) < 0:
+            if self._work() >= limit:
+                return False
+            if not self._expand():
+                return True
+        return True
+
+    def _work(self):
+        return self.visited + len(self._free) * BLOCK_AREA
+
+    def distance(self, coords: Vec2):
+        x, y = coords
+        d = self._known(x, y)
+        while d < 0 and self._expand():
+            d = self._known(x, y)
+        return d
+
+    def next_step(self, coords: Vec2):
+        # соседняя клетка на кратчайшем пути к источнику; None - игрок уже
+        # в источнике или источник недостижим
+        d = self.distance(coords)
+        if d <= 0:
+            return None
+        # клетка получает расстояние d, когда слой d - 1 уже готов целиком
+        x, y = coords
+        for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+            if self._known(x + dx, y + dy) == d - 1:
+                return coords.add_xy(dx, dy)
+        return None
+
+
+class RouteField:
+    # Поле к источникам, которому хватает уровня целиком. Пол блока делится на
+    # компоненты связности внутри блока; компоненты соседних блоков связаны, если их
+    # клетки касаются через границу. Поиск по компонентам от источников, как A*
+    # с расстоянием в блоках до блока клетки, доходит до компоненты клетки, и поле
+    # расстояний строится только по цепочке компонент до нее: даже через весь уровень
+    # это сотни блоков, а не миллионы клеток. Путь по цепочке может быть длиннее
+    # кратчайшего. Поиск ограничен max_blocks размеченными блоками, дальше поле capped.
+    # Разметка блока стоит BLOCK_AREA клеток работы.
+    UNREACHABLE = -1
+
+    def __init__(self, navigator, sources, max_blocks, avoid_enemies=False):
+        self._navigator = navigator
+        self._avoid_enemies = avoid_enemies
+        self.max_blocks = max_blocks
+        self.sources = [tuple(coords) for coords in sources]
+        # ключ блока -> (метки компонент клеток, 0 - не пол; метка -> клетки
+        # соседних блоков, которых касается компонента)
+        self._labels = {}
+        # компонента (ключ блока, метка) -> компонента, из которой до нее дошел поиск
+        self._parents = {}
+        # (оценка пути через компоненту, -число компонент от источника, компонента)
+        self._open = []
+        # блок, к которому идет поиск, и с какого шага поиска (номер шага, блок)
+        self._target = None
+        self._targets = []
+        self.expanded = 0
+        self.capped = False
+        # клетка, до которой построена цепочка, компоненты цепочки и поле по ним
+        self._route = None
+        self._chain = set()
+        self._field = None
+        for x, y in self.sources:
+            for cx, cy in ((x, y), (x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                node = self._node(cx, cy)
+                if node is not None and node not in self._parents:
+                    self._parents[node] = None
+                    self._open.append((0, 0, node))
+
+    def _get_labels(self, key):
+        labels = self._labels.get(key)
+        if labels is not None:
+            return labels
+        # отрезки пола по строкам; касающиеся отрезки соседних строк - одна компонента
+        free = self._navigator.get_passable(key, self._avoid_enemies)
+        runs = []
+        parent = []
+
+        def find(run):
+            while parent[run] != run:
+                parent[run] = parent[parent[run]]
+                run = parent[run]
+            return run
+
+        previous = []
+        for row in range(0, BLOCK_AREA, BLOCK):
+            current = []
+            first = 0
+            for match in FLOOR_RUN.finditer(free, row, row + BLOCK):
+                start, end = match.span()
+                run = len(runs)
+                runs.append((start, end))
+                parent.append(run)
+                current.append(run)
+                while first < len(previous) and runs[previous[first]][1] + BLOCK <= start:
+                    first += 1
+                for other in previous[first:]:
+                    if runs[other][0] + BLOCK >= end:
+                        break
+                    a = find(run)
+                    b = find(other)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+            previous = current
+        cells = array('H', bytes(2 * BLOCK_AREA))
+        names = {}
+        for run, (start, end) in enumerate(runs):
+            root = find(run)
+            label = names.get(root)
+            if label is None:
+                label = names[root] = len(names) + 1
+            cells[start:end] = array('H', [label]) * (end - start)
+        bx, by = key
+        crossings = {}
+        for neighbour, here, there in (((bx - 1, by), LEFT_EDGE, RIGHT_EDGE), ((bx + 1, by), RIGHT_EDGE, LEFT_EDGE),
+                                       ((bx, by - 1), TOP_EDGE, BOTTOM_EDGE), ((bx, by + 1), BOTTOM_EDGE, TOP_EDGE)):
+            for index, other in zip(here, there):
+                label = cells[index]
+                if label:
+                    crossings.setdefault(label, []).append((neighbour, other))
+        labels = self._labels[key] = (cells, crossings)
+        return labels
+
+    def _node(self, x, y):
+        key = block_key(x, y)
+        label = self._get_labels(key)[0][block_index(x, y)]
+        return (key, label) if label else None
+
+    def _estimate(self, steps, key):
+        return steps + abs(key[0] - self._target[0]) + abs(key[1] - self._target[1])
+
+    def _set_target(self, target):
+        # новый блок цели: оценки открытых компонент пересчитываются
+        self._target = target
+        self._targets.append((self.expanded, target))
+        self._open = [(self._estimate(-steps, node[0]), steps, node) for _, steps, node in self._open]
+        heapq.heapify(self._open)
+
+    def _expand(self):
+        # раскрывает лучшую компоненту; соседние блоки сначала размечаются, по одному
+        # за вызов, чтобы шаг поиска читал не больше одного блока
+        key, label = self._open[0][2]
+        crossings = self._get_labels(key)[1].get(label, ())
+        for neighbour, _ in crossings:
+            if neighbour not in self._labels:
+                self._get_labels(neighbour)
+                return
+        _, steps, node = heapq.heappop(self._open)
+        steps -= 1
+        for neighbour, index in crossings:
+            other = self._get_labels(neighbour)[0][index]
+            if other and (neighbour, other) not in self._parents:
+                self._parents[(neighbour, other)] = node
+                heapq.heappush(self._open, (self._estimate(-steps, neighbour), steps, (neighbour, other)))
+        self.expanded += 1
+
+    def _work(self):
+        return len(self._labels) * BLOCK_AREA + self.expanded + (0 if self._field is None else self._field._work())
+
+    def _route_to(self, coords, limit):
+        # цепочка компонент до клетки coords; False - работа дошла до limit раньше
+        x, y = coords
+        node = self._node(x, y)
+        if node is None or node in self._chain:
+            return True
+        if node[0] != self._target:
+            self._set_target(node[0])
+        while node not in self._parents and self._open:
+            if len(self._labels) >= self.max_blocks:
+                self.capped = True
+                break
+            if self._work() >= limit:
+                return False
+            self._expand()
+        self._build_route((x, y))
+        return True
+
+    def _build_route(self, coords):
+        self._route = coords
+        self._chain = set()
+        self._field = None
+        node = self._node(*coords)
+        if node is None or node not in self._parents:
+            return
+        while node is not None:
+            self._chain.add(node)
+            node = self._parents[node]
+        masks = {}
+        for key, label in self._chain:
+            masks.setdefault(key, set()).add(label)
+        for key, chain_labels in masks.items():
+            masks[key] = bytes(label in chain_labels for label in self._labels[key][0])
+        level = self._navigator.level
+        area = level.get_width() * level.get_height()
+        self._field = DistanceField(self._navigator, self.sources, area, area, self._avoid_enemies, masks)
+
+    def reach(self, coords: Vec2, budget):
+        # как DistanceField.reach: сначала цепочка до компоненты coords, затем поле по ней
+        limit = self._work() + budget
+        if not self._route_to(coords, limit):
+            return False
+        if self._field is None:
+            return True
+        return self._field.reach(coords, limit - self._work())
+
+    def distance(self, coords: Vec2):
+        self.reach(coords, float('inf'))
+        if self._field is None:
+            return 0 if tuple(coords) in self.sources else self.UNREACHABLE
+        return self._field.distance(coords)
+
+    def next_step(self, coords: Vec2):
+        if self.distance(coords) <= 0:
+            return None
+        return self._field.next_step(coords)
+
+    def get_progress(self):
+        # размеченные блоки по порядку: от их числа зависит бюджет reach
+        field = None if self._field is None else self._field.get_progress()
+        return tuple(self._labels), tuple(self._targets), self.expanded, self.capped, self._route, field
+
+    def restore(self, progress):
+        keys, targets, expanded, capped, route, field = progress
+        for key in keys:
+            self._get_labels(key)
+        for i, (start, target) in enumerate(targets):
+            end = targets[i + 1][0] if i + 1 < len(targets) else expanded
+            while self.expanded < start:
+                self._expand()
+            self._set_target(target)
+            while self.expanded < end:
+                self._expand()
+        self.capped = capped
+        if route is not None:
+            self._build_route(route)
+            if field is not None:
+                self._field.restore(field)
+
+
+class WindowField:
+    # Поле расстояний до одной клетки не дальше radius шагов. Такой путь не выходит
+    # из окна (2 * radius + 1)^2 вокруг цели, поэтому поле живет в своей сетке окна
+    # и читает только его строки. Соседи клетки фронта, который ближе radius,
+    # тоже лежат в окне: смещения +-1 и +-side не выходят за его края.
+    UNREACHABLE = -1
+
+    def __init__(self, level, target: Vec2, radius):
+        tx, ty = target
+        side = 2 * radius + 1
+        self._target = target
+        self._radius = radius
+        self._side = side
+        left = tx - radius
+        top = ty - radius
+        grid = bytearray(side * side)
+        x_from = max(left, 0)
+        x_to = min(left + side, level.get_width())
+        if x_from < x_to:
+            y_from = max(top, 0)
+            start = (y_from - top) * side + x_from - left
+            for row in level.get_region(x_from, y_from, x_to - x_from, top + side - y_from):
+                grid[start:start + x_to - x_from] = bytes(row).translate(FLOOR_TABLE)
+                start += side
+        dist = array('i', [self.UNREACHABLE]) * len(grid)
+        start = radius * side + radius
+        dist[start] = 0
+        grid[start] = 0
+        frontier = [start]
+        self.sources = 1
+        self.visited = 1
+        d = 0
+        while frontier and d < radius:
+            d += 1
+            next_frontier = []
+            append = next_frontier.append
+            for index in frontier:
+                for n in (index - 1, index + 1, index - side, index + side):
+                    if grid[n]:
+                        grid[n] = 0
+                        append(n)
+            for n in next_frontier:
+                dist[n] = d
+            self.visited += len(next_frontier)
+            frontier = next_frontier
+        self._dist = dist
+
+    def distance(self, coords: Vec2):
+        x = coords[0] - self._target[0] + self._radius
+        y = coords[1] - self._target[1] + self._radius
+        if 0 <= x < self._side and 0 <= y < self._side:
+            return self._dist[y * self._side + x]
+        return self.UNREACHABLE
+
+    def next_step(self, coords: Vec2):
+        # соседняя клетка на кратчайшем пути к цели; None - уже в цели или цель дальше radius
+        d = self.distance(coords)
+        if d <= 0:
+            return None
+        x, y = coords
+        for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+            if self.distance((x + dx, y + dy)) == d - 1:
+                return coords.add_xy(dx, dy)
+        return None
+
+
+class Navigator:
+    # Поля расстояний одного уровня. Поле пересчитывается, только когда меняется
+    # то, от чего оно зависит: тайлы, враги (если их обходить) и сами цели.
+    # Непроходимость предметов не учитывается: в игре через них можно пройти.
+    EXIT = 'exit'
+    LANTERN = 'lantern'
+    # поиск неисследованной клетки еще не закончен, см. get_unexplored_field
+    SEARCHING = 'searching'
+    # позиции игрока, накопленные до разметки исследованных клеток
+    MAX_PENDING_VISITS = 4096
+    # пределы роста поля: длина пути и число клеток
+    MAX_DISTANCE = 4096
+    MAX_CELLS = 1 << 20
+    # блоков проходимости в кэше
+    MAX_BLOCKS = 1024
+    # предел поиска пути к выходу в блоках: уровень 4096 x 4096 целиком
+    MAX_ROUTE_BLOCKS = 4096
+
+    def __init__(self, level, visible_cells):
+        # visible_cells(x, y, radius) - ядро освещения игрока в (x, y) с учетом стен,
+        # его клетки считаются исследованными
+        self.level = level
+        self._visible_cells = visible_cells
+        # ключ блока -> проходимость клеток блока, 1 - пол
+        self._blocks = OrderedDict()
+        self._blocks_version = level.get_tiles_version()
+        self._fields = {}
+        # ((версия тайлов, цель, радиус), поле преследования)
+        self._chase = None
+        # ключ блока -> исследованные клетки блока, только для блоков, где игрок побывал
+        self._explored = {}
+        self._pending_visits = []
+        # (ключ проходимости, цель (x, y, расстояние)) ближайшей неисследованной клетки и поле к ней
+        self._unexplored = None
+        self._unexplored_field = None
+        # ((ключ проходимости, клетка игрока), поиск неисследованной клетки от нее)
+        self._search = None
+        # докуда были построены поля на момент снимка, см. set_state
+        self._restored = {}
+        self.field_builds = 0
+
+    def get_block(self, key):
+        # проходимость блока; читаются только строки блока, то есть один чанк уровня
+        level = self.level
+        if level.get_tiles_version() != self._blocks_version:
+            self._blocks.clear()
+            self._blocks_version = level.get_tiles_version()
+        block = self._blocks.get(key)
+        if block is not None:
+            self._blocks.move_to_end(key)
+            return block
+        bx, by = key
+        x_from = bx * BLOCK
+        y_from = by * BLOCK
+        width = level.get_width()
+        height = level.get_height()
+        if bx < 0 or by < 0 or x_from >= width or y_from >= height:
+            block = EMPTY_BLOCK
+        else:
+            rows = [bytes(row).translate(FLOOR_TABLE).ljust(BLOCK, b'\0')
+                    for row in level.get_region(x_from, y_from, BLOCK, BLOCK)]
+            block = b''.join(rows).ljust(BLOCK_AREA, b'\0')
+        self._blocks[key] = block
+        if len(self._blocks) > self.MAX_BLOCKS:
+            self._blocks.popitem(last=False)
+        return block
+
+    def get_passable(self, key, avoid_enemies):
+        # проходимость блока; враги, если их обходить, занимают свои клетки
+        block = self.get_block(key)
+        if not avoid_enemies:
+            return block
+        free = bytearray(block)
+        bx, by = key
+        half = BLOCK // 2
+        for enemy in self.level.get_enemies_near(bx * BLOCK + half, by * BLOCK + half, half):
+            x, y = enemy.get_coords()
+            if block_key(x, y) == key:
+                free[block_index(x, y)] = 0
+        return free
+
+    def _passability_key(self, avoid_enemies):
+        level = self.level
+        return level.get_tiles_version(), level.get_enemies_version() if avoid_enemies else None
+
+    def _new_field(self, sources, max_distance, avoid_enemies, route=False):
+        self.field_builds += 1
+        if route:
+            return RouteField(self, sources, self.MAX_ROUTE_BLOCKS, avoid_enemies)
+        return DistanceField(self, sources, self.MAX_DISTANCE if max_distance is None else max_distance,
+                             self.MAX_CELLS, avoid_enemies)
+
+    def get_field(self, name, targets_key, get_sources, avoid_enemies=True, max_distance=None, route=False):
+        # поле к целям name; get_sources() вызывается, только когда меняется
+        # targets_key или проходимость. route - RouteField: путь не обязательно
+        # кратчайший, зато цель найдется через весь уровень
+        key = (self._passability_key(avoid_enemies), targets_key)
+        cached = self._fields.get((name, avoid_enemies))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        field = self._new_field(get_sources(), max_distance, avoid_enemies, route)
+        restored = self._restored.pop((name, avoid_enemies), None)
+        if restored is not None and restored[0] == key:
+            field.restore(restored[1])
+        self._fields[(name, avoid_enemies)] = (key, field)
+        return field
+
+    def get_exit_field(self, avoid_enemies=True):
+        level = self.level
+        return self.get_field(self.EXIT, None, level.get_exits, avoid_enemies, route=True)
+
+    def get_lantern_field(self, avoid_enemies=True):
+        level = self.level
+        return self.get_field(self.LANTERN, level.get_lights_version(),
+                              lambda: [light.get_coords() for light in level.get_light_sources()], avoid_enemies)
+
+    def get_chase_field(self, coords: Vec2, radius):
+        # поле к игроку в coords на radius шагов, общее для всех преследующих врагов;
+        # враги друг другу путь не закрывают
+        key = (self.level.get_tiles_version(), coords, radius)
+        if self._chase is None or self._chase[0] != key:
+            self._chase = (key, WindowField(self.level, coords, radius))
+            self.field_builds += 1
+        return self._chase[1]
+
+    def visit(self, coords: Vec2, radius):
+        # игрок побывал в клетке; разметка исследованного откладывается до запроса
+        self._pending_visits.append((coords[0], coords[1], radius))
+        if len(self._pending_visits) > self.MAX_PENDING_VISITS:
+            self._mark_explored()
+
+    def is_explored(self, coords: Vec2):
+        self._mark_explored()
+        x, y = coords
+        explored = self._explored.get(block_key(x, y))
+        return explored is not None and explored[block_index(x, y)] != 0
+
+    def get_state(self):
+        # исследованные клетки, текущая цель исследования и докуда построены поля:
+        # от них зависит, когда команда перемещения сделает шаг, поэтому они
+        # сохраняются вместе с состоянием игры. Отложенные посещения сохраняются
+        # как есть: разметка читает тайлы, а на уровне из чанков это загрузка
+        # чанков, и снимок не должен менять их порядок.
+        explored = {key: zlib.compress(block) for key, block in self._explored.items()}
+        fields = {name: (key, field.get_progress()) for name, (key, field) in self._fields.items()}
+        unexplored = None
+        if self._unexplored is not None:
+            field = self._unexplored_field
+            unexplored = self._unexplored + (None if field is None else field.get_progress(),)
+        search = None if self._search is None else (self._search[0], self._search[1].get_progress())
+        return explored, list(self._pending_visits), unexplored, search, fields
+
+    def set_state(self, state):
+        explored, pending_visits, unexplored, search, fields = state
+        self._explored = {key: bytearray(zlib.decompress(block)) for key, block in explored.items()}
+        self._pending_visits = list(pending_visits)
+        # поля построятся заново при первом запросе и дорастут до сохраненного места
+        self._fields.clear()
+        self._restored = dict(fields)
+        self._unexplored = None if unexplored is None else unexplored[:2]
+        self._unexplored_field = None
+        self._restored[None] = None if unexplored is None else unexplored[2]
+        self._search = None
+        self._restored[self.SEARCHING] = search
+
+    def _mark_explored(self):
+        width = self.level.get_width()
+        height = self.level.get_height()
+        for x, y, radius in self._pending_visits:
+            self._explore(x, y)
+            for dx, dy, _ in self._visible_cells(x, y, radius).offsets:
+                cx = x + dx
+                cy = y + dy
+                if 0 <= cx < width and 0 <= cy < height:
+                    self._explore(cx, cy)
+        self._pending_visits.clear()
+
+    def _explore(self, x, y):
+        key = block_key(x, y)
+        block = self._explored.get(key)
+        if block is None:
+            block = self._explored[key] = bytearray(BLOCK_AREA)
+        block[block_index(x, y)] = 1
+
+    def get_unexplored_field(self, coords: Vec2, avoid_enemies=True, budget=None):
+        # Поле к ближайшей неисследованной клетке пола. Сначала поиск от игрока
+        # находит эту клетку, затем строится поле от нее, ограниченное расстоянием
+        # до игрока; поле живет, пока клетка не исследована.
+        # None - исследовать больше нечего, SEARCHING - поиск не уложился в budget
+        # клеток работы и продолжится при следующем вызове. Если поиск уперся в
+        # пределы поля, возвращается он сам: у него capped.
+        self._mark_explored()
+        passability_key = self._passability_key(avoid_enemies)
+        if self._unexplored is not None:
+            key, target = self._unexplored
+            if key == passability_key and not self.is_explored(target[:2]):
+                field = self._unexplored_field
+                if field is None:
+                    field = self._unexplored_field = self._new_field((target[:2],), target[2], avoid_enemies)
+                    restored = self._restored.pop(None, None)
+                    if restored is not None:
+                        field.restore(restored)
+                if field.distance(coords) > 0:
+                    return field
+        self._restored.pop(None, None)
+        self._unexplored = None
+        self._unexplored_field = None
+        target = self._find_unexplored(coords, avoid_enemies, budget)
+        if target is None or target is self.SEARCHING or isinstance(target, DistanceField):
+            return target
+        self._unexplored = (passability_key, target)
+        self._unexplored_field = self._new_field((target[:2],), target[2], avoid_enemies)
+        return self._unexplored_field
+
+    def _find_unexplored(self, coords: Vec2, avoid_enemies, budget=None):
+        # ближайшая от coords неисследованная проходимая клетка: (x, y, расстояние);
+        # поиск растет не больше чем на budget клеток за вызов, как DistanceField.reach
+        search_key = (self._passability_key(avoid_enemies), tuple(coords))
+        if self._search is None or self._search[0] != search_key:
+            search = DistanceField(self, (coords,), self.MAX_DISTANCE, self.MAX_CELLS, avoid_enemies)
+            restored = self._restored.pop(self.SEARCHING, None)
+            if restored is not None and restored[0] == search_key:
+                search.restore(restored[1])
+            self._search = (search_key, search)
+        search = self._search[1]
+        limit = None if budget is None else search._work() + budget
+        explored = self._explored
+        while True:
+            layer = search.grow(limit)
+            if layer is False:
+                return self.SEARCHING
+            if layer is None:
+                if search.capped:
+                    return search
+                self._search = None
+                return None
+            for key, cells in layer.items():
+                block = explored.get(key)
+                for index in cells:
+                    if block is None or not block[index]:
+                        self._search = None
+                        bx, by = key
+                        return bx * BLOCK + (index & BLOCK_MASK), by * BLOCK + (index >> BLOCK_BITS), search.layers
@@ -0,0 +1,101 @@
+import random
+
+from vec2 import Vec2
+
+
+class Placer:
+    def __init__(self, level, x_from=0, y_from=0, x_to=None, y_to=None, rng=random):
+        self._level = level
+        self.rng = rng
+        self._width = level.get_width()
+        if x_to is None:
+            x_to = level.get_width()
+        if y_to is None:
+            y_to = level.get_height()
+
+        # индекс свободных клеток пола: список для выборки за O(1)
+        # и позиции в нем для удаления за O(1)
+        self._cells = []
+        for y in range(max(y_from, 0), min(y_to, level.get_height())):
+            for x in range(max(x_from, 0), min(x_to, self._width)):
+                if level.is_free(x, y):
+                    self._cells.append(y * self._width + x)
+        self._positions = {index: i for i, index in enumerate(self._cells)}
+
+        # сетки для проверки минимального расстояния между объектами одной группы
+        self._spacing_grids = {}
+        self.failures = []
+
+    def free_cells_count(self):
+        return len(self._cells)
+
+    def _remove_cell(self, index):
+        i = self._positions.pop(index, None)
+        if i is None:
+            return
+        last = self._cells.pop()
+        if last != index:
+            self._cells[i] = last
+            self._positions[last] = i
+
+    def exclude_region(self, x, y, width, height):
+        for row_y in range(max(y, 0), min(y + height, self._level.get_height())):
+            for row_x in range(max(x, 0), min(x + width, self._width)):
+                self._remove_cell(row_y * self._width + row_x)
+
+    def exclude_radius(self, center: Vec2, radius):
+        cx, cy = center
+        r2 = radius * radius
+        for y in range(cy - radius, cy + radius + 1):
+            for x in range(cx - radius, cx + radius + 1):
+                if (x - cx) ** 2 + (y - cy) ** 2 < r2 and self._level.in_bounds(x, y):
+                    self._remove_cell(y * self._width + x)
+
+    def _is_spaced(self, group, x, y):
+        cell_size, buckets = self._spacing_grids[group]
+        gx = x // cell_size
+        gy = y // cell_size
+        r2 = cell_size * cell_size
+        for by in range(gy - 1, gy + 2):
+            for bx in range(gx - 1, gx + 2):
+                for px, py in buckets.get((bx, by), ()):
+                    if (px - x) ** 2 + (py - y) ** 2 < r2:
+                        return False
+        return True
+
+    def pick(self, group=None, min_spacing=0, attempts=30):
+        if min_spacing > 0 and group not in self._spacing_grids:
+            self._spacing_grids[group] = (min_spacing, {})
+        for _ in range(attempts):
+            if len(self._cells) == 0:
+                return None
+            index = self._cells[self.rng.randrange(len(self._cells))]
+            y, x = divmod(index, self._width)
+            if not self._level.is_free(x, y):
+                # клетку заняли в обход индекса
+                self._remove_cell(index)
+                continue
+            if min_spacing > 0 and not self._is_spaced(group, x, y):
+                continue
+            self._remove_cell(index)
+            if min_spacing > 0:
+                cell_size, buckets = self._spacing_grids[group]
+                buckets.setdefault((x // cell_size, y // cell_size), []).append((x, y))
+            return Vec2(x, y)
+        return None
+
+    def place_object(self, obj, group=None, min_spacing=0):
+        coords = self.pick(group, min_spacing)
+        if coords is None:
+            self.failures.append(obj)
+            return None
+        self._level.place_object(coords, obj)
+        return coords
+
+    def place_enemy(self, enemy, group=None, min_spacing=0):
+        coords = self.pick(group, min_spacing)
+        if coords is None:
+            self.failures.append(enemy)
+            return None
+        self._level.place_enemy(coords, enemy)
+        return coords
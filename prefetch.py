@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LevelPrefetcher:
+    def __init__(self, build_level):
+        # build_level(level_number, seed) должна зависеть только от аргументов,
+        # тогда заранее построенный уровень совпадает с построенным на месте
+        self._build_level = build_level
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='level-prefetch')
+        self._pending = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch(self, level_number, seed):
+        key = (level_number, seed)
+        if key not in self._pending:
+            self._pending[key] = self._executor.submit(self._build_level, level_number, seed)
+
+    def take(self, level_number, seed):
+        future = self._pending.pop((level_number, seed), None)
+        # уровни, которые уже не понадобятся, больше не строим
+        for other in self._pending.values():
+            other.cancel()
+        self._pending.clear()
+
+        # уже начатую постройку дожидаемся: построить уровень заново не быстрее,
+        # а поток продолжал бы строить его же и делить с нами GIL
+        if future is not None and not future.cancel():
+            if future.exception() is None:
+                self.hits += 1
+                return future.result(), True
+        self.misses += 1
+        return self._build_level(level_number, seed), False
+
+    def shutdown(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,94 @@
+import csv
+import json
+import time
+from array import array
+
+
+class PhaseTimer:
+    # Время одной фазы кадра: последние size замеров в кольцевом буфере.
+    # Используется как контекстный менеджер или через add(секунды).
+    def __init__(self, name, size):
+        self.name = name
+        self._samples = array('d', bytes(8 * size))
+        self.count = 0
+        self._start = 0.
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.add(time.perf_counter() - self._start)
+
+    def add(self, seconds):
+        self._samples[self.count % len(self._samples)] = seconds
+        self.count += 1
+
+    def values(self):
+        # отсортированные замеры из окна
+        return sorted(self._samples[:min(self.count, len(self._samples))])
+
+    def stats(self, budget):
+        values = self.values()
+        if not values:
+            return None
+        last = len(values) - 1
+
+        def percentile(p):
+            return values[min(last, int(len(values) * p / 100))]
+
+        return {
+            'count': self.count,
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+            'max': values[-1],
+            'over_budget': sum(1 for v in values if v > budget) / len(values),
+        }
+
+
+class Profiler:
+    # Таймеры фаз цикла Game.run, percentiles считаются по скользящему окну
+    # из window последних замеров каждой фазы
+    PHASES = ('input', 'update', 'ai', 'light', 'draw', 'ui', 'compose', 'refresh', 'frame')
+
+    def __init__(self, window=600, budget=1/60):
+        self.budget = budget
+        self.phases = {name: PhaseTimer(name, window) for name in self.PHASES}
+
+    def __getitem__(self, name):
+        return self.phases[name]
+
+    def stats(self):
+        return {name: timer.stats(self.budget) for name, timer in self.phases.items()}
+
+    def report(self):
+        # строки для оверлея, время в миллисекундах
+        lines = [f'{"phase":<8}{"p50":>7}{"p95":>7}{"p99":>7}{"max":>8}{"over":>6}']
+        for name, stats in self.stats().items():
+            if stats is None:
+                lines.append(f'{name:<8}{"-":>7}{"-":>7}{"-":>7}{"-":>8}{"-":>6}')
+                continue
+            lines.append(f'{name:<8}{stats["p50"] * 1000:7.2f}{stats["p95"] * 1000:7.2f}'
+                         f'{stats["p99"] * 1000:7.2f}{stats["max"] * 1000:8.2f}{stats["over_budget"]:6.0%}')
+        return lines
+
+    def dump(self, path):
+        # формат по расширению: .csv или json
+        rows = []
+        for name, stats in self.stats().items():
+            row = {'phase': name, 'count': 0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None,
+                   'max_ms': None, 'over_budget': None}
+            if stats is not None:
+                row['count'] = stats['count']
+                for key in ('p50', 'p95', 'p99', 'max'):
+                    row[f'{key}_ms'] = round(stats[key] * 1000, 4)
+                row['over_budget'] = round(stats['over_budget'], 4)
+            rows.append(row)
+        with open(path, 'w', newline='') as f:
+            if path.endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                json.dump({'budget_ms': self.budget * 1000, 'phases': rows}, f, indent=2)
@@ -0,0 +1,76 @@
+class Renderer:
+    # Кадровый буфер поверх поверхности вывода. Отрисовка пишет символы и цвета
+    # в буфер, а present() отправляет на поверхность только клетки, изменившиеся
+    # с прошлого кадра, объединяя соседние клетки одного цвета в одну запись.
+    def __init__(self, surface, width, height, colors):
+        self.surface = surface
+        self.width = width
+        self.height = height
+        # colors: id цвета -> атрибут поверхности, цвет 0 - атрибут по умолчанию
+        self._colors = colors
+        self._glyphs = [[' '] * width for _ in range(height)]
+        self._attrs = [[0] * width for _ in range(height)]
+        # то, что сейчас на экране; None - строку нужно отправить целиком
+        self._shown_glyphs = [None] * height
+        self._shown_attrs = [None] * height
+
+        self.cells_emitted = 0
+        self.calls_emitted = 0
+
+    def invalidate(self):
+        # содержимое окна изменилось в обход буфера, следующий кадр отправляется целиком
+        self._shown_glyphs = [None] * self.height
+        self._shown_attrs = [None] * self.height
+
+    def put(self, x, y, string, color):
+        if not 0 <= y < self.height:
+            return
+        if x < 0:
+            string = string[-x:]
+            x = 0
+        string = string[:self.width - x]
+        if not string:
+            return
+        self._glyphs[y][x:x + len(string)] = string
+        self._attrs[y][x:x + len(string)] = [color] * len(string)
+
+    def put_row(self, y, glyphs, colors):
+        self._glyphs[y][:] = glyphs
+        self._attrs[y][:] = colors
+
+    def present(self):
+        cells = 0
+        calls = 0
+        width = self.width
+        for y in range(self.height):
+            glyphs = self._glyphs[y]
+            attrs = self._attrs[y]
+            shown_glyphs = self._shown_glyphs[y]
+            shown_attrs = self._shown_attrs[y]
+            if shown_glyphs is None:
+                shown_glyphs = [None] * width
+                shown_attrs = [None] * width
+            elif glyphs == shown_glyphs and attrs == shown_attrs:
+                continue
+            x = 0
+            while x < width:
+                if glyphs[x] == shown_glyphs[x] and attrs[x] == shown_attrs[x]:
+                    x += 1
+                    continue
+                start = x
+                color = attrs[x]
+                x += 1
+                while x < width and attrs[x] == color and (glyphs[x] != shown_glyphs[x] or shown_attrs[x] != color):
+                    x += 1
+                self._emit(y, start, ''.join(glyphs[start:x]), color)
+                cells += x - start
+                calls += 1
+            self._shown_glyphs[y] = glyphs[:]
+            self._shown_attrs[y] = attrs[:]
+        self.cells_emitted = cells
+        self.calls_emitted = calls
+        if calls > 0:
+            self.surface.flush()
+
+    def _emit(self, y, x, string, color):
+        self.surface.write(y, x, string, self._colors.get(color, 0))
@@ -0,0 +1,137 @@
+import random
+import struct
+from array import array
+
+from surface import MemorySurface
+
+# Формат записи: заголовок, затем записи с тегом в первом байте.
+# S - шаг цикла: номер, клавиша (-1 - без нажатия), время шага в мкс и контрольная
+# сумма состояния после шага; K - снимок состояния после заданного числа шагов.
+MAGIC = b'CDRL'
+VERSION = 7
+HEADER = struct.Struct('<4sHQ?IHH')
+STEP = struct.Struct('<IhII')
+KEYFRAME = struct.Struct('<II')
+TAG_STEP = b'S'
+TAG_KEYFRAME = b'K'
+MAX_DELTA_US = 2**32 - 1
+KEYFRAME_INTERVAL = 3600
+
+
+class Recorder:
+    # Запись ввода живой игры. Время шага округляется до микросекунды
+    # до того, как попадет в игру, чтобы воспроизведение получило то же время.
+    def __init__(self, path, keyframe_interval=KEYFRAME_INTERVAL):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.steps = 0
+        self._file = None
+
+    def start(self, game):
+        # глобальный random засевается сидом записи: из него берутся сундуки и код врагов
+        # на уровне обучения, где у сундуков и врагов нет своих сидов
+        seed = game._next_run_seed
+        if not isinstance(seed, int) or not 0 <= seed < 2**64:
+            raise Exception("Only games with an integer seed can be recorded")
+        random.seed(seed)
+        self._file = open(self.path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, seed, game.is_first_game, game.game_record,
+                                     game.level_size.x, game.level_size.y))
+
+    @staticmethod
+    def quantize(delta_time):
+        return min(round(delta_time * 1e6), MAX_DELTA_US) / 1e6
+
+    def record(self, game, key, delta_time, failed=False):
+        # failed - шаг прервался исключением, состояние после него не определено
+        checksum = 0 if failed else game.state_checksum()
+        self._file.write(TAG_STEP + STEP.pack(self.steps, key, round(delta_time * 1e6), checksum))
+        self.steps += 1
+        if not failed and self.steps % self.keyframe_interval == 0:
+            data = game.get_keyframe()
+            self._file.write(TAG_KEYFRAME + KEYFRAME.pack(self.steps, len(data)) + data)
+            # если процесс будет убит, запись сохранится хотя бы до этого снимка
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Replay:
+    # Воспроизведение записи без терминала и без пауз между шагами
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < HEADER.size:
+            raise Exception("Not an input recording")
+        magic, version, self.seed, self.first_game, self.record, width, height = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise Exception("Not an input recording")
+        if version != VERSION:
+            raise Exception(f"Unsupported recording version {version}")
+        self.level_size = (width, height)
+        self.keys = array('h')
+        self.deltas = array('I')
+        self.checksums = array('I')
+        # число шагов -> снимок состояния после них
+        self.keyframes = {}
+        pos = HEADER.size
+        while pos < len(data):
+            tag = data[pos:pos + 1]
+            pos += 1
+            if tag == TAG_STEP:
+                step, key, delta, checksum = STEP.unpack_from(data, pos)
+                pos += STEP.size
+                if step != len(self.keys):
+                    raise Exception(f"Recording is damaged at step {len(self.keys)}")
+                self.keys.append(key)
+                self.deltas.append(delta)
+                self.checksums.append(checksum)
+            elif tag == TAG_KEYFRAME:
+                step, size = KEYFRAME.unpack_from(data, pos)
+                pos += KEYFRAME.size
+                self.keyframes[step] = data[pos:pos + size]
+                pos += size
+            else:
+                raise Exception(f"Recording is damaged at byte {pos - 1}")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def keyframe_before(self, step):
+        # ближайший снимок не позже step, 0 - начало записи
+        return max((k for k in self.keyframes if k <= step), default=0)
+
+    def run(self, game, start=0, stop=None, render=False, check=True):
+        # game - новая игра с теми же параметрами, что и записанная. Воспроизведение
+        # начинается со снимка не позже start и идет до шага stop; при check
+        # после каждого шага сверяется контрольная сумма состояния
+        if tuple(game.level_size) != self.level_size:
+            raise Exception(f"Recording was made with level size {self.level_size}")
+        game.save_path = None
+        game._next_run_seed = self.seed
+        game.start(MemorySurface(game.SCR_W, game.SCR_H))
+        game.is_first_game = self.first_game
+        game.game_record = self.record
+        random.seed(self.seed)
+
+        first = self.keyframe_before(start)
+        if first > 0:
+            game.load_keyframe(self.keyframes[first])
+        stop = len(self.keys) if stop is None else min(stop, len(self.keys))
+        keys = self.keys
+        deltas = self.deltas
+        checksums = self.checksums
+        try:
+            for i in range(first, stop):
+                game.step(keys[i], deltas[i] / 1e6)
+                if check and game.state_checksum() != checksums[i]:
+                    raise Exception(f"Replay diverged from the recording at step {i}")
+                if render:
+                    game._draw_frame()
+                    game.renderer.present()
+        finally:
+            game.level_prefetcher.shutdown()
+        return game
@@ -0,0 +1,22 @@
+import random
+
+# Иерархия сидов: сид забега -> сиды уровней -> сиды подсистем уровня.
+# Сид - строка пути, random.Random хеширует строки через sha512,
+# поэтому потоки соседних путей независимы и строятся за O(1).
+MAZE = 'maze'
+PLACEMENT = 'placement'
+LOOT = 'loot'
+ENEMY_CODE = 'enemy_code'
+NEXT_RUN = 'next_run'
+ENEMY_AI = 'enemy_ai'
+# сиды забегов турнира ботов и решения самого бота
+TOURNAMENT = 'tournament'
+AGENT = 'agent'
+
+
+def derive(seed, *path):
+    return '/'.join(str(part) for part in (seed,) + path)
+
+
+def stream(seed, *path):
+    return random.Random(derive(seed, *path))
@@ -0,0 +1,152 @@
+import curses
+import math
+
+from color import Color
+
+# имена клавиш curses по кодам, как их возвращает curses.keyname
+KEY_NAMES = {getattr(curses, name): name for name in dir(curses) if name.startswith('KEY_')}
+
+
+class Surface:
+    # Поверхность, на которую выводится кадр и с которой читаются клавиши.
+    # realtime - кадры нужно выводить не чаще FPS игры.
+    realtime = True
+
+    def init_colors(self):
+        # словарь id цвета -> атрибут поверхности
+        raise NotImplementedError
+
+    def write(self, y, x, string, attr):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def wait_key(self, timeout):
+        # код клавиши, нажатой за timeout секунд, или -1;
+        # timeout None - ждать клавишу без ограничения
+        raise NotImplementedError
+
+    def get_key(self):
+        return self.wait_key(0)
+
+    def keyname(self, key_code):
+        raise NotImplementedError
+
+
+class CursesSurface(Surface):
+    def __init__(self, stdscr: curses.window):
+        self.scr = stdscr
+        self.height, self.width = stdscr.getmaxyx()
+
+    def init_colors(self):
+        pairs = [
+            (Color.White, curses.COLOR_WHITE, curses.COLOR_BLACK),
+            (Color.Red, curses.COLOR_RED, curses.COLOR_BLACK),
+            (Color.Green, curses.COLOR_GREEN, curses.COLOR_BLACK),
+            (Color.Blue, curses.COLOR_BLUE, curses.COLOR_BLACK),
+            (Color.Yellow, curses.COLOR_YELLOW, curses.COLOR_BLACK),
+            (Color.Cyan, curses.COLOR_CYAN, curses.COLOR_BLACK),
+            (Color.Magenta, curses.COLOR_MAGENTA, curses.COLOR_BLACK),
+            (Color.Black, curses.COLOR_BLACK, curses.COLOR_BLACK),
+            (Color.BlackOnWhite, curses.COLOR_BLACK, curses.COLOR_WHITE),
+            (Color.GreenOnWhite, curses.COLOR_GREEN, curses.COLOR_WHITE),
+            (Color.BlackOnGreen, curses.COLOR_BLACK, curses.COLOR_GREEN),
+            (Color.WhiteOnWhite, curses.COLOR_WHITE, curses.COLOR_WHITE),
+            (Color.RedOnWhite, curses.COLOR_RED, curses.COLOR_WHITE),
+        ]
+        colors = {}
+        for color_id, fg, bg in pairs:
+            curses.init_pair(color_id, fg, bg)
+            colors[color_id] = curses.color_pair(color_id)
+        return colors
+
+    def write(self, y, x, string, attr):
+        try:
+            self.scr.addstr(y, x, string, attr)
+        except curses.error:
+            # запись в правый нижний угол окна выводит символ,
+            # но curses не может сдвинуть курсор и сообщает об ошибке
+            if y != self.height - 1 or x + len(string) != self.width:
+                raise
+
+    def flush(self):
+        # окно выводится одним обновлением терминала за кадр
+        self.scr.noutrefresh()
+        curses.doupdate()
+
+    def wait_key(self, timeout):
+        if timeout is None:
+            self.scr.timeout(-1)
+        else:
+            # округляем вверх, чтобы не проснуться раньше события
+            self.scr.timeout(math.ceil(timeout * 1000))
+        return self.scr.getch()
+
+    def keyname(self, key_code):
+        return curses.keyname(key_code).decode('UTF-8')
+
+
+class MemorySurface(Surface):
+    # Кадр в памяти: заранее выделенные сетки символов и атрибутов.
+    # Клавиши берутся из очереди keys без ожидания, атрибут цвета равен его id.
+    realtime = False
+
+    def __init__(self, width, height, keys=()):
+        self.width = width
+        self.height = height
+        self.glyphs = [[' '] * width for _ in range(height)]
+        self.attrs = [[0] * width for _ in range(height)]
+        self.keys = list(keys)
+        self._next_key = 0
+        self.frames = 0
+        self.writes = 0
+
+    def init_colors(self):
+        return {color_id: color_id for color_id in range(Color.White, Color.RedOnWhite + 1)}
+
+    def write(self, y, x, string, attr):
+        if not 0 <= y < self.height or not 0 <= x < self.width or x + len(string) > self.width:
+            raise Exception("Attempt of writing outside the surface")
+        self.glyphs[y][x:x + len(string)] = string
+        self.attrs[y][x:x + len(string)] = [attr] * len(string)
+        self.writes += 1
+
+    def flush(self):
+        self.frames += 1
+
+    def send_keys(self, keys):
+        self.keys.extend(keys)
+
+    def wait_key(self, timeout):
+        if self._next_key < len(self.keys):
+            self._next_key += 1
+            return self.keys[self._next_key - 1]
+        return -1
+
+    def keyname(self, key_code):
+        if key_code in KEY_NAMES:
+            return KEY_NAMES[key_code]
+        return chr(key_code)
+
+    def snapshot(self):
+        # неизменяемая копия кадра: строки символов и кортежи атрибутов
+        return (tuple(''.join(row) for row in self.glyphs),
+                tuple(tuple(row) for row in self.attrs))
+
+    def compare(self, snapshot):
+        # клетки (x, y), в которых кадр отличается от снимка
+        glyph_rows, attr_rows = snapshot
+        diff = []
+        for y in range(self.height):
+            glyphs = self.glyphs[y]
+            attrs = self.attrs[y]
+            if ''.join(glyphs) == glyph_rows[y] and tuple(attrs) == attr_rows[y]:
+                continue
+            for x in range(self.width):
+                if glyphs[x] != glyph_rows[y][x] or attrs[x] != attr_rows[y][x]:
+                    diff.append((x, y))
+        return diff
+
+    def text(self):
+        return '\n'.join(''.join(row) for row in self.glyphs)
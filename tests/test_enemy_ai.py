@@ -0,0 +1,54 @@
+import random
+
+from enemy_ai import EnemyAI
+from game import Game
+from game_object import Enemy
+from level import Tile
+from navigation import Navigator
+from placement import Placer
+from vec2 import Vec2
+
+
+def check_enemy_index(level):
+    # индекс клеток, корзины пространственного хеша и флаги занятости
+    # обязаны описывать одних и тех же врагов
+    width = level.get_width()
+    size = level.ENEMY_BUCKET
+    bucketed = {}
+    for key, bucket in level._enemy_buckets.items():
+        for index, enemy in bucket.items():
+            x, y = enemy.get_coords()
+            assert index == y * width + x and key == (x // size, y // size), f'{enemy.get_coords()} in a wrong bucket'
+            bucketed[index] = enemy
+    enemies = level.get_enemies()
+    for enemy in enemies:
+        x, y = enemy.get_coords()
+        assert level.get_enemy(enemy.get_coords()) is enemy and bucketed.get(y * width + x) is enemy
+        assert level.get_occupancy(x, y) & level.OCC_ENEMY and level.get_tile_id(x, y) == Tile.id_Floor
+    flagged = sum(1 for y in range(level.get_height()) for flags in level.get_occupancy_row(y)
+                  if flags & level.OCC_ENEMY)
+    assert len(bucketed) == len(enemies) == flagged
+
+
+def test_moves_keep_enemy_index(count=200, ticks=20, size=120):
+    level = Game.build_level(5, 'test', size, size)
+    for enemy in level.get_enemies():
+        level.remove_enemy(enemy)
+    rng = random.Random(0)
+    coords = Placer(level, 0, 0, size, size, rng).pick()
+    radius = EnemyAI.ACTIVE_RADIUS
+    placer = Placer(level, coords.x - radius, coords.y - radius, coords.x + radius + 1, coords.y + radius + 1, rng)
+    for _ in range(count):
+        placer.place_enemy(Enemy(3))
+    navigator = Navigator(level, None)
+    ai = EnemyAI(level, random.Random(0))
+    for step in range(int(ticks * EnemyAI.TICK / Game.FPS_60)):
+        if step % 8 == 0:
+            options = [coords + d for d in (Vec2.UP, Vec2.DOWN, Vec2.LEFT, Vec2.RIGHT) if level.is_free(*(coords + d))]
+            if options:
+                coords = rng.choice(options)
+        attacker = ai.update(Game.FPS_60, coords, navigator)
+        while attacker is not None:
+            attacker = ai.update(0., coords, navigator)
+    assert ai.moves > 0
+    check_enemy_index(level)
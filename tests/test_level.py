@@ -0,0 +1,53 @@
+import random
+import time
+from collections import deque
+
+import pytest
+
+from level import LevelGenerator, np
+from vec2 import Vec2
+
+
+def carve(width, height, chance, seed, use_numpy):
+    return LevelGenerator.carve_maze(width, height, Vec2(1, 1), chance, random.Random(seed), use_numpy)
+
+
+@pytest.mark.parametrize('width, height', [(100, 30), (65, 65), (64, 130), (130, 66), (301, 211)])
+def test_perfect_maze(width, height):
+    # без разрушения стен лабиринт - дерево: проходов на один меньше, чем клеток, и все связано
+    grid = carve(width, height, 0, 1, False)
+    floor = [i for i, tile in enumerate(grid) if tile == LevelGenerator.VISITED]
+    cells = ((width - 1) // 2) * ((height - 1) // 2)
+    assert len(floor) - cells == cells - 1
+    seen = {width + 1}
+    queue = deque(seen)
+    while queue:
+        index = queue.popleft()
+        for step in (1, -1, width, -width):
+            if grid[index + step] == LevelGenerator.VISITED and index + step not in seen:
+                seen.add(index + step)
+                queue.append(index + step)
+    assert len(seen) == len(floor)
+
+
+@pytest.mark.skipif(np is None, reason='numpy is not installed')
+@pytest.mark.parametrize('width, height', [(100, 30), (65, 65), (301, 211), (700, 500)])
+@pytest.mark.parametrize('chance', [0, 0.3])
+def test_numpy_matches_python(width, height, chance):
+    assert carve(width, height, chance, 3, True) == carve(width, height, chance, 3, False)
+
+
+def test_random_bytes_uniform():
+    counts = [0] * 101
+    for b in LevelGenerator.random_bytes(random.Random(0), 101 * 2000, 101):
+        counts[b] += 1
+    assert min(counts) > 1700 and max(counts) < 2300
+
+
+@pytest.mark.skipif(np is None, reason='numpy is not installed')
+@pytest.mark.parametrize('chance', [0, 0.3])
+def test_large_maze_time(chance):
+    LevelGenerator.generate_labirinth(100, 30, chance, random.Random(0))
+    start = time.perf_counter()
+    LevelGenerator.generate_labirinth(2000, 2000, chance, random.Random(0))
+    assert time.perf_counter() - start < 1.0
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+import lightmap
+from game import Game
+from game_object import LightSource
+from lightmap import create_light_map
+
+BACKENDS = [False] + ([True] if lightmap.np is not None else [])
+
+
+def reference_light_map(width, height, sources, kernel):
+    # прежний алгоритм calc_light: список списков и поклеточное сложение
+    light_map = [[0] * width for _ in range(height)]
+    for sx, sy in sources:
+        for dx, dy, strength in kernel.offsets:
+            x = sx + dx
+            y = sy + dy
+            if 0 <= x < width and 0 <= y < height:
+                light_map[y][x] = min(light_map[y][x] + strength, 4)
+    return light_map
+
+
+def random_sources(rng, width, height, count, margin=10):
+    # источники в том числе за краями карты, чтобы проверить обрезку
+    return [(rng.randrange(-margin, width + margin), rng.randrange(-margin, height + margin)) for _ in range(count)]
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS, ids=lambda use_numpy: 'numpy' if use_numpy else 'python')
+@pytest.mark.parametrize('width, height', [(100, 30), (7, 3), (300, 200)])
+@pytest.mark.parametrize('radius', [0, 1, 3, 8])
+def test_matches_reference(use_numpy, width, height, radius):
+    rng = random.Random(radius)
+    light_map = create_light_map(width, height, use_numpy)
+    kernel = LightSource.kernel_cache.get(radius, Game.SYMBOL_ASPECT)
+    for count in (1, 10, 100):
+        sources = random_sources(rng, width, height, count)
+        light_map.clear()
+        for sx, sy in sources:
+            light_map.add_kernel(kernel, sx, sy)
+        expected = reference_light_map(width, height, sources, kernel)
+        for y in range(height):
+            assert list(light_map.row(y)) == expected[y], f'lights={count} row={y}'
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS, ids=lambda use_numpy: 'numpy' if use_numpy else 'python')
+def test_remove_restores(use_numpy):
+    # вклад, снятый remove_kernel, не оставляет следа даже после насыщения
+    rng = random.Random(1)
+    width, height = 60, 20
+    light_map = create_light_map(width, height, use_numpy)
+    kernel = LightSource.kernel_cache.get(3, Game.SYMBOL_ASPECT)
+    sources = random_sources(rng, width, height, 30)
+    for sx, sy in sources:
+        light_map.add_kernel(kernel, sx, sy)
+    for sx, sy in sources[10:]:
+        light_map.remove_kernel(kernel, sx, sy)
+    expected = reference_light_map(width, height, sources[:10], kernel)
+    for y in range(height):
+        assert list(light_map.row(y)) == expected[y], f'row={y}'
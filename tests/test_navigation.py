@@ -0,0 +1,70 @@
+import pickle
+
+from game import Game
+from level import Tile
+from navigation import Navigator, RouteField
+
+
+def make_navigator(size, seed='nav'):
+    level = Game.build_level(5, seed, size, size)
+    return level, Navigator(level, None)
+
+
+def test_route_leads_to_exit():
+    level, navigator = make_navigator(500)
+    field = navigator.get_exit_field(avoid_enemies=False)
+    assert isinstance(field, RouteField)
+    coords = level.get_spawn_point()
+    distance = field.distance(coords)
+    assert distance > 0
+    moves = 0
+    while (step := field.next_step(coords)) is not None:
+        assert abs(step.x - coords.x) + abs(step.y - coords.y) == 1
+        assert level.get_tile_id(*step) != Tile.id_Wall
+        coords = step
+        moves += 1
+    assert level.get_tile_id(*coords) == Tile.id_Exit and moves == distance
+
+
+def test_route_capped():
+    # поиск, которому не хватило блоков, - capped, а не "пути нет"
+    level, navigator = make_navigator(500)
+    navigator.MAX_ROUTE_BLOCKS = 2
+    field = navigator.get_exit_field(avoid_enemies=False)
+    assert field.distance(level.get_spawn_point()) == field.UNREACHABLE and field.capped
+
+
+def test_route_restore():
+    # поле, восстановленное по снимку, дальше растет шаг в шаг с исходным
+    level, navigator = make_navigator(500)
+    start = level.get_spawn_point()
+    field = navigator.get_exit_field(avoid_enemies=False)
+    for _ in range(10):
+        field.reach(start, Game.TRAVEL_FIELD_BUDGET)
+    restored = Navigator(level, None)
+    restored.set_state(pickle.loads(pickle.dumps(navigator.get_state())))
+    copy = restored.get_exit_field(avoid_enemies=False)
+    assert copy.get_progress() == field.get_progress()
+    while True:
+        done = field.reach(start, Game.TRAVEL_FIELD_BUDGET)
+        assert copy.reach(start, Game.TRAVEL_FIELD_BUDGET) == done
+        assert copy.get_progress() == field.get_progress()
+        if done:
+            break
+    assert copy.next_step(start) == field.next_step(start)
+
+
+def test_unexplored_search_budget():
+    # поиск неисследованной клетки растет не больше чем на budget за вызов
+    level, navigator = make_navigator(200)
+    start = level.get_spawn_point()
+    for dx in range(-20, 21):
+        for dy in range(-20, 21):
+            navigator._explore(start.x + dx, start.y + dy)
+    calls = 1
+    field = navigator.get_unexplored_field(start, avoid_enemies=False, budget=64)
+    while field is Navigator.SEARCHING:
+        field = navigator.get_unexplored_field(start, avoid_enemies=False, budget=64)
+        calls += 1
+    assert calls > 1 and field.next_step(start) is not None
+    assert field is navigator.get_unexplored_field(start, avoid_enemies=False)
@@ -0,0 +1,37 @@
+import random
+
+from bots import AGENTS
+from game import Game
+from level_format import LevelPack, write_pack
+from replay import Recorder, Replay
+from surface import MemorySurface
+
+
+def test_pack_replay(tmp_path, steps=6000):
+    # запись игры бота на уровнях из набора со снимками и ее воспроизведение
+    # с начала и с последнего снимка
+    pack_path = str(tmp_path / 'pack.bin')
+    path = str(tmp_path / 'replay.bin')
+    write_pack(pack_path, [(Game.build_level(number, Game.level_seed(3, number)), number) for number in (1, 2)])
+    game = Game(seed=0, level_pack=LevelPack(pack_path))
+    game.save_path = None
+    game.start(MemorySurface(Game.SCR_W, Game.SCR_H))
+    game.is_first_game = False
+    recorder = Recorder(path, keyframe_interval=500)
+    recorder.start(game)
+    agent = AGENTS['explorer']()
+    agent.reset(random.Random(0))
+    delta = Recorder.quantize(Game.FPS_60)
+    try:
+        for i in range(steps):
+            # Enter в меню начинает игру, дальше играет бот
+            key = 10 if i == 0 else agent.next_key(game)
+            game.step(key, delta)
+            recorder.record(game, key, delta)
+    finally:
+        recorder.close()
+        game.level_prefetcher.shutdown()
+    replay = Replay(path)
+    assert replay.keyframes
+    replay.run(Game(level_pack=LevelPack(pack_path)))
+    replay.run(Game(level_pack=LevelPack(pack_path)), start=len(replay) - 1)
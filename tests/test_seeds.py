@@ -0,0 +1,27 @@
+from game import Game
+
+
+def level_fingerprint(level):
+    # тайлы, объекты и враги уровня вместе с содержимым сундуков и кодом врагов
+    tiles = b''.join(bytes(level.get_row(y)) for y in range(level.get_height()))
+    objects = sorted((tuple(obj.get_coords()), type(obj).__name__, getattr(obj, 'upgrade', None))
+                     for obj in level.get_objects())
+    enemies = sorted((tuple(enemy.get_coords()), enemy.get_difficulty(), tuple(enemy.get_code_list()))
+                     for enemy in level.get_enemies())
+    return tiles, objects, enemies
+
+
+def test_levels_match_their_seeds(run_seed=7, levels=6):
+    # уровень N, построенный сразу из (run_seed, N), совпадает с уровнем N, до которого дошли подряд
+    game = Game(seed=run_seed)
+    game.save_path = None
+    game.is_first_game = False
+    game.restart_game()
+    try:
+        for number in range(1, levels + 1):
+            if number > 1:
+                game.next_level()
+            direct = Game.build_level(number, Game.level_seed(run_seed, number))
+            assert level_fingerprint(direct) == level_fingerprint(game.current_level), f'level {number}'
+    finally:
+        game.level_prefetcher.shutdown()
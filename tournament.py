@@ -0,0 +1,207 @@
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bots import AGENTS
+from game import Game
+from main import pop_option
+from surface import MemorySurface
+import seeds
+
+# ограничения одного забега: пройденные уровни и игровое время, с
+MAX_LEVELS = 20
+MAX_TIME = 900.
+
+
+def play(agent, seed, max_levels=MAX_LEVELS, max_time=MAX_TIME):
+    # Один забег бота без терминала и без отрисовки: Game.step с шагом 1/60 с.
+    # Результат - словарь, его можно передать между процессами и сохранить в json
+    start = time.perf_counter()
+    random.seed(seed)
+    game = Game(seed=seed)
+    game.save_path = None
+    game.start(MemorySurface(game.SCR_W, game.SCR_H))
+    game.is_first_game = False
+    agent.reset(seeds.stream(seed, seeds.AGENT))
+    game.restart_game()
+
+    # здоровье при входе на каждый уровень и длительности боев в игровых секундах
+    hp = [game.player.get_hp()]
+    battles = []
+    battle_start = None
+    steps = 0
+    try:
+        while game.current_state != game.STATE_LOSE and game.clock < max_time:
+            game.step(agent.next_key(game), game.FPS_60)
+            steps += 1
+            if game.current_state == game.STATE_BATTLE:
+                if battle_start is None:
+                    battle_start = game.clock
+            elif battle_start is not None:
+                battles.append(round(game.clock - battle_start, 3))
+                battle_start = None
+            if game.current_level_number > len(hp):
+                if game.current_level_number > max_levels:
+                    break
+                hp.append(game.player.get_hp())
+    finally:
+        game.level_prefetcher.shutdown()
+    return {
+        'agent': agent.name,
+        'seed': seed,
+        'levels': game.current_level_number - 1,
+        'score': game.player.get_score(),
+        'died': game.current_state == game.STATE_LOSE,
+        'hp': [round(value, 2) for value in hp],
+        'final_hp': round(game.player.get_hp(), 2),
+        'battles': battles,
+        'clock': round(game.clock, 3),
+        'steps': steps,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _play_task(task):
+    return play(*task)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class AgentStats:
+    # Сводка по забегам одного бота, пополняется по мере прихода результатов
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.deaths = 0
+        self.levels = []
+        self.scores = []
+        self.battles = []
+        # номер уровня -> (сумма здоровья при входе, число забегов, дошедших до него)
+        self.hp_curve = {}
+        self.steps = 0
+        self.seconds = 0.
+
+    def add(self, result):
+        self.runs += 1
+        self.deaths += result['died']
+        self.levels.append(result['levels'])
+        self.scores.append(result['score'])
+        self.battles.extend(result['battles'])
+        for level, hp in enumerate(result['hp'], 1):
+            total, count = self.hp_curve.get(level, (0., 0))
+            self.hp_curve[level] = (total + hp, count + 1)
+        self.steps += result['steps']
+        self.seconds += result['seconds']
+
+    def summary(self):
+        runs = max(self.runs, 1)
+        return {
+            'agent': self.name,
+            'runs': self.runs,
+            'death_rate': self.deaths / runs,
+            'levels_mean': sum(self.levels) / runs,
+            'levels_p50': percentile(self.levels, 50),
+            'levels_max': max(self.levels, default=None),
+            'score_mean': sum(self.scores) / runs,
+            'score_max': max(self.scores, default=None),
+            'battles': len(self.battles),
+            'battle_mean': sum(self.battles) / len(self.battles) if self.battles else None,
+            'battle_p95': percentile(self.battles, 95),
+            'hp_curve': {level: round(total / count, 2) for level, (total, count) in sorted(self.hp_curve.items())},
+            'steps_per_second': self.steps / self.seconds if self.seconds > 0 else None,
+        }
+
+
+def run_tournament(agents, runs, seed=0, workers=None, max_levels=MAX_LEVELS, max_time=MAX_TIME,
+                   on_result=None):
+    # Каждый бот играет runs забегов в пуле процессов. Сид забега выводится из сида
+    # турнира, имени бота и номера забега, поэтому результат не зависит от того,
+    # какой процесс и в каком порядке его сыграл. on_result(result) вызывается
+    # для каждого забега по мере готовности.
+    names = [agent.name for agent in agents]
+    if len(set(names)) != len(names):
+        raise Exception("Agent names in a tournament must be unique")
+    tasks = [(agent, seeds.stream(seed, seeds.TOURNAMENT, agent.name, i).getrandbits(32), max_levels, max_time)
+             for agent in agents for i in range(runs)]
+    stats = {name: AgentStats(name) for name in names}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_play_task, task) for task in tasks]
+        for future in as_completed(futures):
+            result = future.result()
+            stats[result['agent']].add(result)
+            if on_result is not None:
+                on_result(result)
+    return stats, time.perf_counter() - start
+
+
+def report(stats, elapsed):
+    lines = [f'{"agent":<10}{"runs":>6}{"died":>6}{"levels":>8}{"max":>5}{"score":>9}'
+             f'{"battles":>9}{"avg s":>7}{"p95 s":>7}']
+    busy = 0.
+    steps = 0
+    for agent_stats in stats.values():
+        s = agent_stats.summary()
+        battle_mean = '-' if s['battle_mean'] is None else f'{s["battle_mean"]:.1f}'
+        battle_p95 = '-' if s['battle_p95'] is None else f'{s["battle_p95"]:.1f}'
+        lines.append(f'{s["agent"]:<10}{s["runs"]:>6}{s["death_rate"]:>6.0%}{s["levels_mean"]:>8.2f}'
+                     f'{s["levels_max"]:>5}{s["score_mean"]:>9.0f}{s["battles"]:>9}{battle_mean:>7}{battle_p95:>7}')
+        curve = ' '.join(f'{level}:{hp:.0f}' for level, hp in list(s['hp_curve'].items())[:MAX_LEVELS])
+        lines.append(f'{"":<10}hp by level {curve}')
+        busy += agent_stats.seconds
+        steps += agent_stats.steps
+    runs = sum(agent_stats.runs for agent_stats in stats.values())
+    # busy / elapsed - сколько процессов в среднем были заняты забегами
+    lines.append(f'{runs} runs in {elapsed:.1f}s: {runs / elapsed:.2f} runs/s, {steps / elapsed:.0f} steps/s, '
+                 f'parallelism {busy / elapsed:.2f}')
+    return lines
+
+
+def main():
+    # python tournament.py [--runs 100] [--workers N] [--seed 0] [--agents explorer,typist,speed]
+    #                      [--error-rate 0.05] [--levels 20] [--time 900] [--json файл]
+    args = sys.argv[1:]
+    runs = int(pop_option(args, '--runs') or 100)
+    workers = pop_option(args, '--workers')
+    seed = int(pop_option(args, '--seed') or 0)
+    names = (pop_option(args, '--agents') or ','.join(AGENTS)).split(',')
+    error_rate = pop_option(args, '--error-rate')
+    max_levels = int(pop_option(args, '--levels') or MAX_LEVELS)
+    max_time = float(pop_option(args, '--time') or MAX_TIME)
+    json_path = pop_option(args, '--json')
+    agents = []
+    for name in names:
+        if name not in AGENTS:
+            raise Exception(f"Unknown agent {name}, expected one of {', '.join(AGENTS)}")
+        # доля ошибок с командной строки задается печатающему боту
+        if name == 'typist' and error_rate is not None:
+            agents.append(AGENTS[name](error_rate=float(error_rate)))
+        else:
+            agents.append(AGENTS[name]())
+    total = runs * len(agents)
+    done = 0
+
+    def progress(result):
+        nonlocal done
+        done += 1
+        print(f'\r{done}/{total} runs', end='', flush=True)
+
+    stats, elapsed = run_tournament(agents, runs, seed, None if workers is None else int(workers),
+                                    max_levels, max_time, progress)
+    print()
+    print('\n'.join(report(stats, elapsed)))
+    if json_path is not None:
+        with open(json_path, 'w') as f:
+            json.dump({'seed': seed, 'runs': runs, 'max_levels': max_levels, 'max_time': max_time,
+                       'elapsed': elapsed, 'agents': [s.summary() for s in stats.values()]}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,10 @@ class Message:
     PickUpgradeTimeLimit = 4
     PickHeal = 5
     LoseTitle = 6
+    NoPath = 7
+    LevelExplored = 8
+    EnemyNear = 9
+    TooFar = 10
 
     default_msg = '<Текст сообщения не найден>'
     msgs = {
@@ -15,7 +19,11 @@ class Message:
         PickUpgradeLightAmount: ['Невозможно применить улучшение Количество фонарей: достигнут предел', 'Улучшение: Количество фонарей'],
         PickUpgradeTimeLimit: ['Невозможно применить улучшение Время обнаружения: достигнут предел', 'Улучшение: Время обнаружения'],
         PickHeal: 'Восстановлено 10% HP',
-        LoseTitle: 'Вирус обезврежен'
+        LoseTitle: 'Вирус обезврежен',
+        NoPath: 'Путь не найден',
+        LevelExplored: 'Уровень исследован',
+        EnemyNear: 'Рядом защитная система',
+        TooFar: 'Цель слишком далеко',
     }
 
     @classmethod
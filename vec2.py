@@ -1,61 +1,90 @@
-class Vec2:
-    def __init__(self, x=0, y=0):
-        self._x = 0
-        self._y = 0
-        self.x = x
-        self.y = y
+_new = tuple.__new__
+
+
+class Vec2(tuple):
+    # Vec2 неизменяемый: это кортеж (x, y), поэтому хеш и сравнение
+    # точные и быстрые, а экземпляры можно безопасно переиспользовать
+    __slots__ = ()
+
+    def __new__(cls, x=0, y=0):
+        return _new(cls, (x, y))
 
     @property
     def x(self):
-        return self._x
-
-    @x.setter
-    def x(self, value):
-        if not isinstance(value, int):
-            raise ValueError('X should be integer')
-        self._x = value
+        return self[0]
 
     @property
     def y(self):
-        return self._y
-
-    @y.setter
-    def y(self, value):
-        if not isinstance(value, int):
-            raise ValueError('Y should be integer')
-        self._y = value
+        return self[1]
 
     @classmethod
     def from_vec(cls, other):
         if not isinstance(other, Vec2):
             raise ValueError(f'Can not transform {type(other)} to Vec2')
-        return Vec2(other.x, other.y)
+        return other
+
+    @classmethod
+    def offset(cls, x, y):
+        # небольшие смещения берутся из кеша и не создаются заново
+        if -OFFSET_CACHE_RADIUS <= x <= OFFSET_CACHE_RADIUS and -OFFSET_CACHE_RADIUS <= y <= OFFSET_CACHE_RADIUS:
+            return _offsets[(y + OFFSET_CACHE_RADIUS) * OFFSET_CACHE_SIZE + x + OFFSET_CACHE_RADIUS]
+        return _new(cls, (x, y))
+
+    def add_xy(self, x, y):
+        return _new(Vec2, (self[0] + x, self[1] + y))
+
+    def pack(self, width):
+        return self[1] * width + self[0]
+
+    @staticmethod
+    def pack_xy(x, y, width):
+        return y * width + x
+
+    @classmethod
+    def unpack(cls, index, width):
+        y, x = divmod(index, width)
+        return _new(cls, (x, y))
 
     def __add__(self, other):
         if isinstance(other, int):
-            other = Vec2(other, other)
-        return Vec2(self._x + other.x, self._y + other.y)
+            return _new(Vec2, (self[0] + other, self[1] + other))
+        return _new(Vec2, (self[0] + other[0], self[1] + other[1]))
 
     def __sub__(self, other):
         if isinstance(other, int):
-            other = Vec2(other, other)
-        return Vec2(self._x - other.x, self._y - other.y)
+            return _new(Vec2, (self[0] - other, self[1] - other))
+        return _new(Vec2, (self[0] - other[0], self[1] - other[1]))
 
-    def __str__(self):
-        return f'({self._x}, {self._y})'
+    def __mul__(self, other):
+        return _new(Vec2, (self[0] * other, self[1] * other))
 
     def __floordiv__(self, other):
         if isinstance(other, int):
-            other = Vec2(other, other)
-        return Vec2(self._x // other.x, self._y // other.y)
+            return _new(Vec2, (self[0] // other, self[1] // other))
+        return _new(Vec2, (self[0] // other[0], self[1] // other[1]))
 
     def __truediv__(self, other):
-        if isinstance(other, int):
-            other = Vec2(other, other)
         return self // other
 
-    def __hash__(self):
-        return hash((self._x, self._y))
+    def __str__(self):
+        return f'({self[0]}, {self[1]})'
+
+    def __repr__(self):
+        return f'Vec2({self[0]}, {self[1]})'
+
+    def __getnewargs__(self):
+        # pickle создает Vec2 через __new__(cls, x, y), а не из кортежа
+        return self[0], self[1]
+
+
+OFFSET_CACHE_RADIUS = 32
+OFFSET_CACHE_SIZE = 2 * OFFSET_CACHE_RADIUS + 1
+_offsets = tuple(_new(Vec2, (x, y))
+                 for y in range(-OFFSET_CACHE_RADIUS, OFFSET_CACHE_RADIUS + 1)
+                 for x in range(-OFFSET_CACHE_RADIUS, OFFSET_CACHE_RADIUS + 1))
 
-    def __eq__(self, other):
-        return hash(self) == hash(other)
+Vec2.ZERO = Vec2.offset(0, 0)
+Vec2.UP = Vec2.offset(0, -1)
+Vec2.DOWN = Vec2.offset(0, 1)
+Vec2.LEFT = Vec2.offset(-1, 0)
+Vec2.RIGHT = Vec2.offset(1, 0)
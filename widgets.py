@@ -0,0 +1,77 @@
+from color import Color
+
+_UNSET = object()
+
+
+class Widget:
+    # Часть экрана, заранее отрисованная в строки. Строки пересчитываются,
+    # только когда меняется значение get_value(); render(value) возвращает
+    # список фрагментов (x, y, строка, цвет).
+    def __init__(self, get_value, render):
+        self._get_value = get_value
+        self._render = render
+        self._value = _UNSET
+        self.spans = []
+
+    def invalidate(self):
+        self._value = _UNSET
+
+    def update(self):
+        value = self._get_value()
+        if value == self._value:
+            return False
+        self._value = value
+        self.spans = self._render(value)
+        return True
+
+
+class Label(Widget):
+    def __init__(self, x, y, get_value, text=str, color=Color.White):
+        super().__init__(get_value, lambda value: [(x, y, text(value), color)])
+
+
+class Frame(Widget):
+    # рамка width x height, в строках separators - горизонтальные разделители
+    def __init__(self, x, y, width, height, color=Color.White, separators=()):
+        inner = width - 2
+        rows = ['╔' + '═' * inner + '╗']
+        for row_y in range(1, height - 1):
+            if row_y in separators:
+                rows.append('╠' + '═' * inner + '╣')
+            else:
+                rows.append('║' + ' ' * inner + '║')
+        rows.append('╚' + '═' * inner + '╝')
+        spans = [(x, y + i, row, color) for i, row in enumerate(rows)]
+        super().__init__(lambda: None, lambda value: spans)
+
+
+class WidgetGroup:
+    # Группа виджетов, которой принадлежит слой целиком. Слой переписывается,
+    # только если хоть один виджет изменился; виджеты рисуются по порядку,
+    # поэтому следующие перекрывают предыдущие.
+    def __init__(self, layer, widgets, x=0, y=0):
+        self.layer = layer
+        self.widgets = widgets
+        self.x = x
+        self.y = y
+        self._invalid = True
+        self.renders = 0
+
+    def invalidate(self):
+        self._invalid = True
+        for widget in self.widgets:
+            widget.invalidate()
+
+    def draw(self):
+        changed = self._invalid
+        for widget in self.widgets:
+            if widget.update():
+                changed = True
+        if not changed:
+            return
+        self._invalid = False
+        self.renders += 1
+        self.layer.clear()
+        for widget in self.widgets:
+            for x, y, string, color in widget.spans:
+                self.layer.put(self.x + x, self.y + y, string, color)